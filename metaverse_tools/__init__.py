@@ -36,7 +36,7 @@ import logging
 import bpy
 
 from bpy.types import Operator, AddonPreferences
-from bpy.props import StringProperty, IntProperty, BoolProperty
+from bpy.props import StringProperty, IntProperty, BoolProperty, EnumProperty
 
 from metaverse_tools.ext.apply_modifier_for_object_with_shapekeys.ApplyModifierForObjectWithShapeKeys import ApplyModifierForObjectWithShapeKeysOperator
 
@@ -52,6 +52,7 @@ from .files.facerig import EXPORT_OT_MVT_TOOLSET_Writer_Facerig_Bundle_DAE
 from .ext.modified_fbx_tools import EXPORT_OT_MVT_TOOLSET_FBX
 
 from .utils.bpyutil import operator_exists
+from .utils.logger import LOG_LEVELS, DEFAULT_LEVEL, set_log_level
 from .files.hifi_json.operator import *
 from .files.fst.operator import *
 
@@ -64,6 +65,10 @@ def on_color_space_automation_update(self, context):
     addon_prefs["automatic_color_space_fix"] = self.colorspaces_on_save
 
 
+def on_log_level_update(self, context):
+    set_log_level(self.log_level)
+
+
 class MVTAddOnPreferences(AddonPreferences):
     bl_idname = __name__
 
@@ -72,12 +77,25 @@ class MVTAddOnPreferences(AddonPreferences):
                                                     default=True,
                                                     update=on_color_space_automation_update)
 
+    log_level: EnumProperty(name="Log Level",
+                            description="How much the exporters and importers log to the console",
+                            items=LOG_LEVELS,
+                            default=DEFAULT_LEVEL,
+                            update=on_log_level_update)
+
+    oventool: StringProperty(name="Oven Tool Path",
+                             description="Path to the oven executable, used to bake exported avatars",
+                             default="",
+                             subtype='FILE_PATH')
+
     message_box: StringProperty(
         name="Status", default="", options={"SKIP_SAVE"})
 
     def draw(self, context):
         layout = self.layout
         layout.prop(self, "colorspaces_on_save")
+        layout.prop(self, "log_level")
+        layout.prop(self, "oventool")
 
 
 if "add_mesh_extra_objects" not in addon_utils.addons_fake_modules:
@@ -100,8 +118,8 @@ def menu_func_export(self, context):
     self.layout.operator(EXPORT_OT_MVT_TOOLSET_FBX.bl_idname, text="Vircadia FBX (.fbx)")
     self.layout.operator(EXPORT_OT_MVT_TOOLSET_Hifi_FST_Writer_Operator.bl_idname,
                          text="Vircadia Avatar FST (.fst)")
-   # self.layout.operator(EXPORT_OT_MVT_TOOLSET_Writer_GLTF_JSON.bl_idname,
-   #                      text="HiFi Metaverse Scene JSON / GLTF (.json/.glb/.glm)")
+    self.layout.operator(EXPORT_OT_MVT_TOOLSET_Writer_GLTF_JSON.bl_idname,
+                         text="Vircadia Metaverse Scene JSON / GLB (.json/.glb)")
     self.layout.operator(EXPORT_OT_MVT_TOOLSET_Writer_FBX_JSON.bl_idname,
                          text="Vircadia Metaverse Scene JSON / FBX (.json/.fbx)")
     self.layout.operator(EXPORT_OT_MVT_TOOLSET_Writer_Facerig_Bundle_DAE.bl_idname,
@@ -126,6 +144,11 @@ bpy.app.handlers.save_pre.append(utils.helpers.materials.correct_all_color_space
 
 def register():
     main_register()
+
+    try:
+        set_log_level(bpy.context.preferences.addons[__name__].preferences.log_level)
+    except (AttributeError, KeyError):
+        set_log_level()
     bones_binder_register()
     bones_scene_define()
 
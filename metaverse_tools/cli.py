@@ -0,0 +1,246 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Headless batch exporter. Opens each .blend file and exports it with the given targets, without any UI context.
+#
+#   blender --background --python-expr "import metaverse_tools.cli as cli; cli.main()" -- \
+#       scene_a.blend scene_b.blend --target hifi-json --target fst --output ./exports --url https://example.com/assets/
+#
+# or by pointing --python directly to this file. Everything after "--" is passed to the exporter.
+# Exits with 0 if all exports succeeded, 1 if any failed and 2 on bad arguments.
+
+import os
+import sys
+import time
+import argparse
+import traceback
+
+import bpy
+import addon_utils
+
+TARGETS = ('hifi-json', 'fst', 'facerig')
+
+EXIT_OK = 0
+EXIT_FAILED = 1
+
+
+# Stands in for the export operators, which the writers otherwise take their settings from.
+class ExportOptions:
+    def __init__(self, filepath, **kwargs):
+        self.filepath = filepath
+        self.__dict__.update(kwargs)
+
+    def report(self, type, message):
+        print(" ".join(type), message)
+
+
+def hifi_json_options(filepath, args):
+    return ExportOptions(filepath,
+                         atp=args.atp,
+                         use_folder=args.use_folder,
+                         url_override=args.url,
+                         remove_trailing=args.remove_trailing,
+                         use_cache=not args.no_cache,
+                         incremental=args.incremental,
+                         compact_json=args.compact,
+                         gzip_json=args.gzip,
+                         use_data_api=True,
+                         parallel_write=args.threads != 1,
+                         write_threads=args.threads,
+                         batch_static=args.batch,
+                         batch_cell_size=args.batch_cell_size,
+                         batch_triangle_budget=args.batch_triangles,
+                         generate_lods=args.lods > 0,
+                         lod_levels=max(args.lods, 2),
+                         lod_reduction=args.lod_reduction,
+                         write_profile=args.profile)
+
+
+def fst_options(filepath, name, args):
+    return ExportOptions(filepath,
+                         name=name,
+                         scale=1,
+                         embed=args.embed,
+                         script=args.script,
+                         flow=False,
+                         bake=args.bake,
+                         selected_only=False,
+                         write_profile=args.profile)
+
+
+def export_hifi_json(name, output, args):
+    from metaverse_tools.files.hifi_json.writer import write_file
+
+    if not args.atp and not args.url:
+        raise ValueError("hifi-json requires either --atp or --url")
+
+    write_file(hifi_json_options(os.path.join(output, name + ".hifi.json"), args), args.glb)
+    return {'FINISHED'}
+
+
+def export_fst(name, output, args):
+    from metaverse_tools.files.fst.writer import fst_export
+
+    objects = list(bpy.context.view_layer.objects)
+    return fst_export(fst_options(os.path.join(output, name + ".fst"), name, args), objects)
+
+
+def export_facerig(name, output, args):
+    from metaverse_tools.files.facerig.writer import facerig_export
+
+    objects = list(bpy.context.view_layer.objects)
+    return facerig_export(os.path.join(output, name + ".dae"), objects)
+
+
+EXPORTERS = {
+    'hifi-json': export_hifi_json,
+    'fst': export_fst,
+    'facerig': export_facerig,
+}
+
+
+def parse_arguments(argv):
+    parser = argparse.ArgumentParser(prog="metaverse_tools.cli",
+                                     description="Batch export .blend files with the Metaverse Toolkit")
+    parser.add_argument("files", nargs="+", help=".blend files to export")
+    parser.add_argument("--target", action="append", choices=TARGETS, dest="targets",
+                        help="Export target, can be given multiple times. Defaults to hifi-json")
+    parser.add_argument("--output", default=None,
+                        help="Output folder. Defaults to the folder of each .blend file")
+
+    scene = parser.add_argument_group("hifi-json")
+    scene.add_argument("--url", default="", help="Marketplace / Base Url the models are uploaded to")
+    scene.add_argument("--atp", action="store_true", help="Use ATP instead of a base url")
+    scene.add_argument("--use-folder", action="store_true", help="With ATP, upload files as a folder")
+    scene.add_argument("--remove-trailing", action="store_true", help="Remove trailing .### from names")
+    scene.add_argument("--no-cache", action="store_true", help="Always write every model")
+    scene.add_argument("--incremental", action="store_true", help="Only export objects changed since the last export")
+    scene.add_argument("--compact", action="store_true", help="Write compact json")
+    scene.add_argument("--gzip", action="store_true", help="Write gzipped json")
+    scene.add_argument("--threads", type=int, default=1, help="Model writer threads, 0 for all cores")
+    scene.add_argument("--glb", action="store_true", help="Write models as binary glTF instead of FBX")
+    scene.add_argument("--batch", action="store_true", help="Merge static meshes into spatially clustered batches")
+    scene.add_argument("--batch-cell-size", type=float, default=16.0, help="Grid cell size for --batch")
+    scene.add_argument("--batch-triangles", type=int, default=65536, help="Triangle budget of a single batch")
+    scene.add_argument("--lods", type=int, default=0, choices=(0, 2, 3, 4), help="Decimated variants per model, 0 for none")
+    scene.add_argument("--lod-reduction", type=float, default=0.5, help="Ratio of triangles kept at each LOD level")
+
+    avatar = parser.add_argument_group("fst")
+    avatar.add_argument("--embed", action="store_true", help="Embed textures into the avatar fbx")
+    avatar.add_argument("--script", default="", help="Avatar script url")
+    avatar.add_argument("--bake", action="store_true", help="Bake the avatar with the oven tool set in the add-on preferences")
+
+    parser.add_argument("--profile", action="store_true", help="Write an export profile next to each export")
+
+    args = parser.parse_args(argv)
+    if not args.targets:
+        args.targets = ['hifi-json']
+    return args
+
+
+def script_arguments():
+    if "--" in sys.argv:
+        return sys.argv[sys.argv.index("--") + 1:]
+    return []
+
+
+def ensure_addon_enabled():
+    loaded_default, loaded_state = addon_utils.check("metaverse_tools")
+    if not loaded_state:
+        addon_utils.enable("metaverse_tools", default_set=True)
+
+
+def export_blend(blend_file, args):
+    results = []
+
+    bpy.ops.wm.open_mainfile(filepath=blend_file)
+    ensure_addon_enabled()
+
+    name = bpy.path.display_name_from_filepath(blend_file)
+    output = args.output or os.path.dirname(os.path.realpath(blend_file))
+    if not os.path.isdir(output):
+        os.makedirs(output)
+
+    for target in args.targets:
+        start = time.perf_counter()
+        try:
+            result = EXPORTERS[target](name, output, args)
+            succeeded = result == {'FINISHED'}
+            message = "" if succeeded else str(result)
+        except Exception as e:
+            traceback.print_exc()
+            succeeded = False
+            message = str(e)
+
+        results.append((blend_file, target, succeeded, time.perf_counter() - start, message))
+
+    return results
+
+
+def print_summary(results):
+    print("")
+    print("Metaverse Toolkit batch export summary")
+    for blend_file, target, succeeded, seconds, message in results:
+        status = "OK    " if succeeded else "FAILED"
+        print("  %s %-10s %8.2fs  %s %s" % (status, target, seconds, blend_file, message))
+
+    failed = len([result for result in results if not result[2]])
+    print("%d exports, %d failed" % (len(results), failed))
+
+
+def main(argv=None):
+    if argv is None:
+        argv = script_arguments()
+
+    try:
+        args = parse_arguments(argv)
+    except SystemExit as e:
+        return finish(e.code if e.code is not None else EXIT_OK)
+
+    results = []
+    for blend_file in args.files:
+        if not os.path.isfile(blend_file):
+            results.append((blend_file, "-", False, 0.0, "File not found"))
+            continue
+
+        try:
+            results.extend(export_blend(blend_file, args))
+        except Exception as e:
+            traceback.print_exc()
+            results.append((blend_file, "-", False, 0.0, str(e)))
+
+    print_summary(results)
+
+    if any(not result[2] for result in results):
+        return finish(EXIT_FAILED)
+
+    return finish(EXIT_OK)
+
+
+def finish(exit_code):
+    # Blender keeps running after the script in some setups, so exit explicitly with the result.
+    if bpy.app.background:
+        sys.exit(exit_code)
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    main()
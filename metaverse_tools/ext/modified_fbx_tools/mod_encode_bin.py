@@ -0,0 +1,115 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# <pep8 compliant>
+
+# Overides parts of io_scene_fbx.encode_bin
+# Original copyright (C) Campbell Barton, Bastien Montagne
+
+# Deferred array compression by Matti 'Menithal' Lahtinen
+# encode_bin compresses every array with zlib as soon as it is added to the element tree, which happens while the tree
+# is built from Blender data on the main thread. In trees rooted at a DeferredFBXElem, large arrays are only copied into
+# the tree, and are compressed by whoever writes the tree with write(), so that an encoder on another thread also does
+# the compression. Only those trees are affected, encode_bin itself is left as is for every other export.
+
+import sys
+import array
+import zlib
+
+from struct import pack
+
+from io_scene_fbx import encode_bin
+
+_IS_BIG_ENDIAN = (sys.byteorder != 'little')
+
+# Arrays of up to this many bytes are not compressed by encode_bin
+COMPRESSION_MINIMUM = 128
+
+
+class DeferredArray:
+    __slots__ = ("data", "length")
+
+    def __init__(self, data, length):
+        self.data = data
+        self.length = length
+
+    def encode(self):
+        data = zlib.compress(self.data, 1)
+        return pack('<3I', self.length, 1, len(data)) + data
+
+
+# Children list of a DeferredFBXElem. encode_bin.FBXElem(name) elements appended to it, as fbx_utils.elem_empty does
+# before adding any data to them, become DeferredFBXElems themselves.
+class DeferredElems(list):
+    __slots__ = ()
+
+    def append(self, elem):
+        if not isinstance(elem, DeferredFBXElem):
+            elem.__class__ = DeferredFBXElem
+            elem.elems = DeferredElems(elem.elems)
+        list.append(self, elem)
+
+
+class DeferredFBXElem(encode_bin.FBXElem):
+    __slots__ = ()
+
+    def __init__(self, id):
+        super().__init__(id)
+        self.elems = DeferredElems()
+
+    # Matches encode_bin.FBXElem._add_array_helper of Blender 2.90, except for the compression
+    def _add_array_helper(self, data, array_type, prop_type):
+        assert(isinstance(data, array.array))
+        assert(data.typecode == array_type)
+
+        length = len(data)
+
+        if _IS_BIG_ENDIAN:
+            data = data[:]
+            data.byteswap()
+        data = data.tobytes()
+
+        if len(data) <= COMPRESSION_MINIMUM:
+            data = pack('<3I', length, 0, len(data)) + data
+        else:
+            data = DeferredArray(data, length)
+
+        self.props_type.append(prop_type)
+        self.props.append(data)
+
+
+# Root element of a tree whose arrays are compressed by write()
+def elem_root_deferred():
+    return DeferredFBXElem(b"")
+
+
+# Compresses the deferred arrays of the tree in place
+def compress_deferred(root):
+    pending = [root]
+    while len(pending) > 0:
+        elem = pending.pop()
+        for index, prop in enumerate(elem.props):
+            if isinstance(prop, DeferredArray):
+                elem.props[index] = prop.encode()
+        pending.extend(elem.elems)
+
+
+# Matches encode_bin.write, for trees built with deferred compression
+def write(filepath, root, version):
+    compress_deferred(root)
+    encode_bin.write(filepath, root, version)
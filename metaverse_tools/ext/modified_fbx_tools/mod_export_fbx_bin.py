@@ -24,6 +24,7 @@
 # HifiShaderWrapper / Stingray Modifications by Matti 'Anthony' Lahtinen
 
 import array
+import logging
 import math
 import os
 import time
@@ -115,6 +116,29 @@ from io_scene_fbx.export_fbx_bin import (
     )
 
 from metaverse_tools.utils.helpers.materials import HifiShaderWrapper
+from metaverse_tools.ext.modified_fbx_tools import mod_encode_bin
+from metaverse_tools.utils.logger import get_logger
+
+log = get_logger(__name__)
+
+
+# PerfMon of io_scene_fbx prints the time of each step of every model written, so it only runs when debugging
+class QuietPerfMon:
+    def level_up(self, message=""):
+        pass
+
+    def level_down(self, message=""):
+        pass
+
+    def step(self, message=""):
+        pass
+
+
+def perf_mon():
+    if log.isEnabledFor(logging.DEBUG):
+        return PerfMon()
+    return QuietPerfMon()
+
 # Save fbx_objects_elements, save_single, save
 
 
@@ -185,15 +209,13 @@ def fbx_metav_toolset_data_material_elements(root, ma, scene_data):
     elem_props_template_set(tmpl, props, "p_number", b"SpecularFactor", 0.0)
     # elem_props_template_set(tmpl, props, "p_number", b"SpecularFactor", ma_wrap.specular / 2.0)
 
-    print(ma_wrap)
-
     if ma_wrap.base_color_texture is not None and ma_wrap.base_color_texture.node_image is not None:
-        print("Color Texture")
+        log.debug("Material %s has a color texture", ma.name)
         elem_props_template_set(tmpl, props, "p_color", b"DiffuseColor", (1.0, 1.0, 1.0))
         elem_props_template_set(tmpl, props, "p_color", b"Maya|base_color", (1.0, 1.0, 1.0))
         elem_props_template_set(tmpl, props, "p_bool", b"Maya|use_color_map", True)
     else: 
-        print("No Color Texture")
+        log.debug("Material %s has no color texture", ma.name)
         elem_props_template_set(tmpl, props, "p_color", b"DiffuseColor", ma_wrap.base_color)
         elem_props_template_set(tmpl, props, "p_color", b"Maya|base_color", ma_wrap.base_color)
 
@@ -333,7 +355,7 @@ def fbx_data_from_scene(scene, depsgraph, settings):
     """
     objtypes = settings.object_types
     dp_objtypes = objtypes - {'ARMATURE'}  # Armatures are not supported as dupli instances currently...
-    perfmon = PerfMon()
+    perfmon = perf_mon()
     perfmon.level_up()
 
     # ##### Gathering data...
@@ -417,7 +439,7 @@ def fbx_data_from_scene(scene, depsgraph, settings):
                 data_meshes[ob_obj] = (get_blenderID_key(tmp_me), tmp_me, True)
             # Change armatures back.
             for armature, pose_position in backup_pose_positions:
-                print((armature, pose_position))
+                log.debug("Restoring pose position %s of %s", pose_position, armature.name)
                 armature.pose_position = pose_position
                 # Update now, so we don't leave modified state after last object was exported.
                 depsgraph.update()
@@ -531,10 +553,10 @@ def fbx_data_from_scene(scene, depsgraph, settings):
         # Note: with nodal shaders, we'll could be generating much more textures, but that's kind of unavoidable,
         #       given that textures actually do not exist anymore in material context in Blender...
         ma_wrap = HifiShaderWrapper(ma, is_readonly=True)
-        print("Material", ma, ma.name)
+        log.debug("Wrapping textures of material %s", ma.name)
         for sock_name, fbx_name in HIFI_SPECIFIC_SOCKETS_FBX:
             tex = getattr(ma_wrap, sock_name)
-            print("Texture:", tex, sock_name)
+            log.debug("Texture %s: %s", sock_name, tex)
             if tex is None or tex.image is None:
                 continue
 
@@ -786,7 +808,7 @@ def fbx_objects_elements(root, scene_data):
     """
     Data (objects, geometry, material, textures, armatures, etc.).
     """
-    perfmon = PerfMon()
+    perfmon = perf_mon()
     perfmon.level_up()
     objects = elem_empty(root, b"Objects")
 
@@ -837,9 +859,8 @@ def fbx_objects_elements(root, scene_data):
     for ma in scene_data.data_materials:
         fbx_data_material_elements(objects, ma, scene_data)
 
-    print("Getting Tex Keys")
     for blender_tex_key in scene_data.data_textures:
-        print(blender_tex_key)
+        log.debug("Writing texture %s", blender_tex_key)
         fbx_data_texture_file_elements(objects, blender_tex_key, scene_data)
 
     for vid in scene_data.data_videos:
@@ -890,6 +911,7 @@ def save_single(operator, scene, depsgraph, filepath="",
                 use_custom_props=False,
                 bake_space_transform=False,
                 armature_nodetype='NULL',
+                encoder=None,
                 **kwargs
                 ):
 
@@ -962,13 +984,18 @@ def save_single(operator, scene, depsgraph, filepath="",
 
     import bpy_extras.io_utils
 
-    print('\nFBX export starting... %r' % filepath)
+    log.debug("FBX export starting %s", filepath)
     start_time = time.process_time()
 
     # Generate some data about exported scene...
     scene_data = fbx_data_from_scene(scene, depsgraph, settings)
 
-    root = elem_empty(None, b"")  # Root element has no id, as it is not saved per se!
+    # Root element has no id, as it is not saved per se!
+    # Trees handed to an encoder have their arrays compressed by it, see mod_encode_bin.
+    if encoder is not None:
+        root = mod_encode_bin.elem_root_deferred()
+    else:
+        root = elem_empty(None, b"")
 
     # Mostly FBXHeaderExtension and GlobalSettings.
     fbx_header_elements(root, scene_data)
@@ -993,7 +1020,12 @@ def save_single(operator, scene, depsgraph, filepath="",
     fbx_scene_data_cleanup(scene_data)
 
     # And we are down, we can write the whole thing!
-    encode_bin.write(filepath, root, FBX_VERSION)
+    # The element tree no longer refers to blender data, so the encoding may be handed off elsewhere.
+    # Encoders have to write it with mod_encode_bin.write, which compresses its deferred arrays.
+    if encoder is not None:
+        encoder(filepath, root, FBX_VERSION)
+    else:
+        encode_bin.write(filepath, root, FBX_VERSION)
 
     # Clear cached ObjectWrappers!
     ObjectWrapper.cache_clear()
@@ -1002,9 +1034,46 @@ def save_single(operator, scene, depsgraph, filepath="",
     if not media_settings.embed_textures:
         bpy_extras.io_utils.path_reference_copy(media_settings.copy_set)
 
-    print('export finished in %.4f sec.' % (time.process_time() - start_time))
+    log.debug("FBX export of %s finished in %.4f sec", filepath, time.process_time() - start_time)
     return {'FINISHED'}
 
+# Exports the given objects without going through the operator or the selection.
+# Uses the same defaults as EXPORT_OT_MVT_TOOLSET_FBX
+# Objects do not have to be linked into the scene, as long as they need no evaluation (use_mesh_modifiers=False).
+# An already evaluated depsgraph can be passed in, instead of getting it from the context for every call.
+def save_objects(operator, context, filepath, objects,
+                 axis_forward='-Z',
+                 axis_up='Y',
+                 depsgraph=None,
+                 **kwargs
+                 ):
+    from bpy_extras.io_utils import axis_conversion
+
+    keywords = {
+        "global_scale": 1.0,
+        "apply_unit_scale": True,
+        "apply_scale_options": 'FBX_SCALE_NONE',
+        "bake_space_transform": False,
+        "mesh_smooth_type": 'OFF',
+        "use_mesh_edges": False,
+        "use_tspace": False,
+        "use_custom_props": False,
+        "add_leaf_bones": True,
+        "path_mode": 'AUTO',
+        "embed_textures": True,
+    }
+    keywords.update(kwargs)
+
+    keywords["global_matrix"] = axis_conversion(to_forward=axis_forward, to_up=axis_up).to_4x4()
+    keywords["axis_forward"] = axis_forward
+    keywords["axis_up"] = axis_up
+    keywords["context_objects"] = objects
+
+    if depsgraph is None:
+        depsgraph = context.evaluated_depsgraph_get()
+    return save_single(operator, context.scene, depsgraph, filepath, **keywords)
+
+
 def save(operator, context,
          filepath="",
          use_selection=False,
@@ -1088,7 +1157,7 @@ def save(operator, context,
 
             filepath = os.path.join(new_fbxpath, newname + '.fbx')
 
-            print('\nBatch exporting %s as...\n\t%r' % (data, filepath))
+            log.debug("Batch exporting %s as %s", data, filepath)
 
             if batch_mode in {'COLLECTION', 'SCENE_COLLECTION', 'ACTIVE_SCENE_COLLECTION'}:
                 # Collection, so that objects update properly, add a dummy scene.
@@ -35,6 +35,10 @@ from bpy.props import (
 )
 import metaverse_tools.files.fst.writer as FSTWriter
 from metaverse_tools.utils.bones.bones_builder import find_armatures
+from metaverse_tools.utils.job import JobOperator
+from metaverse_tools.utils.logger import get_logger
+
+log = get_logger(__name__)
 
 
 class EXPORT_OT_MVT_TOOLSET_Message_Warn_Bone(bpy.types.Operator):
@@ -49,7 +53,7 @@ class EXPORT_OT_MVT_TOOLSET_Message_Warn_Bone(bpy.types.Operator):
         return True
 
     def invoke(self, context, even):
-        print("Invoked")
+        log.debug("Invoked %s", self.bl_idname)
         wm = context.window_manager
         return wm.invoke_popup(self, width=400, height=600)
 
@@ -84,7 +88,7 @@ class EXPORT_OT_MVT_TOOLSET_Message_Error(bpy.types.Operator):
         return True
 
     def invoke(self, context, even):
-        print("Invoked")
+        log.debug("Invoked %s", self.bl_idname)
         wm = context.window_manager
         return wm.invoke_popup(self, width=400, height=600)
 
@@ -112,7 +116,7 @@ class EXPORT_OT_MVT_TOOLSET_Message_Error_No_Armature(bpy.types.Operator):
         return True
 
     def invoke(self, context, even):
-        print("Invoked")
+        log.debug("Invoked %s", self.bl_idname)
         wm = context.window_manager
         return wm.invoke_popup(self, width=400, height=600)
 
@@ -140,7 +144,7 @@ class EXPORT_OT_MVT_TOOLSET_Message_Success(bpy.types.Operator):
         return True
 
     def invoke(self, context, even):
-        print("Invoked")
+        log.debug("Invoked %s", self.bl_idname)
         wm = context.window_manager
         return wm.invoke_popup(self, width=400, height=600)
 
@@ -156,12 +160,13 @@ class EXPORT_OT_MVT_TOOLSET_Message_Success(bpy.types.Operator):
         row.label(text="Avatar Export Successful.")
 
 
-class EXPORT_OT_MVT_TOOLSET_Hifi_FST_Writer_Operator(bpy.types.Operator, ExportHelper):
+class EXPORT_OT_MVT_TOOLSET_Hifi_FST_Writer_Operator(JobOperator, bpy.types.Operator, ExportHelper):
     """ This Operator exports a Vircadia compatible FST and FBX of the current avatar.
     """
     bl_idname = "metaverse_toolset.export_fst"
     bl_label = "Export Hifi Avatar"
     bl_options = {'UNDO'}
+    job_label = "Exporting Hifi Avatar"
 
     directory: StringProperty()
     filename_ext = ".fst"
@@ -184,14 +189,22 @@ class EXPORT_OT_MVT_TOOLSET_Hifi_FST_Writer_Operator(bpy.types.Operator, ExportH
     embed: BoolProperty(default=False, name="Embed Textures",
                          description="Embed Textures to Exported Model. Turn this off if you are having issues of Textures not showing correctly in elsewhere.")
 
+    bake: BoolProperty(default=False, name="Bake with Oven",
+                       description="Run the oven tool set in the add-on preferences on the exported avatar")
+
+    write_profile: BoolProperty(default=False, name="Write Profile",
+                                description="Record the time spent in each export phase and the size of each written file into a .profile.json / .profile.csv next to the export")
+
     def draw(self, context):
         layout = self.layout
         layout.prop(self, "selected_only")
        #layout.prop(self, "flow")
         layout.prop(self, "embed")
+        layout.prop(self, "bake")
 
         #layout.prop(self, "anim_graph_url")
         layout.prop(self, "script")
+        layout.prop(self, "write_profile")
 
     def execute(self, context):
         if not self.filepath:
@@ -204,7 +217,7 @@ class EXPORT_OT_MVT_TOOLSET_Hifi_FST_Writer_Operator(bpy.types.Operator, ExportH
         else:
             to_export = list(bpy.context.view_layer.objects)
 
-        print(to_export)
+        log.debug("Exporting %d objects", len(to_export))
         
         self.scale = 1  # Add scene scale here
 
@@ -213,10 +226,15 @@ class EXPORT_OT_MVT_TOOLSET_Hifi_FST_Writer_Operator(bpy.types.Operator, ExportH
             bpy.ops.metaverse_toolset_messages.export_error_no_armature('INVOKE_DEFAULT')
             return {'CANCELLED'}
 
-        val = FSTWriter.fst_export(self, to_export)
-        
+        self.to_export = to_export
+        self.armature = armatures[0]
+        return self.start_job(context)
+
+    def job(self, context):
+        val = yield from FSTWriter.fst_export_job(self, self.to_export)
+
         if val == {'FINISHED'}:
-            if len(armatures[0].data.edit_bones) > 100:
+            if len(self.armature.data.edit_bones) > 100:
                 bpy.ops.metaverse_toolset_messages.export_warn_bone('INVOKE_DEFAULT')
             else:
                 bpy.ops.metaverse_toolset_messages.export_success('INVOKE_DEFAULT')
@@ -30,7 +30,11 @@ from metaverse_tools.utils.bones.bones_builder import find_armature
 from metaverse_tools.utils.helpers.mesh import get_mesh_from
 from metaverse_tools.utils.helpers.common import of
 from metaverse_tools.utils.helpers.materials import get_images_from
-from metaverse_tools.utils.helpers.bake_tool import bake_fbx
+from metaverse_tools.utils.helpers.bake_tool import bake_fbx_job
+from metaverse_tools.utils.logger import get_logger
+from metaverse_tools.utils.profiler import ExportProfiler
+from metaverse_tools.utils.staging import ExportStaging
+from metaverse_tools.utils.job import run_job
 
 import webbrowser
 import shutil
@@ -68,26 +72,35 @@ prefix_free_joint = "freeJoint = $\n"
 prefix_script = "script = $\n"
 #prefix_anim_graph_url = "animGraphUrl = $\n"
 
+log = get_logger(__name__)
+
 
 def default_blend_shape(selected):
-    print("Blend Shakes")
+    log.debug("Blend Shakes")
 
     for obj in selected:
         if obj.type == "MESH":
-            print("Searching Blend Shapes")
+            log.debug("Searching Blend Shapes")
             # TODO: Make a map of common blendshape names
             #  if something does not already exist in model
 
 
 def fst_export(context, selected):
+    return run_job(fst_export_job(context, selected))
+
+
+# Yields the progress between the stages of the export: the fst, the fbx, each texture and the bake.
+# A cancelled export discards the staging folder, leaving the avatar folder as it was.
+def fst_export_job(context, selected):
 
     preferences = bpy.context.preferences.addons[metaverse_tools.__name__].preferences
+    profiler = ExportProfiler(context.write_profile)
     # file = open
     uuid_gen = uuid.uuid5(uuid.NAMESPACE_DNS, context.filepath +
                           '?' + str(datetime.datetime.now()).replace(" ", ""))
     scene_id = str(uuid_gen)
 
-    print("Exporting file to filepath", context.filepath)
+    log.info("Exporting file to filepath %s", context.filepath)
 
     filename = ntpath.basename(context.filepath).replace('.fst', "")
     directory = ntpath.join(os.path.dirname(
@@ -96,18 +109,23 @@ def fst_export(context, selected):
     if os.path.isdir(directory) == False:
         os.mkdir(directory)
 
-    filepath = ntpath.join(directory, filename + ".fst")
-    avatar_file = scene_id + ".fbx"
-    avatar_filepath = ntpath.join(directory, avatar_file)
-
     joint_maps = prefix_joint_maps.keys()
 
     armature = find_armature(selected)
 
     if armature is None:
-        print(" Could not find Armature in selection or scene")
+        log.error("Could not find Armature in selection or scene")
         return {"CANCELLED"}
 
+    # Everything is written to a staging folder, and moved into the avatar folder only once the export has succeeded.
+    # The avatar is a single fbx, so there is nothing to resume, and any earlier failed export is discarded.
+    staging = ExportStaging(directory, filename + ".fst", resume=False)
+
+    fst_filepath = ntpath.join(directory, filename + ".fst")
+    filepath = staging.filepath(filename + ".fst")
+    avatar_file = scene_id + ".fbx"
+    avatar_filepath = staging.filepath(avatar_file)
+
     f = open(filepath, "w")
 
     #mode = bpy.context.area.type
@@ -128,7 +146,7 @@ def fst_export(context, selected):
             f.write(prefix_script.replace('$', context.script))
 
         if context.flow:
-            print("Add Flow Script")
+            log.debug("Add Flow Script")
 
         # if len(context.anim_graph_url) > 0:
         #    f.write(prefix_anim_graph_url.replace('$', context.anim_graph_url))
@@ -136,16 +154,16 @@ def fst_export(context, selected):
         # Writing these in separate loops because they need to done in order.
         for bone in armature.data.bones:
             if bone.name in joint_maps:
-                print("Writing joint map",
-                      prefix_joint_maps[bone.name] + " = " + bone.name)
+                log.debug("Writing joint map %s = %s", prefix_joint_maps[bone.name], bone.name)
                 f.write(prefix_joint.replace(
                     '¤', prefix_joint_maps[bone.name]).replace('$', bone.name))
 
         for bone in armature.data.bones:
             if bone.name in prefix_free_joints:
-                print("Writing joint index", "freeJoint = " + bone.name + "\n")
+                log.debug("Writing joint index freeJoint = %s", bone.name)
                 f.write(prefix_free_joint.replace('$', bone.name))
 
+        yield 0.1
 
         for select in selected:
             select.select_set(state=True)
@@ -155,45 +173,65 @@ def fst_export(context, selected):
         else:
             path_mode = 'AUTO'
 
-        print("Writing FBX with path_mode=",
-              avatar_filepath, context.embed, path_mode)
-        bpy.ops.metaverse_toolset.export_scene_fbx(filepath=avatar_filepath, embed_textures=context.embed, path_mode=path_mode,
-                                 use_selection=True, add_leaf_bones=False,  axis_forward='-Z', axis_up='Y')
+        log.debug("Writing FBX %s embed=%s path_mode=%s", avatar_filepath, context.embed, path_mode)
+        with profiler.phase("fbx_write", avatar_file):
+            bpy.ops.metaverse_toolset.export_scene_fbx(filepath=avatar_filepath, embed_textures=context.embed, path_mode=path_mode,
+                                     use_selection=True, add_leaf_bones=False,  axis_forward='-Z', axis_up='Y')
+        yield 0.6
 
         if not context.embed:
-            texture_dir = ntpath.join(directory, "textures")
-
-            # If textures already exists in the folder we will put (overiding old)
-            # Remove it.
-            print("Checking if there is an existing export folder.")
-            if os.path.isdir(texture_dir):
-                print("Deleting existing folder")
-                shutil.rmtree(texture_dir)
-
+            texture_dir = staging.filepath("textures")
             os.mkdir(texture_dir)
             # This is where things get interesting. if COPY mode is used when not embedding,
             # Blender doesnt export the rest of the information, so the behavior is strange.
 
-            print("Getting Textures from selected Mesh.")
+            log.debug("Getting Textures from selected Mesh.")
             images = get_images_from(of(selected, "MESH"))
-            print(images)
-            print("Copying Textures to export folder.")
+            log.debug("Copying %d Textures to export folder.", len(images))
 
-            for image in images:
+            for index, image in enumerate(images):
                 current_path = bpy.path.abspath(image.filepath)
-                shutil.copy(current_path, ntpath.join(
-                    texture_dir, ntpath.basename(current_path)))
+                texture_path = ntpath.join(texture_dir, ntpath.basename(current_path))
+                with profiler.phase("texture_copy", image.name):
+                    shutil.copy(current_path, texture_path)
+                yield 0.6 + 0.2 * (index + 1) / len(images)
 
-        if preferences.oventool is not None and context.bake:
-            bake_fbx(preferences.oventool, avatar_filepath)
+        if context.bake:
+            with profiler.phase("oven_bake", avatar_file):
+                yield from bake_fbx_job(preferences.oventool, avatar_filepath)
+            yield 0.95
 
+    except GeneratorExit:
+        log.info("Export to %s cancelled", fst_filepath)
+
+        f.close()
+        staging.close()
+        staging.clear()
+        raise
     except Exception as e:
-        print('Could not write to file.', e)
+        log.error("Could not write to file. %s", e)
 
         f.close()
+        staging.close()
+        profiler.write(fst_filepath)
         return {"CANCELLED"}
 
     f.close()
 
+    # If textures already exists in the folder we will put (overiding old)
+    # Remove it.
+    texture_dir = ntpath.join(directory, "textures")
+    if not context.embed and os.path.isdir(texture_dir):
+        log.debug("Deleting existing texture folder")
+        shutil.rmtree(texture_dir)
+
+    staging.publish(last=(filename + ".fst",))
+
+    if profiler.enabled:
+        for root, folders, files in os.walk(directory):
+            for published in files:
+                profiler.record_file(ntpath.join(root, published))
+    profiler.write(fst_filepath)
+
     return {"FINISHED"}
     # FST Exporter
@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Batched export of static world geometry.
+# Static meshes are clustered into the cells of a world space grid, and each cell is split further into batches
+# that stay under a triangle budget. Each batch is written as a single model, with a sub mesh per object,
+# and gets a single Model entity in the scene instead of one per object.
+
+import bpy
+import json
+import uuid
+import numpy
+
+from hashlib import sha256
+from mathutils import Matrix
+
+from metaverse_tools.utils.helpers.extra_math import swap_nzy, swap_yz
+from metaverse_tools.utils.helpers.bounds import world_bounds, bounds_center, bounds_size
+from metaverse_tools.utils.logger import get_logger
+from metaverse_tools.files.hifi_json.manifest import object_transform
+from metaverse_tools.ext.modified_fbx_tools import mod_export_fbx_bin
+
+BATCH_PREFIX = "batch"
+
+log = get_logger(__name__)
+
+
+class Batch:
+    def __init__(self, name):
+        self.name = name
+        self.objects = []
+        self.triangles = 0
+        self.minimum = None
+        self.maximum = None
+
+    def add(self, blender_object, triangles, minimum, maximum):
+        self.objects.append(blender_object)
+        self.triangles += triangles
+        self.minimum = minimum if self.minimum is None else numpy.minimum(self.minimum, minimum)
+        self.maximum = maximum if self.maximum is None else numpy.maximum(self.maximum, maximum)
+
+    @property
+    def center(self):
+        return bounds_center(self.minimum, self.maximum)
+
+    @property
+    def size(self):
+        return bounds_size(self.minimum, self.maximum)
+
+
+# Only top level meshes without children or skinning can be merged, anything else keeps its own entity
+def is_batchable(blender_object):
+    if blender_object.type != 'MESH' or blender_object.parent is not None or len(blender_object.children) > 0:
+        return False
+
+    return not any(modifier.type == 'ARMATURE' for modifier in blender_object.modifiers)
+
+
+def triangle_count(blender_object, depsgraph):
+    mesh = blender_object.evaluated_get(depsgraph).data
+    loop_totals = numpy.empty(len(mesh.polygons), dtype=numpy.int32)
+    mesh.polygons.foreach_get("loop_total", loop_totals)
+    return int(numpy.sum(loop_totals - 2))
+
+
+# Groups the objects into batches by the grid cell the center of their bounds falls in.
+# Cells are filled in name order, starting a new batch whenever the next object would go over the triangle budget.
+def cluster_objects(blender_objects, depsgraph, cell_size, triangle_budget):
+    cells = {}
+    for blender_object in sorted(blender_objects, key=lambda blender_object: blender_object.name):
+        minimum, maximum = world_bounds(blender_object, depsgraph)
+        cell = tuple(numpy.floor((minimum + maximum) * 0.5 / cell_size).astype(int).tolist())
+        cells.setdefault(cell, []).append((blender_object, triangle_count(blender_object, depsgraph), minimum, maximum))
+
+    batches = []
+    for cell in sorted(cells.keys()):
+        batch = None
+        index = 0
+        for blender_object, triangles, minimum, maximum in cells[cell]:
+            if batch is None or (batch.triangles > 0 and batch.triangles + triangles > triangle_budget):
+                batch = Batch("%s_%d_%d_%d_%d" % (BATCH_PREFIX, cell[0], cell[1], cell[2], index))
+                batches.append(batch)
+                index += 1
+
+            batch.add(blender_object, triangles, minimum, maximum)
+
+    log.info("Clustered %d static meshes into %d batches", len(blender_objects), len(batches))
+    return batches
+
+
+# Hash of everything that ends up in the model of the batch, for the mesh cache
+def batch_digest(batch, session):
+    digest = sha256()
+    digest.update(batch.name.encode('utf-8'))
+    for blender_object in batch.objects:
+        digest.update(blender_object.name.encode('utf-8'))
+        digest.update(session.mesh_hash(blender_object).encode('utf-8'))
+        digest.update(str(object_transform(blender_object)).encode('utf-8'))
+
+    return digest.hexdigest()
+
+
+# Writes the batch as a single model, relative to the center of the batch. Returns the file the model was written to.
+def write_batch(batch, path, options, session):
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    offset = Matrix.Translation(-batch.center)
+
+    if session.glb is not None:
+        entries = [(blender_object, offset @ blender_object.matrix_world) for blender_object in batch.objects]
+        return session.glb.write_objects(entries, depsgraph, batch.name)
+
+    model_file = batch.name + session.extension
+    temp_objects = []
+    try:
+        for blender_object in batch.objects:
+            evaluated = blender_object.evaluated_get(depsgraph)
+            mesh = bpy.data.meshes.new_from_object(evaluated)
+            temp_object = bpy.data.objects.new(blender_object.name + "-batch", mesh)
+            # Not linked into the scene, so its transform is set through matrix_world
+            temp_object.matrix_world = offset @ blender_object.matrix_world
+            temp_objects.append(temp_object)
+
+            for index, material_slot in enumerate(blender_object.material_slots):
+                if material_slot.link == 'OBJECT' and index < len(temp_object.material_slots):
+                    temp_object.material_slots[index].link = 'OBJECT'
+                    temp_object.material_slots[index].material = material_slot.material
+
+        encoder = None
+        if session.pool is not None:
+            encoder = session.pool.submit
+
+        log.debug("Writing batch %s with %d objects", model_file, len(batch.objects))
+        mod_export_fbx_bin.save_objects(options, bpy.context, path + model_file, temp_objects, encoder=encoder,
+                                        use_mesh_modifiers=False, embed_textures=True, path_mode='COPY',
+                                        axis_forward='-Z', axis_up='Y', depsgraph=depsgraph)
+    finally:
+        for temp_object in temp_objects:
+            mesh = temp_object.data
+            bpy.data.objects.remove(temp_object)
+            bpy.data.meshes.remove(mesh)
+
+    return model_file
+
+
+def batch_entity(batch, model_url):
+    scene_id = str(uuid.uuid5(uuid.NAMESPACE_DNS, batch.name))
+    position = swap_nzy(batch.center)
+    dimensions = swap_yz(batch.size)
+
+    return {
+        'name': batch.name,
+        'id': scene_id,
+        'type': 'Model',
+        'modelURL': model_url,
+        'position': {
+            'x': position.x,
+            'y': position.y,
+            'z': position.z
+        },
+        'rotation': {
+            'x': 0,
+            'y': 0,
+            'z': 0,
+            'w': 1
+        },
+        'dimensions': {
+            'x': dimensions.x,
+            'y': dimensions.y,
+            'z': dimensions.z
+        },
+        'grab': {
+            'grabbable': False,
+            'triggerable': False,
+            'cloneable': False
+        },
+        "shapeType": "static-mesh",
+        'userData': json.dumps({'blender_export': scene_id,
+                                'batched': [blender_object.name for blender_object in batch.objects]})
+    }
@@ -0,0 +1,163 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Content addressed cache for the models written by the scene exporter.
+# Each model file written to the export folder is stored with a hash of the geometry and materials it was written from,
+# so that the next export can skip writing the file again if nothing has changed.
+
+import os
+import bpy
+import json
+import numpy
+
+from hashlib import sha256
+from metaverse_tools.ext.modified_fbx_tools.mod_export_fbx_bin import HIFI_SPECIFIC_SOCKETS_FBX
+from metaverse_tools.utils.helpers.materials import HifiShaderWrapper
+from metaverse_tools.utils.logger import get_logger
+
+CACHE_FILENAME = ".metaverse_tools_cache.json"
+CACHE_VERSION = 2
+
+# Vertices are hashed relative to their bounds center, rounded to this many decimals.
+# This way the hash stays the same even if the origin of the mesh has been moved to the center of bounds.
+HASH_PRECISION = 5
+
+log = get_logger(__name__)
+
+
+# Images are embedded into the model, so their content is part of the hash.
+# Packed images are hashed by their data, and images on disk by their size and modification time.
+def hash_image(digest, image):
+    digest.update(repr((image.name, image.filepath, image.source, image.alpha_mode)).encode('utf-8'))
+
+    if image.packed_file is not None:
+        digest.update(bytes(image.packed_file.data))
+        return
+
+    try:
+        stat = os.stat(bpy.path.abspath(image.filepath, library=image.library))
+        digest.update(repr((stat.st_size, stat.st_mtime_ns)).encode('utf-8'))
+    except OSError:
+        digest.update(b"|missing")
+
+
+# Hashes the material settings the FBX exporter writes into the model, see mod_export_fbx_bin
+def hash_material(digest, material):
+    ma_wrap = HifiShaderWrapper(material, is_readonly=True)
+
+    values = [material.name, tuple(ma_wrap.base_color), ma_wrap.roughness, ma_wrap.metallic, tuple(ma_wrap.emission)]
+    digest.update(repr(values).encode('utf-8'))
+
+    for socket_name, _fbx_name in HIFI_SPECIFIC_SOCKETS_FBX:
+        texture = getattr(ma_wrap, socket_name)
+        if texture is None or texture.image is None:
+            digest.update(b"|")
+            continue
+
+        values = [socket_name, texture.texcoords, texture.projection, texture.extension,
+                  tuple(texture.translation), tuple(texture.rotation), tuple(texture.scale)]
+        digest.update(repr(values).encode('utf-8'))
+        hash_image(digest, texture.image)
+
+
+def hash_evaluated_mesh(blender_object, depsgraph, fingerprint=""):
+    evaluated = blender_object.evaluated_get(depsgraph)
+    mesh = evaluated.to_mesh()
+
+    digest = sha256()
+    digest.update(fingerprint.encode('utf-8'))
+
+    try:
+        vertices = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float32)
+        mesh.vertices.foreach_get("co", vertices)
+        vertices = vertices.reshape(-1, 3)
+
+        if len(vertices) > 0:
+            center = (vertices.min(axis=0) + vertices.max(axis=0)) * 0.5
+            vertices = numpy.round(vertices - center, HASH_PRECISION)
+
+        digest.update(vertices.tobytes())
+
+        loops = numpy.empty(len(mesh.loops), dtype=numpy.int32)
+        mesh.loops.foreach_get("vertex_index", loops)
+        digest.update(loops.tobytes())
+
+        for attribute, dtype in (("loop_start", numpy.int32), ("material_index", numpy.int32), ("use_smooth", numpy.bool_)):
+            polygon_data = numpy.empty(len(mesh.polygons), dtype=dtype)
+            mesh.polygons.foreach_get(attribute, polygon_data)
+            digest.update(polygon_data.tobytes())
+
+        for uv_layer in mesh.uv_layers:
+            uvs = numpy.empty(len(uv_layer.data) * 2, dtype=numpy.float32)
+            uv_layer.data.foreach_get("uv", uvs)
+            digest.update(uv_layer.name.encode('utf-8'))
+            digest.update(uvs.tobytes())
+
+        for material_slot in blender_object.material_slots:
+            if material_slot.material is not None:
+                hash_material(digest, material_slot.material)
+            else:
+                digest.update(b"|")
+    finally:
+        evaluated.to_mesh_clear()
+
+    return digest.hexdigest()
+
+
+class MeshCache:
+    def __init__(self, path):
+        self.path = path
+        self.filepath = os.path.join(path, CACHE_FILENAME)
+        self.entries = {}
+
+        if os.path.isfile(self.filepath):
+            try:
+                with open(self.filepath, "r") as file:
+                    data = json.load(file)
+
+                if data.get('Version') == CACHE_VERSION:
+                    self.entries = data.get('Models', {})
+            except (OSError, ValueError) as e:
+                log.warning("Could not read export cache, starting from empty. %s", e)
+
+    # A model is only reused if the hash matches and the file is still there.
+    def is_valid(self, model_file, digest):
+        if self.entries.get(model_file) != digest:
+            return False
+
+        return os.path.isfile(os.path.join(self.path, model_file))
+
+    def store(self, model_file, digest):
+        self.entries[model_file] = digest
+
+    def discard(self, model_file):
+        self.entries.pop(model_file, None)
+
+    def save(self):
+        data = {
+            'Version': CACHE_VERSION,
+            'Models': self.entries
+        }
+
+        try:
+            with open(self.filepath, "w") as file:
+                json.dump(data, file)
+        except OSError as e:
+            log.error("Could not write export cache. %s", e)
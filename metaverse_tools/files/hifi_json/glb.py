@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Minimal binary glTF (GLB) writer for the scene exporter.
+# Mesh attributes are read with foreach_get straight into numpy arrays and written out as binary buffers,
+# one primitive per material. Models with identical content and textures shared between models
+# are only written once per scene.
+
+import os
+import json
+import struct
+import shutil
+import numpy
+
+from hashlib import sha256
+from bpy_extras.node_shader_utils import PrincipledBSDFWrapper
+from metaverse_tools.utils.logger import get_logger
+
+GLB_EXTENSION = ".glb"
+TEXTURE_FOLDER = "textures"
+
+GLB_MAGIC = 0x46546C67
+GLB_VERSION = 2
+CHUNK_JSON = 0x4E4F534A
+CHUNK_BIN = 0x004E4942
+
+COMPONENT_FLOAT = 5126
+COMPONENT_UNSIGNED_SHORT = 5123
+COMPONENT_UNSIGNED_INT = 5125
+
+TARGET_ARRAY_BUFFER = 34962
+TARGET_ELEMENT_ARRAY_BUFFER = 34963
+
+MIME_TYPES = {
+    ".png": "image/png",
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg"
+}
+
+log = get_logger(__name__)
+
+
+# Reads the triangulated, per loop attributes of the mesh. Returns positions, normals, uvs (or None),
+# the loop indices of each triangle and the material index of each triangle.
+def read_mesh_arrays(mesh):
+    mesh.calc_loop_triangles()
+    if hasattr(mesh, "calc_normals_split"):
+        mesh.calc_normals_split()
+
+    vertex_count = len(mesh.vertices)
+    loop_count = len(mesh.loops)
+    triangle_count = len(mesh.loop_triangles)
+
+    coordinates = numpy.empty(vertex_count * 3, dtype=numpy.float32)
+    mesh.vertices.foreach_get("co", coordinates)
+    coordinates = coordinates.reshape(-1, 3)
+
+    loop_vertices = numpy.empty(loop_count, dtype=numpy.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vertices)
+
+    normals = numpy.empty(loop_count * 3, dtype=numpy.float32)
+    mesh.loops.foreach_get("normal", normals)
+    normals = normals.reshape(-1, 3)
+
+    uvs = None
+    if mesh.uv_layers.active is not None:
+        uvs = numpy.empty(loop_count * 2, dtype=numpy.float32)
+        mesh.uv_layers.active.data.foreach_get("uv", uvs)
+        uvs = uvs.reshape(-1, 2)
+
+    triangles = numpy.empty(triangle_count * 3, dtype=numpy.int32)
+    mesh.loop_triangles.foreach_get("loops", triangles)
+    triangles = triangles.reshape(-1, 3)
+
+    materials = numpy.empty(triangle_count, dtype=numpy.int32)
+    mesh.loop_triangles.foreach_get("material_index", materials)
+
+    return coordinates[loop_vertices], normals, uvs, triangles, materials
+
+
+# Copy of the gltf json without the names of its meshes, nodes and materials
+def strip_names(value):
+    if isinstance(value, dict):
+        return {key: strip_names(item) for key, item in value.items() if key != 'name'}
+    if isinstance(value, list):
+        return [strip_names(item) for item in value]
+    return value
+
+
+# Blender is Z up, glTF is Y up
+def to_gltf_axis(vectors):
+    return numpy.stack((vectors[:, 0], vectors[:, 2], -vectors[:, 1]), axis=1)
+
+
+class GLBBuilder:
+    def __init__(self):
+        self.gltf = {
+            'asset': {'version': '2.0', 'generator': 'Metaverse Toolkit Blender Add-on'},
+            'buffers': [],
+            'bufferViews': [],
+            'accessors': [],
+            'meshes': [],
+            'nodes': [],
+            'scenes': [{'nodes': []}],
+            'scene': 0
+        }
+        self.blobs = []
+        self.offset = 0
+        # Identical data within the model share the same buffer view
+        self.views = {}
+        # material name -> material index
+        self.materials = {}
+
+    def add_view(self, data, target):
+        blob = data.tobytes()
+        key = (sha256(blob).hexdigest(), target)
+        if key in self.views:
+            return self.views[key]
+
+        padding = (4 - self.offset % 4) % 4
+        if padding:
+            self.blobs.append(b"\0" * padding)
+            self.offset += padding
+
+        view = {'buffer': 0, 'byteOffset': self.offset, 'byteLength': len(blob), 'target': target}
+        self.gltf['bufferViews'].append(view)
+        self.blobs.append(blob)
+        self.offset += len(blob)
+
+        index = len(self.gltf['bufferViews']) - 1
+        self.views[key] = index
+        return index
+
+    def add_accessor(self, data, accessor_type, component_type, target, bounds=False):
+        accessor = {
+            'bufferView': self.add_view(data, target),
+            'componentType': component_type,
+            'count': len(data),
+            'type': accessor_type
+        }
+
+        if bounds and len(data) > 0:
+            accessor['min'] = data.min(axis=0).tolist()
+            accessor['max'] = data.max(axis=0).tolist()
+
+        self.gltf['accessors'].append(accessor)
+        return len(self.gltf['accessors']) - 1
+
+    def add_mesh(self, name, positions, normals, uvs, triangles, materials, material_indices):
+        # Merge identical loops into shared vertices
+        columns = [positions, normals]
+        if uvs is not None:
+            columns.append(uvs)
+        combined = numpy.ascontiguousarray(numpy.concatenate(columns, axis=1))
+        unique, inverse = numpy.unique(combined, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+
+        positions = numpy.ascontiguousarray(unique[:, 0:3], dtype=numpy.float32)
+        normals = numpy.ascontiguousarray(unique[:, 3:6], dtype=numpy.float32)
+
+        attributes = {
+            'POSITION': self.add_accessor(positions, 'VEC3', COMPONENT_FLOAT, TARGET_ARRAY_BUFFER, True),
+            'NORMAL': self.add_accessor(normals, 'VEC3', COMPONENT_FLOAT, TARGET_ARRAY_BUFFER)
+        }
+
+        if uvs is not None:
+            texcoords = numpy.ascontiguousarray(unique[:, 6:8], dtype=numpy.float32)
+            texcoords[:, 1] = 1.0 - texcoords[:, 1]
+            attributes['TEXCOORD_0'] = self.add_accessor(texcoords, 'VEC2', COMPONENT_FLOAT, TARGET_ARRAY_BUFFER)
+
+        index_type = numpy.uint16 if len(unique) < 65536 else numpy.uint32
+        index_component = COMPONENT_UNSIGNED_SHORT if index_type == numpy.uint16 else COMPONENT_UNSIGNED_INT
+
+        primitives = []
+        for material_index in numpy.unique(materials):
+            indices = inverse[triangles[materials == material_index]].reshape(-1).astype(index_type)
+            primitive = {
+                'attributes': attributes,
+                'indices': self.add_accessor(indices, 'SCALAR', index_component, TARGET_ELEMENT_ARRAY_BUFFER),
+                'mode': 4
+            }
+
+            if int(material_index) in material_indices:
+                primitive['material'] = material_indices[int(material_index)]
+
+            primitives.append(primitive)
+
+        self.gltf['meshes'].append({'name': name, 'primitives': primitives})
+        self.gltf['nodes'].append({'name': name, 'mesh': len(self.gltf['meshes']) - 1})
+        self.gltf['scenes'][0]['nodes'].append(len(self.gltf['nodes']) - 1)
+
+    # Hash of what the model looks like: its buffers and everything in its json but the names, which are different
+    # for every model, so that models with the same geometry and materials have the same digest.
+    def content_digest(self):
+        content = json.dumps(strip_names(self.gltf), sort_keys=True, separators=(',', ':')).encode('utf-8')
+        digest = sha256(content)
+        for blob in self.blobs:
+            digest.update(blob)
+        return digest.hexdigest()
+
+    def to_bytes(self):
+        binary = b"".join(self.blobs)
+        binary += b"\0" * ((4 - len(binary) % 4) % 4)
+        self.gltf['buffers'] = [{'byteLength': len(binary)}]
+
+        content = json.dumps(self.gltf, separators=(',', ':')).encode('utf-8')
+        content += b" " * ((4 - len(content) % 4) % 4)
+
+        length = 12 + 8 + len(content) + 8 + len(binary)
+        return b"".join((
+            struct.pack("<III", GLB_MAGIC, GLB_VERSION, length),
+            struct.pack("<II", len(content), CHUNK_JSON), content,
+            struct.pack("<II", len(binary), CHUNK_BIN), binary
+        ))
+
+
+# Writes the GLB models of one scene export.
+# Keeps track of written content and textures, so that duplicates are written only once into the export folder.
+class GLBSceneWriter:
+    def __init__(self, path):
+        self.path = path
+        # content hash -> file name
+        self.contents = {}
+        # image name -> uri relative to the export folder
+        self.textures = {}
+        # texture file name -> the image file or packed image it was written from
+        self.texture_sources = {}
+
+    def texture_uri(self, image):
+        if image.name in self.textures:
+            return self.textures[image.name]
+
+        uri = None
+        texture_folder = os.path.join(self.path, TEXTURE_FOLDER)
+        source = image.filepath_from_user()
+        extension = os.path.splitext(source)[1].lower()
+
+        if extension not in MIME_TYPES:
+            log.warning("Skipping unsupported texture format %s", image.name)
+        else:
+            file_name = self.texture_file_name(image, source)
+            if not os.path.isdir(texture_folder):
+                os.makedirs(texture_folder)
+
+            target = os.path.join(texture_folder, file_name)
+            if image.packed_file is not None:
+                with open(target, "wb") as file:
+                    file.write(image.packed_file.data)
+                uri = TEXTURE_FOLDER + "/" + file_name
+            elif os.path.isfile(source):
+                shutil.copyfile(source, target)
+                uri = TEXTURE_FOLDER + "/" + file_name
+            else:
+                log.warning("Could not find texture %s", source)
+
+        self.textures[image.name] = uri
+        return uri
+
+    # Images from different folders may have the same file name, the later ones get the hash of their path appended
+    def texture_file_name(self, image, source):
+        origin = image.name if image.packed_file is not None else os.path.normcase(os.path.abspath(source))
+        file_name = os.path.basename(source)
+        if self.texture_sources.setdefault(file_name, origin) != origin:
+            stem, extension = os.path.splitext(file_name)
+            file_name = stem + "-" + sha256(origin.encode('utf-8')).hexdigest()[:8] + extension
+            self.texture_sources[file_name] = origin
+        return file_name
+
+    def add_texture(self, builder, image):
+        uri = self.texture_uri(image)
+        if uri is None:
+            return None
+
+        gltf = builder.gltf
+        images = gltf.setdefault('images', [])
+        for index, existing in enumerate(images):
+            if existing['uri'] == uri:
+                return {'index': index}
+
+        images.append({'uri': uri, 'mimeType': MIME_TYPES[os.path.splitext(uri)[1].lower()]})
+        gltf.setdefault('textures', []).append({'source': len(images) - 1})
+        return {'index': len(gltf['textures']) - 1}
+
+    def add_material(self, builder, material):
+        if material.name in builder.materials:
+            return builder.materials[material.name]
+
+        gltf_material = {'name': material.name, 'pbrMetallicRoughness': {}}
+        pbr = gltf_material['pbrMetallicRoughness']
+
+        if material.use_nodes:
+            wrapper = PrincipledBSDFWrapper(material, is_readonly=True)
+            pbr['baseColorFactor'] = list(wrapper.base_color) + [wrapper.alpha]
+            pbr['metallicFactor'] = wrapper.metallic
+            pbr['roughnessFactor'] = wrapper.roughness
+
+            base_color_texture = wrapper.base_color_texture
+            if base_color_texture is not None and base_color_texture.image is not None:
+                texture = self.add_texture(builder, base_color_texture.image)
+                if texture is not None:
+                    pbr['baseColorTexture'] = texture
+        else:
+            pbr['baseColorFactor'] = list(material.diffuse_color)
+            pbr['metallicFactor'] = material.metallic
+            pbr['roughnessFactor'] = material.roughness
+
+        if pbr.get('baseColorFactor', [1, 1, 1, 1])[3] < 1.0:
+            gltf_material['alphaMode'] = 'BLEND'
+
+        materials = builder.gltf.setdefault('materials', [])
+        materials.append(gltf_material)
+        builder.materials[material.name] = len(materials) - 1
+        return len(materials) - 1
+
+    # Adds the evaluated object as a mesh node. Without a matrix the geometry is centered to its bounds,
+    # otherwise it is transformed by the matrix.
+    def add_object(self, builder, blender_object, depsgraph, name, matrix=None):
+        evaluated = blender_object.evaluated_get(depsgraph)
+        mesh = evaluated.to_mesh()
+
+        try:
+            positions, normals, uvs, triangles, materials = read_mesh_arrays(mesh)
+
+            if matrix is not None:
+                rotation = numpy.array(matrix.to_3x3(), dtype=numpy.float32)
+                positions = positions @ rotation.T + numpy.array(matrix.translation, dtype=numpy.float32)
+                normal_matrix = numpy.array(matrix.to_3x3().inverted_safe().transposed(), dtype=numpy.float32)
+                normals = normals @ normal_matrix.T
+                lengths = numpy.linalg.norm(normals, axis=1, keepdims=True)
+                normals = normals / numpy.where(lengths > 0, lengths, 1.0)
+            elif len(positions) > 0:
+                center = (positions.min(axis=0) + positions.max(axis=0)) * 0.5
+                positions = positions - center
+
+            material_indices = {}
+            for index, material_slot in enumerate(blender_object.material_slots):
+                if material_slot.material is not None:
+                    material_indices[index] = self.add_material(builder, material_slot.material)
+
+            builder.add_mesh(name, to_gltf_axis(positions), to_gltf_axis(normals), uvs, triangles, materials,
+                             material_indices)
+        finally:
+            evaluated.to_mesh_clear()
+
+    # Writes the evaluated object centered to its bounds. Returns the name of the file the model can be found from,
+    # which is an earlier file if the exact same content has already been written during this export.
+    def write(self, blender_object, depsgraph, model_name):
+        builder = GLBBuilder()
+        self.add_object(builder, blender_object, depsgraph, model_name)
+        return self.write_builder(builder, model_name)
+
+    # Writes multiple objects into a single model, each as its own mesh node. entries are (object, matrix) pairs.
+    def write_objects(self, entries, depsgraph, model_name):
+        builder = GLBBuilder()
+        for blender_object, matrix in entries:
+            self.add_object(builder, blender_object, depsgraph, blender_object.name, matrix)
+        return self.write_builder(builder, model_name)
+
+    def write_builder(self, builder, model_name):
+        digest = builder.content_digest()
+        if digest in self.contents:
+            log.debug("Model %s has the same content as %s", model_name, self.contents[digest])
+            return self.contents[digest]
+
+        file_name = model_name + GLB_EXTENSION
+        with open(os.path.join(self.path, file_name), "wb") as file:
+            file.write(builder.to_bytes())
+
+        self.contents[digest] = file_name
+        return file_name
@@ -20,22 +20,61 @@
 
 import bpy
 
-import json
-import os
-
 from metaverse_tools.hifi_world.scene import HifiScene
+from metaverse_tools.files.hifi_json.stream import HifiJSONStreamReader
+from metaverse_tools.utils.logger import get_logger
+from metaverse_tools.utils.job import run_job
 
+# Entities read from the file before they are handed to the scene
+ENTITY_BATCH_SIZE = 256
+# Share of the progress for reading the file, the rest is for building what could not be built while reading
+READ_PROGRESS = 0.5
 
-def load_file(operator, context, filepath="",
-              uv_sphere= False,
-              join_children=True, 
-              merge_distance = 0.01, 
-              delete_interior_faces = True,
-              use_boolean_operation = 'NONE'):
-                  
-    json_data = open(filepath).read()
-    data = json.loads(json_data)
-    
-    scene = HifiScene(data, uv_sphere, join_children, merge_distance, delete_interior_faces, use_boolean_operation)
-    return {"FINISHED"}
+log = get_logger(__name__)
+
+
+def load_file(operator, context, filepath="", **options):
+    return run_job(load_file_job(operator, context, filepath, **options))
+
+
+# Streams the entities from the file, plain or gzipped, and builds them in batches as they are read.
+# Entities that have to be joined with their children are built once the whole file has been read.
+# Yields the progress after each batch and built root. A cancelled import removes everything it has created.
+def load_file_job(operator, context, filepath="",
+                  uv_sphere=False,
+                  join_children=True,
+                  merge_distance=0.01,
+                  delete_interior_faces=True,
+                  use_boolean_operation='NONE',
+                  link_instances=False,
+                  material_mode='COLOR',
+                  palette_buckets=16):
 
+    scene = HifiScene(None, uv_sphere, join_children, merge_distance, delete_interior_faces, use_boolean_operation,
+                      link_instances, material_mode, palette_buckets)
+    read_share = 1.0 if scene.builds_incrementally() else READ_PROGRESS
+
+    reader = HifiJSONStreamReader(filepath)
+    try:
+        batch = []
+        for entity in reader.entities():
+            batch.append(entity)
+            if len(batch) >= ENTITY_BATCH_SIZE:
+                scene.add_entities(batch)
+                batch = []
+                yield reader.progress * read_share
+
+        scene.add_entities(batch)
+        reader.close()
+        log.info("Read %d entities from %s", reader.count, filepath)
+
+        for progress in scene.build_steps():
+            yield read_share + progress * (1 - read_share)
+    except GeneratorExit:
+        log.info("Import of %s cancelled, removing the %d entities read so far", filepath, len(scene.entities))
+        scene.remove_built()
+        raise
+    finally:
+        reader.close()
+
+    return {"FINISHED"}
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Level of detail variants for the scene exporter.
+# Each level is the evaluated mesh with a collapse decimation on top, written next to the full resolution model
+# as <model>_lod<level>. Levels are cached with the hash of the source mesh, so they are only regenerated
+# when the source changes.
+
+import bpy
+
+from hashlib import sha256
+from contextlib import contextmanager
+
+LOD_SUFFIX = "_lod"
+
+
+# Triangle ratio of each level compared to the full resolution model, each level reducing the previous one
+def lod_ratios(levels, reduction):
+    return [round(reduction ** level, 4) for level in range(1, levels + 1)]
+
+
+def lod_name(model_name, level):
+    return model_name + LOD_SUFFIX + str(level)
+
+
+def lod_digest(mesh_hash, ratio):
+    return sha256((mesh_hash + "|lod:" + str(ratio)).encode('utf-8')).hexdigest()
+
+
+# Temporary objects of the evaluated mesh decimated to each of the ratios, with the transform of the source,
+# so that the variants are written the same way as the full model. The decimate modifiers are linked into a
+# temporary scene together and evaluated in one go, so the scene being exported is left untouched and
+# the depsgraph is built once for all of the levels.
+# The objects yielded hold the decimated meshes and are not linked, so writing them does not touch the depsgraph.
+@contextmanager
+def decimated_objects(blender_object, depsgraph, ratios):
+    source = bpy.data.meshes.new_from_object(blender_object.evaluated_get(depsgraph))
+
+    decimators = []
+    lod_objects = []
+    scene = None
+    try:
+        try:
+            for ratio in ratios:
+                decimator = bpy.data.objects.new(blender_object.name + "-decimate", source)
+                modifier = decimator.modifiers.new(name="LOD", type='DECIMATE')
+                modifier.decimate_type = 'COLLAPSE'
+                modifier.ratio = ratio
+                decimators.append(decimator)
+
+            scene = bpy.data.scenes.new(blender_object.name + "-lod")
+            for decimator in decimators:
+                scene.collection.objects.link(decimator)
+
+            # Updating the view layer builds and evaluates the depsgraph of the temporary scene
+            view_layer = scene.view_layers[0]
+            view_layer.update()
+            depsgraph = view_layer.depsgraph
+            for decimator in decimators:
+                mesh = bpy.data.meshes.new_from_object(decimator.evaluated_get(depsgraph))
+                lod_object = bpy.data.objects.new(blender_object.name + "-lod", mesh)
+                lod_object.matrix_world = blender_object.matrix_world.copy()
+                lod_objects.append(lod_object)
+
+                for index, material_slot in enumerate(blender_object.material_slots):
+                    if material_slot.link == 'OBJECT' and index < len(lod_object.material_slots):
+                        lod_object.material_slots[index].link = 'OBJECT'
+                        lod_object.material_slots[index].material = material_slot.material
+        finally:
+            for decimator in decimators:
+                bpy.data.objects.remove(decimator)
+            if scene is not None:
+                bpy.data.scenes.remove(scene)
+            bpy.data.meshes.remove(source)
+
+        yield lod_objects
+    finally:
+        for lod_object in lod_objects:
+            mesh = lod_object.data
+            bpy.data.objects.remove(lod_object)
+            bpy.data.meshes.remove(mesh)
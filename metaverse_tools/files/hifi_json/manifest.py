@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Sidecar manifest of a scene export, stored next to the .hifi.json.
+# Records the state each object was exported with, so that an incremental export
+# only has to parse the objects that are new or have changed since.
+
+import os
+import json
+
+from metaverse_tools.files.hifi_json.stream import HifiJSONStreamReader
+from metaverse_tools.utils.logger import get_logger
+
+MANIFEST_EXTENSION = ".manifest.json"
+MANIFEST_VERSION = 2
+
+TRANSFORM_PRECISION = 6
+# Object type the scene writer exports lights for
+LIGHT_TYPE = 'LAMP'
+
+log = get_logger(__name__)
+
+
+def object_transform(blender_object):
+    return [round(value, TRANSFORM_PRECISION) for row in blender_object.matrix_world for value in row]
+
+
+# State of the object that affects the entity written for it.
+def object_signature(blender_object, model_name=None, mesh_hash=None):
+    signature = {
+        'type': blender_object.type,
+        'transform': object_transform(blender_object),
+        'parent': blender_object.parent.name if blender_object.parent else None,
+        'model': model_name,
+        'mesh': mesh_hash
+    }
+
+    if blender_object.type == LIGHT_TYPE:
+        light = blender_object.data
+        signature['light'] = [light.type, light.energy, list(blender_object.color), light.distance]
+
+    return signature
+
+
+# Loads the entities of an earlier export, plain or gzipped, indexed by their id.
+# The file is streamed, and only the entities with the given ids are kept, if any are given.
+def read_scene_entities(filepath, ids=None):
+    if not os.path.isfile(filepath):
+        return {}
+
+    entities = {}
+    reader = None
+    try:
+        reader = HifiJSONStreamReader(filepath)
+        for entity in reader.entities():
+            if 'id' in entity and (ids is None or entity['id'] in ids):
+                entities[entity['id']] = entity
+    except (OSError, ValueError) as e:
+        log.warning("Could not read the previous export. %s", e)
+        return {}
+    finally:
+        if reader is not None:
+            reader.close()
+
+    return entities
+
+
+class ExportManifest:
+    def __init__(self, filepath, options=None):
+        self.filepath = filepath + MANIFEST_EXTENSION
+        self.options = options
+        # Name of the scene file written with the manifest, which depends on the json options
+        self.scene_file = None
+        # object name -> signature, and the id and modelURL of the entity that was written
+        self.objects = {}
+
+    @classmethod
+    def load(cls, filepath):
+        manifest = cls(filepath)
+
+        if os.path.isfile(manifest.filepath):
+            try:
+                with open(manifest.filepath, "r") as file:
+                    data = json.load(file)
+
+                if data.get('Version') == MANIFEST_VERSION:
+                    manifest.options = data.get('Options')
+                    manifest.scene_file = data.get('SceneFile')
+                    manifest.objects = data.get('Objects', {})
+            except (OSError, ValueError) as e:
+                log.warning("Could not read export manifest, exporting everything. %s", e)
+
+        return manifest
+
+    def is_unchanged(self, name, signature, options):
+        if options != self.options or name not in self.objects:
+            return False
+
+        return self.objects[name]['signature'] == signature
+
+    # Path of the scene file the entities of the manifest were written to, if there is one
+    def scene_filepath(self):
+        if self.scene_file is None:
+            return None
+        return os.path.join(os.path.dirname(self.filepath), self.scene_file)
+
+    def entity_id(self, name):
+        return self.objects[name]['id']
+
+    def entity_ids(self):
+        return set(entry['id'] for entry in self.objects.values() if entry['id'] is not None)
+
+    def model_url(self, name):
+        return self.objects[name]['modelURL']
+
+    def record(self, name, signature, entity):
+        entry = {
+            'signature': signature,
+            'id': None,
+            'modelURL': None
+        }
+
+        if entity:
+            entry['id'] = entity.get('id')
+            entry['modelURL'] = entity.get('modelURL')
+
+        self.objects[name] = entry
+
+    def save(self):
+        data = {
+            'Version': MANIFEST_VERSION,
+            'Options': self.options,
+            'SceneFile': self.scene_file,
+            'Objects': self.objects
+        }
+
+        try:
+            with open(self.filepath, "w") as file:
+                json.dump(data, file)
+        except OSError as e:
+            log.error("Could not write export manifest. %s", e)
@@ -21,8 +21,10 @@
 import bpy
 import os
 
-from metaverse_tools.files.hifi_json.loader import load_file
-from metaverse_tools.files.hifi_json.writer import write_file
+from metaverse_tools.files.hifi_json.loader import load_file_job
+from metaverse_tools.files.hifi_json.writer import write_file_job
+from metaverse_tools.utils.job import JobOperator
+from metaverse_tools.utils.logger import get_logger
 
 from bpy_extras.io_utils import (
     ImportHelper,
@@ -32,9 +34,13 @@ from bpy.props import (
     StringProperty,
     BoolProperty,
     FloatProperty,
+    IntProperty,
     EnumProperty
 )
 
+log = get_logger(__name__)
+
+
 class EXPORT_OT_MVT_TOOLSET_Message_Error_Missing_ATP_Override(bpy.types.Operator):
     """ This Operator to show an error that the ATP Override is missing from export
     """
@@ -47,7 +53,7 @@ class EXPORT_OT_MVT_TOOLSET_Message_Error_Missing_ATP_Override(bpy.types.Operato
         return True
 
     def invoke(self, context, even):
-        print("Invoked")
+        log.debug("Invoked %s", self.bl_idname)
         wm = context.window_manager
         return wm.invoke_popup(self, width=400, height=300)
 
@@ -67,13 +73,9 @@ class EXPORT_OT_MVT_TOOLSET_Message_Error_Missing_ATP_Override(bpy.types.Operato
         row.label(text=" (be it marketplace or your own)")
 
 
-class EXPORT_OT_MVT_TOOLSET_Writer_FBX_JSON(bpy.types.Operator, ExportHelper):
-    """ This Operator to show an error that the ATP Override is missing from export
-    """
-    bl_idname = "metaverse_toolset.export_fbx_json"
-    bl_label = "Export HiFi Scene"
-    bl_options = {'UNDO'}
-
+# Options and validation shared by the scene exporters, so that both exporters define them once and stay alike.
+# Exporters add the options only they have with draw_writer_options.
+class HifiSceneExportHelper(ExportHelper):
     filename_ext = ".hifi.json"
 
     directory: StringProperty()
@@ -86,10 +88,36 @@ class EXPORT_OT_MVT_TOOLSET_Writer_FBX_JSON(bpy.types.Operator, ExportHelper):
 
     url_override: StringProperty(default="", name="Marketplace / Base Url",
                                  description="Set Marketplace / URL Path here to override")
-    clone_scene: BoolProperty(default=False, name="Clone Scene prior to export", description="Clones the scene and performs the automated export functions on the clone instead of the original. " +
-                              "WARNING: instancing will not work, and ids will no longer be the same, for future features.")
     remove_trailing: BoolProperty(
         default=False, name="Remove Trailing .### from names")
+    use_cache: BoolProperty(default=True, name="Reuse unchanged models",
+                            description="Skip writing models whose geometry has not changed since the last export to the same folder")
+    incremental: BoolProperty(default=False, name="Incremental",
+                              description="Only export objects that are new or have changed since the last export to the same file, and copy the rest from the previous export")
+    compact_json: BoolProperty(default=False, name="Compact JSON",
+                               description="Write the scene json without indentation to reduce its size")
+    gzip_json: BoolProperty(default=False, name="Compress JSON (.gz)",
+                            description="Write the scene json compressed with gzip")
+    write_profile: BoolProperty(default=False, name="Write Profile",
+                                description="Record the time spent in each export phase and the size of each written file into a .profile.json / .profile.csv next to the export")
+    use_data_api: BoolProperty(default=True, name="Export without operators",
+                               description="Write models directly from the evaluated geometry, without changing selection, origins or applying modifiers on the scene objects")
+    parallel_write: BoolProperty(default=False, name="Write models in parallel",
+                                 description="Encode and write model files in background threads while the next objects are processed")
+    write_threads: IntProperty(default=0, min=0, name="Writer Threads",
+                               description="Number of threads used to write models. 0 uses all available cores")
+    batch_static: BoolProperty(default=False, name="Batch Static Meshes",
+                               description="Merge top level meshes without children into spatially clustered batches, each written as a single model with a single entity")
+    batch_cell_size: FloatProperty(default=16.0, min=0.1, name="Batch Cell Size", unit='LENGTH',
+                                   description="Size of the grid cells static meshes are clustered by")
+    batch_triangle_budget: IntProperty(default=65536, min=1, name="Batch Triangle Budget",
+                                       description="Maximum number of triangles in a single batch. A mesh over the budget gets a batch of its own")
+    generate_lods: BoolProperty(default=False, name="Generate LODs",
+                                description="Write decimated variants of each model next to it, and list them in the userData of the entity")
+    lod_levels: IntProperty(default=3, min=2, max=4, name="LOD Levels",
+                            description="Number of decimated variants per model")
+    lod_reduction: FloatProperty(default=0.5, min=0.05, max=0.95, name="LOD Reduction",
+                                 description="Ratio of triangles kept at each level compared to the previous one")
 
     def draw(self, context):
         layout = self.layout
@@ -103,10 +131,24 @@ class EXPORT_OT_MVT_TOOLSET_Writer_FBX_JSON(bpy.types.Operator, ExportHelper):
         else:
             layout.prop(self, "use_folder")
 
-        layout.label(
-            text="Clone scene: Performs automated actions on a cloned scene instead of the original.")
-        layout.prop(self, "clone_scene")
         layout.prop(self, "remove_trailing")
+        layout.prop(self, "incremental")
+        layout.prop(self, "compact_json")
+        layout.prop(self, "gzip_json")
+        layout.prop(self, "batch_static")
+        if self.batch_static:
+            layout.prop(self, "batch_cell_size")
+            layout.prop(self, "batch_triangle_budget")
+        layout.prop(self, "generate_lods")
+        if self.generate_lods:
+            layout.prop(self, "lod_levels")
+            layout.prop(self, "lod_reduction")
+        layout.prop(self, "use_cache")
+        self.draw_writer_options(layout)
+        layout.prop(self, "write_profile")
+
+    def draw_writer_options(self, layout):
+        pass
 
     def execute(self, context):
         if not self.filepath:
@@ -118,79 +160,52 @@ class EXPORT_OT_MVT_TOOLSET_Writer_FBX_JSON(bpy.types.Operator, ExportHelper):
             return {'CANCELLED'}
            # raise Exception("You must Use ATP or Set the Marketplace / base URL to make sure that the content can be reached after you upload it. ATP currently not supported")
 
-        write_file(self)
+        return self.start_job(context)
 
-        return {'FINISHED'}
 
-class EXPORT_OT_MVT_TOOLSET_Writer_GLTF_JSON(bpy.types.Operator, ExportHelper):
+class EXPORT_OT_MVT_TOOLSET_Writer_FBX_JSON(JobOperator, bpy.types.Operator, HifiSceneExportHelper):
     """ This Operator to show an error that the ATP Override is missing from export
     """
-    bl_idname = "metaverse_toolset.export_gltb_json"
+    bl_idname = "metaverse_toolset.export_fbx_json"
     bl_label = "Export HiFi Scene"
     bl_options = {'UNDO'}
+    job_label = "Exporting HiFi Scene"
 
-    filename_ext = ".hifi.json"
-
-    directory: StringProperty()
-    filter_glob: StringProperty(default="*.hifi.json", options={'HIDDEN'})
-
-    atp: BoolProperty(default=False, name="Use ATP / Upload to domain",
-                      description="Use ATP instead of Marketplace / upload assets to domain")
-    use_folder: BoolProperty(default=True, name="Use Folder",
-                             description="Upload Files as a folder instead of individually")
-
-    url_override: StringProperty(default="", name="Marketplace / Base Url",
-                                 description="Set Marketplace / URL Path here to override")
-    clone_scene: BoolProperty(default=False, name="Clone Scene prior to export", description="Clones the scene and performs the automated export functions on the clone instead of the original. " +
-                              "WARNING: instancing will not work, and ids will no longer be the same, for future features.")
-    remove_trailing: BoolProperty(
-        default=False, name="Remove Trailing .### from names")
-
-    def draw(self, context):
-        layout = self.layout
+    def draw_writer_options(self, layout):
+        layout.prop(self, "use_data_api")
+        layout.prop(self, "parallel_write")
+        if self.parallel_write:
+            layout.prop(self, "write_threads")
 
-        layout.prop(self, "atp")
+    def job(self, context):
+        return write_file_job(self)
 
-        if not self.atp:
-            layout.label(
-                text="Url Override: Add Marketplace / URL to make sure that the content can be reached.")
-            layout.prop(self, "url_override")
-        else:
-            layout.prop(self, "use_folder")
-
-        layout.label(
-            text="Clone scene: Performs automated actions on a cloned scene instead of the original.")
-        layout.prop(self, "clone_scene")
-        layout.prop(self, "remove_trailing")
-
-    def execute(self, context):
-        if not self.filepath:
-            raise Exception("filepath not set")
-
-        if not self.url_override and not self.atp:
-            
-            bpy.ops.metaverse_toolset_messages.export_missing_atp_override('INVOKE_DEFAULT')
-            return {'CANCELLED'}
-           # raise Exception("You must Use ATP or Set the Marketplace / base URL to make sure that the content can be reached after you upload it. ATP currently not supported")
-
-        write_file(self, True)
+class EXPORT_OT_MVT_TOOLSET_Writer_GLTF_JSON(JobOperator, bpy.types.Operator, HifiSceneExportHelper):
+    """ This Operator to show an error that the ATP Override is missing from export
+    """
+    bl_idname = "metaverse_toolset.export_gltb_json"
+    bl_label = "Export HiFi Scene"
+    bl_options = {'UNDO'}
+    job_label = "Exporting HiFi Scene"
 
-        return {'FINISHED'}
+    def job(self, context):
+        return write_file_job(self, True)
 
 
 
-class IMPORT_OT_MVT_TOOLSET_Scene_From_JSON(bpy.types.Operator, ImportHelper):
+class IMPORT_OT_MVT_TOOLSET_Scene_From_JSON(JobOperator, bpy.types.Operator, ImportHelper):
     """ Import a metaverse_toolset.json.svo scene into Blender. Works only for Primitives for now.
     """
     # Load a Hifi File
     bl_idname = "metaverse_toolset.import_scene_from_json"
     bl_label = "Import Hifi Json"
     bl_options = {"UNDO", "PRESET"}
+    job_label = "Importing Hifi Json"
 
     directory: StringProperty()
 
     filename_ext = ".json"
-    filter_glob: StringProperty(default="*.json", options={'HIDDEN'})
+    filter_glob: StringProperty(default="*.json;*.json.gz", options={'HIDDEN'})
 
     uv_sphere: BoolProperty(
         name="Use UV Sphere",
@@ -225,6 +240,29 @@ class IMPORT_OT_MVT_TOOLSET_Scene_From_JSON(bpy.types.Operator, ImportHelper):
         description="EXPERIMENTAL: Enable Boolean Operation when joining parents",
     )
 
+    link_instances: BoolProperty(
+        name="Link Shared Meshes",
+        description="Entities with the same shape and material share a single mesh, and only differ by their transform. "
+                    "Children are parented instead of joined",
+        default=False,
+    )
+
+    material_mode: EnumProperty(
+        items=(('COLOR', "Per Color", "A material for each unique color"),
+               ('PALETTE', "Palette", "Similar colors are quantized into buckets that share a material"),
+               ('VERTEX_COLOR', "Vertex Colors", "A single material for everything, with the color of each entity in the vertex colors of its mesh")),
+        name="Materials",
+        description="How the colors of the entities are turned into materials",
+        default='COLOR',
+    )
+
+    palette_buckets: IntProperty(
+        name="Palette Buckets",
+        description="Number of buckets per color channel for the palette. Fewer buckets merge more colors together",
+        min=2, max=256,
+        default=16,
+    )
+
     def draw(self, context):
         layout = self.layout
 
@@ -237,8 +275,15 @@ class IMPORT_OT_MVT_TOOLSET_Scene_From_JSON(bpy.types.Operator, ImportHelper):
 
         sub.prop(self, "delete_interior_faces")
         sub.prop(self, "use_boolean_operation")
-        sub.prop(self, "use_gltf")
+        sub.prop(self, "link_instances")
+
+        sub.prop(self, "material_mode")
+        if self.material_mode == 'PALETTE':
+            sub.prop(self, "palette_buckets")
 
     def execute(self, context):
+        return self.start_job(context)
+
+    def job(self, context):
         keywords = self.as_keywords(ignore=("filter_glob", "directory"))
-        return load_file(self, context, **keywords)
+        return load_file_job(self, context, **keywords)
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Pool for writing FBX files in the background while the scene exporter continues with the next object.
+# The FBX element tree is built on the main thread, as it needs access to Blender data. Its arrays are only copied
+# into the tree there, and the zlib compression of the arrays, the binary encoding and the file write are done
+# by the workers (see mod_encode_bin).
+# Worker threads are used over processes, as the tree would have to be pickled over to a process that cannot import
+# io_scene_fbx, while zlib compression, by far the heaviest part, and the file io release the GIL.
+
+import os
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from metaverse_tools.ext.modified_fbx_tools import mod_encode_bin
+from metaverse_tools.utils.logger import get_logger
+
+log = get_logger(__name__)
+
+
+class FBXWriterPool:
+    def __init__(self, workers=0):
+        if workers < 1:
+            workers = os.cpu_count() or 1
+
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self.pending = []
+        # filepath -> future of the latest write to it
+        self.futures = {}
+
+    # Matches the encoder signature of mod_export_fbx_bin.save_single
+    def submit(self, filepath, root, version):
+        future = self.executor.submit(mod_encode_bin.write, filepath, root, version)
+        self.pending.append((filepath, future))
+        self.futures[os.path.normpath(filepath)] = future
+        return future
+
+    # True if the file is not being written by the pool, or has been written successfully
+    def is_finished(self, filepath):
+        future = self.futures.get(os.path.normpath(filepath))
+        if future is None:
+            return True
+
+        return future.done() and future.exception() is None
+
+    # Waits for all files to be written, in the order they were submitted.
+    # Returns the list of (filepath, exception) that failed to write
+    def wait(self):
+        failed = []
+        for filepath, future in self.pending:
+            exception = future.exception()
+            if exception is not None:
+                log.error("Could not write %s %s", filepath, exception)
+                failed.append((filepath, exception))
+
+        self.pending = []
+        self.executor.shutdown(wait=True)
+        return failed
+
+    # Waits up to timeout seconds for any of the files to be written. Returns the number still being written
+    def wait_some(self, timeout):
+        running = [future for filepath, future in self.pending if not future.done()]
+        if len(running) == 0:
+            return 0
+
+        done, not_done = wait(running, timeout=timeout, return_when=FIRST_COMPLETED)
+        return len(not_done)
+
+    # Drops the files that have not started writing yet, and waits for the ones being written
+    def cancel(self):
+        for filepath, future in self.pending:
+            future.cancel()
+
+        self.pending = []
+        self.executor.shutdown(wait=True)
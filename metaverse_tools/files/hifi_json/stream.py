@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Incremental writer and reader for hifi scene json files.
+# Entities are written to the file as soon as they are parsed, and read back one at a time,
+# so that the whole scene never has to be kept in memory.
+
+import io
+import os
+import gzip
+import json
+
+GZIP_EXTENSION = ".gz"
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Characters of text decoded from the file at a time
+CHUNK_SIZE = 1 << 20
+WHITESPACE = ' \t\r\n'
+NUMBER_CHARACTERS = '0123456789+-.eE'
+
+
+def stream_filepath(filepath, use_gzip=False):
+    if use_gzip and not filepath.endswith(GZIP_EXTENSION):
+        return filepath + GZIP_EXTENSION
+    return filepath
+
+
+class HifiJSONStreamWriter:
+    def __init__(self, filepath, version, compact=False, use_gzip=False):
+        self.filepath = stream_filepath(filepath, use_gzip)
+        self.compact = compact
+        self.count = 0
+
+        if use_gzip:
+            self.file = gzip.open(self.filepath, "wt", encoding="utf-8")
+        else:
+            self.file = open(self.filepath, "w", encoding="utf-8")
+
+        if compact:
+            self.file.write('{"Version":' + str(version) + ',"Entities":[')
+        else:
+            self.file.write('{\n    "Version": ' + str(version) + ',\n    "Entities": [')
+
+    def write(self, entity):
+        if self.count > 0:
+            self.file.write(',')
+
+        if self.compact:
+            self.file.write(json.dumps(entity, separators=(',', ':')))
+        else:
+            # Indent to match the nesting of the entity within the Entities list
+            data = json.dumps(entity, indent=4)
+            self.file.write('\n        ' + data.replace('\n', '\n        '))
+
+        self.count += 1
+
+    def close(self):
+        if self.compact:
+            self.file.write(']}')
+        elif self.count > 0:
+            self.file.write('\n    ]\n}')
+        else:
+            self.file.write(']\n}')
+
+        self.file.close()
+
+
+# Reads the entities of a hifi scene json file one at a time, with only a chunk of the file in memory.
+# Gzipped files are detected by their header, whatever their extension is.
+# Top level values other than the entities, such as the Version, end up in header.
+class HifiJSONStreamReader:
+    def __init__(self, filepath, chunk_size=CHUNK_SIZE):
+        self.filepath = filepath
+        self.chunk_size = chunk_size
+
+        self.raw = open(filepath, "rb")
+        self.size = os.fstat(self.raw.fileno()).st_size
+        binary = self.raw
+        if self.raw.read(2) == GZIP_MAGIC:
+            binary = gzip.GzipFile(fileobj=self.raw, mode="rb")
+        self.raw.seek(0)
+
+        self.file = io.TextIOWrapper(binary, encoding="utf-8-sig")
+        self.decoder = json.JSONDecoder()
+
+        self.buffer = ""
+        self.position = 0
+        self.eof = False
+        self.header = {}
+        self.count = 0
+
+    # Share of the file read so far, from 0 to 1. Measured on the file on disk, so gzipped files are counted compressed.
+    @property
+    def progress(self):
+        if self.size == 0:
+            return 1.0
+        return min(self.raw.tell() / self.size, 1.0)
+
+    # Drops the consumed part of the buffer and appends the next chunk. Returns False at the end of the file.
+    def fill(self):
+        if self.eof:
+            return False
+
+        chunk = self.file.read(self.chunk_size)
+        if len(chunk) == 0:
+            self.eof = True
+            return False
+
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
+
+    def peek(self):
+        while True:
+            while self.position < len(self.buffer) and self.buffer[self.position] in WHITESPACE:
+                self.position += 1
+
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+
+            if not self.fill():
+                return ""
+
+    def expect(self, character):
+        found = self.peek()
+        if found != character:
+            raise ValueError("Expected '%s' but found '%s' in %s" % (character, found, self.filepath))
+        self.position += 1
+
+    # Decodes the next value, reading more of the file until it is complete
+    def decode(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except ValueError:
+                if not self.fill():
+                    raise
+                continue
+
+            # A number at the end of the buffer may continue in the next chunk, even if the part read so far
+            # ends with something that is a number on its own, such as the 0 of 0.5
+            tail = end
+            while tail < len(self.buffer) and self.buffer[tail] in NUMBER_CHARACTERS:
+                tail += 1
+            if tail == len(self.buffer) and self.fill():
+                continue
+
+            self.position = end
+            return value
+
+    def array(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.position += 1
+            return
+
+        while True:
+            yield self.decode()
+            self.count += 1
+
+            if self.peek() != ',':
+                break
+            self.position += 1
+
+        self.expect(']')
+
+    # Generator of the entities of the file, in the order of the file
+    def entities(self):
+        self.expect('{')
+        if self.peek() == '}':
+            self.position += 1
+            return
+
+        while True:
+            key = self.decode()
+            self.expect(':')
+
+            if key == 'Entities':
+                yield from self.array()
+            else:
+                self.header[key] = self.decode()
+
+            if self.peek() != ',':
+                break
+            self.position += 1
+
+        self.expect('}')
+
+    def close(self):
+        self.file.close()
+        self.raw.close()
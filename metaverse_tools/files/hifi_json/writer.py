@@ -24,30 +24,31 @@ import re
 import os
 import json
 
-from mathutils import Quaternion
+from mathutils import Quaternion, Vector, Matrix
 from math import sqrt
 from hashlib import md5, sha256
 from copy import copy, deepcopy
 
 from metaverse_tools.utils.helpers.extra_math import *
+from metaverse_tools.utils.helpers.bounds import local_bounds, bounds_center, bounds_dimensions
+from metaverse_tools.utils.logger import get_logger
+from metaverse_tools.utils.profiler import ExportProfiler
+from metaverse_tools.utils.staging import ExportStaging
+from metaverse_tools.utils.job import run_job
+from metaverse_tools.files.hifi_json.cache import MeshCache, hash_evaluated_mesh
+from metaverse_tools.files.hifi_json.pool import FBXWriterPool
+from metaverse_tools.files.hifi_json.stream import HifiJSONStreamWriter, stream_filepath
+from metaverse_tools.files.hifi_json.manifest import ExportManifest, object_signature, read_scene_entities, LIGHT_TYPE
+from metaverse_tools.files.hifi_json.glb import GLBSceneWriter, GLB_EXTENSION
+from metaverse_tools.files.hifi_json.lod import lod_ratios, lod_name, lod_digest, decimated_objects
+from metaverse_tools.files.hifi_json.batch import is_batchable, cluster_objects, batch_digest, write_batch, batch_entity
+from metaverse_tools.ext.modified_fbx_tools import mod_export_fbx_bin
 
 EXPORT_VERSION = 85
+FBX_EXTENSION = ".fbx"
+BATCH_JOURNAL_PREFIX = "batch:"
 
-def center_all(blender_object):
-    for child in blender_object.children:
-        select(child)
-            
-    blender_object.select_set(state=True)
-    bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY', center='BOUNDS')
-    
-    blender_object.select_set(state=False)   
-
-
-def select(blender_object):
-    for child in blender_object.children:
-        select(child)            
-                
-    blender_object.select_set(state=True)
+log = get_logger(__name__)
 
 # Can't use name to define the unique id as this is not shared between instancing, instead going to go through 
 # Each modifier in order and hope the order is the same
@@ -55,13 +56,12 @@ def select(blender_object):
 def generate_unique_id_modifier(modifiers):
     unique_name = ""
     for index, modifier in enumerate(modifiers):
-        print(str(index), "Iterating", modifier.name, modifier.type)
+        log.debug("%d Iterating %s %s", index, modifier.name, modifier.type)
         # for use only 
         old_unique = unique_name + "|name>" + modifier.name
        
         unique_name = unique_name + "|" + str(index) + "|m:" + modifier.type
         if modifier.type == 'EDGE_SPLIT':
-            print("Edge split")
             unique_name = unique_name + "|sa:" + str(modifier.split_angle)
             if modifier.use_apply_on_spline:
                 unique_name = unique_name + "|uaos"
@@ -70,7 +70,6 @@ def generate_unique_id_modifier(modifiers):
             if modifier.use_edge_sharp:
                 unique_name = unique_name + "|us"
         elif modifier.type == 'MIRROR':
-            print("Mirror")
             if modifier.mirror_object:
                 unique_name = unique_name + '|m:' + modifier.mirror_object.name      
             if modifier.use_x:
@@ -90,8 +89,6 @@ def generate_unique_id_modifier(modifiers):
             if modifier.use_mirror_merge:
                 unique_name = unique_name + "|mm:" + str(modifier.merge_threshold)
         elif modifier.type == 'ARRAY':
-
-            print("Array")
             if modifier.fit_type == 'FIXED_COUNT':
                 unique_name = unique_name + '|c:' + str(modifier.count)
             if modifier.fit_type == 'FIT_LENGTH':
@@ -116,9 +113,9 @@ def generate_unique_id_modifier(modifiers):
         else:
             # TODO: Add Support to subsurface / solidify
             unique_name = old_unique
-            print( 'Unsupported modifier ', modifier.name, modifier.type, ' Skipping')
+            log.warning("Unsupported modifier %s %s, Skipping", modifier.name, modifier.type)
     
-    print(unique_name)
+    log.debug("Modifier fingerprint %s", unique_name)
     return str(uuid.uuid5(uuid.NAMESPACE_DNS, unique_name))
 
 
@@ -128,14 +125,17 @@ def apply_all_modifiers(modifiers):
         if modifier.type != 'ARMATURE':
             bpy.ops.object.modifier_apply( modifier=modifier.name)
 
-def set_relative_to_parent(blender_object, json_data):
+# The offset moves the entity away from the origin of the object, in the space of its parent
+def set_relative_to_parent(blender_object, json_data, transforms=None, offset=None):
     if blender_object.parent:
         parent = blender_object.parent
         
         parent_uuid = uuid.uuid5(uuid.NAMESPACE_DNS, parent.name)
+
+        if transforms is None:
+            transforms = TransformResolver()
         
-        parent_orientation = quat_swap_nzy(relative_rotation(blender_object))
-        parent_position = swap_nzy(relative_position(blender_object))
+        parent_position, parent_orientation = transforms.hifi_relative(blender_object, offset)
         
         json_data["position"] = {
             'x': parent_position.x,
@@ -155,7 +155,333 @@ def set_relative_to_parent(blender_object, json_data):
     return json_data
         
 
-def parse_object(blender_object, path, options, gltf):  
+# Keeps track of the models of a single scene export.
+# Objects are grouped by the hash of their evaluated mesh prior to export,
+# so that each unique geometry is written only once and the rest of the instances just refer to it.
+class ExportSession:
+    def __init__(self, path, cache=None, pool=None, profiler=None, gltf=False, write_path=None, use_data_api=True):
+        self.path = path
+        # Write models from the evaluated objects, without operators or touching the scene
+        self.use_data_api = use_data_api
+        # Folder the model files are written to, if they are staged somewhere else prior to publishing
+        self.write_path = write_path if write_path is not None else path
+        self.cache = cache
+        self.pool = pool
+        self.profiler = profiler if profiler is not None else ExportProfiler()
+        self.extension = GLB_EXTENSION if gltf else FBX_EXTENSION
+        self.glb = GLBSceneWriter(self.write_path) if gltf else None
+        # object name -> model name
+        self.models = {}
+        # model name -> names of objects using it
+        self.instances = {}
+        # model names that have already been written or validated during this export
+        self.written = set()
+        # model name -> hash of the evaluated mesh
+        self.hashes = {}
+        # hash of the evaluated mesh -> model name
+        self.names = {}
+        # mesh name -> hash of the mesh, for objects that evaluate to their mesh as is
+        self.data_hashes = {}
+        # model name -> file the model was written to, if it differs from the model name
+        self.files = {}
+        # model name -> [(lod file, ratio)]
+        self.lods = {}
+        self.transforms = TransformResolver()
+
+    def model_name(self, blender_object):
+        if blender_object.name in self.models:
+            return self.models[blender_object.name]
+
+        # Objects only share a model if their evaluated meshes match. The modifier fingerprint in the name
+        # does not cover the settings of every modifier, so a name taken by other geometry gets the hash appended.
+        mesh_hash = self.object_hash(blender_object)
+        model_name = self.names.get(mesh_hash)
+        if model_name is None:
+            uid = ""
+            if len(blender_object.modifiers) > 0:
+                uid = "-" + generate_unique_id_modifier(blender_object.modifiers)
+
+            model_name = blender_object.data.name + uid
+            if model_name in self.hashes:
+                model_name = model_name + "-" + mesh_hash[:8]
+
+            self.names[mesh_hash] = model_name
+            self.hashes[model_name] = mesh_hash
+
+        self.models[blender_object.name] = model_name
+        self.instances.setdefault(model_name, []).append(blender_object.name)
+        return model_name
+
+    def group_instances(self, blender_objects):
+        for blender_object in blender_objects:
+            if blender_object.type == 'MESH':
+                self.model_name(blender_object)
+
+        log.info("Found %d unique models for %d mesh objects", len(self.instances), len(self.models))
+        return self.instances
+
+    def object_hash(self, blender_object):
+        # Without modifiers or materials linked to the object, every user of the mesh evaluates to the same geometry
+        as_is = len(blender_object.modifiers) == 0 and all(slot.link == 'DATA' for slot in blender_object.material_slots)
+        if as_is and blender_object.data.name in self.data_hashes:
+            return self.data_hashes[blender_object.data.name]
+
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        with self.profiler.phase("mesh_hash", blender_object.name):
+            mesh_hash = hash_evaluated_mesh(blender_object, depsgraph)
+
+        if as_is:
+            self.data_hashes[blender_object.data.name] = mesh_hash
+        return mesh_hash
+
+    def mesh_hash(self, blender_object):
+        return self.hashes[self.model_name(blender_object)]
+
+    def signature(self, blender_object):
+        if blender_object.type == 'MESH':
+            return object_signature(blender_object, self.model_name(blender_object), self.mesh_hash(blender_object))
+
+        return object_signature(blender_object)
+
+    def is_written(self, model_name):
+        return model_name in self.written
+
+    def mark_written(self, model_name, file_name=None):
+        self.written.add(model_name)
+        if file_name is not None and file_name != model_name + self.extension:
+            self.files[model_name] = file_name
+
+    def model_file(self, model_name):
+        return self.files.get(model_name, model_name + self.extension)
+
+
+def write_model(blender_object, file_path, options, pool=None, profiler=None, center=None):
+    if profiler is None:
+        profiler = ExportProfiler()
+
+    # Temporarily move the geometry so that the origin is at the center of its bounds, like origin_set would,
+    # and move it back after the write so the object is left as it was.
+    with profiler.phase("origin_set", blender_object.name):
+        if center is None:
+            center = bounds_center(*local_bounds(blender_object, bpy.context.evaluated_depsgraph_get()))
+
+        temp_location = Vector(blender_object.location)
+        blender_object.location = temp_location + blender_object.matrix_basis.to_3x3() @ center
+        blender_object.data.transform(Matrix.Translation(-center), shape_keys=True)
+
+    temp_rotation = Quaternion(blender_object.rotation_quaternion)
+    # Temporary Rotate Model to a zero rotation so that the exported model rotation is normalized.
+    blender_object.rotation_quaternion = Quaternion((1,0,0,0))
+
+    try:
+        # TODO: Add Option to not embedtextures / copy paths
+        log.debug("Writing FBX %s", file_path)
+        with profiler.phase("fbx_write", blender_object.name):
+            if pool is None:
+                bpy.ops.metaverse_toolset.export_scene_fbx(filepath=file_path, embed_textures=True, path_mode='COPY', use_selection=True, axis_forward='-Z', axis_up='Y')
+            else:
+                # Elements are built here, while the pool encodes and writes them to disk
+                mod_export_fbx_bin.save_objects(options, bpy.context, file_path, [blender_object], encoder=pool.submit,
+                                                embed_textures=True, path_mode='COPY', axis_forward='-Z', axis_up='Y')
+    finally:
+        # Restore earlier rotation and origin
+        blender_object.rotation_quaternion = temp_rotation
+        blender_object.data.transform(Matrix.Translation(center), shape_keys=True)
+        blender_object.location = temp_location
+
+
+# Writes the model straight from the evaluated object, without operators, selection or changing the active object.
+# Modifiers are applied through the depsgraph into a temporary mesh which is centered to the bounds of the geometry.
+# The temporary object is never linked into the scene, as linking and removing it would rebuild the relations of
+# the depsgraph for every model, so its transform is set through matrix_world.
+def write_model_data(blender_object, file_path, options, pool=None, profiler=None, center=None, depsgraph=None):
+    if profiler is None:
+        profiler = ExportProfiler()
+
+    if depsgraph is None:
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+    evaluated = blender_object.evaluated_get(depsgraph)
+
+    with profiler.phase("modifier_apply", blender_object.name):
+        mesh = bpy.data.meshes.new_from_object(evaluated)
+
+    with profiler.phase("origin_set", blender_object.name):
+        if center is None:
+            center = bounds_center(*local_bounds(blender_object, depsgraph))
+        mesh.transform(Matrix.Translation(-center))
+
+    temp_object = bpy.data.objects.new(blender_object.name + "-export", mesh)
+    temp_object.matrix_world = (Matrix.Translation(blender_object.matrix_world @ center) @
+                                Matrix.Diagonal(blender_object.matrix_world.to_scale()).to_4x4())
+
+    # Object linked materials are not part of the mesh, so carry them over.
+    for index, material_slot in enumerate(blender_object.material_slots):
+        if material_slot.link == 'OBJECT' and index < len(temp_object.material_slots):
+            temp_object.material_slots[index].link = 'OBJECT'
+            temp_object.material_slots[index].material = material_slot.material
+
+    try:
+        log.debug("Writing FBX from data %s", file_path)
+        encoder = None
+        if pool is not None:
+            encoder = pool.submit
+
+        with profiler.phase("fbx_write", blender_object.name):
+            mod_export_fbx_bin.save_objects(options, bpy.context, file_path, [temp_object], encoder=encoder,
+                                            use_mesh_modifiers=False, embed_textures=True, path_mode='COPY',
+                                            axis_forward='-Z', axis_up='Y', depsgraph=depsgraph)
+    finally:
+        bpy.data.objects.remove(temp_object)
+        bpy.data.meshes.remove(mesh)
+
+
+# Writes the decimated variants of the model. Variants whose source mesh has not changed are reused from the cache,
+# the rest are decimated together.
+def write_lods(blender_object, model_name, mesh_hash, path, options, session, depsgraph=None):
+    if model_name in session.lods:
+        return session.lods[model_name]
+
+    # level -> (file, ratio)
+    lods = {}
+    # (level, ratio, digest) of the variants to write
+    stale = []
+    for level, ratio in enumerate(lod_ratios(options.lod_levels, options.lod_reduction), 1):
+        lod_file = lod_name(model_name, level) + session.extension
+
+        digest = None
+        if session.cache is not None and mesh_hash is not None:
+            digest = lod_digest(mesh_hash, ratio)
+            if session.cache.is_valid(lod_file, digest):
+                lods[level] = (lod_file, ratio)
+                continue
+
+        stale.append((level, ratio, digest))
+
+    if len(stale) > 0:
+        if depsgraph is None:
+            depsgraph = bpy.context.evaluated_depsgraph_get()
+
+        ratios = [ratio for level, ratio, digest in stale]
+        with session.profiler.phase("lod_write", model_name), \
+                decimated_objects(blender_object, depsgraph, ratios) as lod_objects:
+            for (level, ratio, digest), lod_object in zip(stale, lod_objects):
+                name = lod_name(model_name, level)
+                lod_file = name + session.extension
+
+                if session.glb is not None:
+                    lod_file = session.glb.write(lod_object, depsgraph, name)
+                else:
+                    write_model_data(lod_object, session.write_path + lod_file, options, session.pool,
+                                     session.profiler, depsgraph=depsgraph)
+
+                if digest is not None and lod_file == name + session.extension:
+                    session.cache.store(lod_file, digest)
+
+                session.mark_written(name, lod_file)
+                lods[level] = (lod_file, ratio)
+
+    lods = [lods[level] for level in sorted(lods)]
+    session.lods[model_name] = lods
+    return lods
+
+
+def get_model_url(path, options, model_file):
+    if options.atp:
+        if options.use_folder:
+            last_folder_re = re.search(r"(?:=\/|\\)?([a-zA-Z0-9_\-]+)(?:\/|\\)?$", path)
+            start = last_folder_re.start(0)+1
+            end = last_folder_re.end(0)
+
+            last_folder = path[start:end]
+        else:
+            last_folder = ""
+
+        return "atp:/"+ last_folder + model_file
+
+    return options.url_override + model_file
+
+
+# Writes the static mesh batches, each as a single model with a single entity.
+# Batches are added to pending, to be journaled once the pool has written their files.
+# Yields the share of the batches written after each batch
+def write_batches(batches, path, options, session, scene_writer, staging=None, pending=None):
+    for index, batch in enumerate(batches):
+        model_file = batch.name + session.extension
+        digest = batch_digest(batch, session)
+
+        completed = staging.completed(BATCH_JOURNAL_PREFIX + batch.name) if staging is not None else None
+        if completed is not None and completed['digest'] == digest and staging.has_file(completed['file']):
+            log.debug("Batch %s completed by an earlier run", batch.name)
+            model_file = completed['file']
+        elif session.cache is not None and session.cache.is_valid(model_file, digest):
+            log.debug("Reusing batch %s", batch.name)
+        else:
+            with session.profiler.phase("batch_write", batch.name):
+                model_file = write_batch(batch, session.write_path, options, session)
+
+            if session.cache is not None and model_file == batch.name + session.extension:
+                session.cache.store(model_file, digest)
+
+        session.mark_written(batch.name, model_file)
+        scene_writer.write(batch_entity(batch, get_model_url(path, options, model_file)))
+
+        if pending is not None:
+            pending.append((BATCH_JOURNAL_PREFIX + batch.name, {'digest': digest, 'file': model_file}, [model_file]))
+
+        yield (index + 1) / len(batches)
+
+
+# Journal entry of a parsed object, with the model files it needs
+def journal_entry(blender_object, signature, parsed, session):
+    entry = {'signature': signature, 'entity': parsed, 'models': {}, 'lods': None}
+
+    model_name = signature['model']
+    if model_name is not None:
+        entry['models'][model_name] = session.model_file(model_name)
+        if model_name in session.lods:
+            entry['lods'] = session.lods[model_name]
+
+    return entry
+
+
+def journal_files(entry):
+    files = list(entry['models'].values())
+    if entry['lods'] is not None:
+        files.extend(lod_file for lod_file, ratio in entry['lods'])
+    return files
+
+
+# Objects completed by an earlier failed run are reused, if they have not changed and their files are still there
+def resume_entry(staging, blender_object, signature, session):
+    entry = staging.completed(blender_object.name)
+    if entry is None or entry['signature'] != signature:
+        return None
+
+    if not all(staging.has_file(filename) for filename in journal_files(entry)):
+        return None
+
+    for model_name, model_file in entry['models'].items():
+        session.mark_written(model_name, model_file)
+        if entry['lods'] is not None:
+            session.lods[model_name] = [tuple(lod) for lod in entry['lods']]
+
+    return entry
+
+
+# Journals the (key, entry, files) whose files have been written by the pool.
+# Returns the entries that are still waiting, or whose files failed to write.
+def journal_finished(staging, pending, pool):
+    waiting = []
+    for key, entry, files in pending:
+        if pool is None or all(pool.is_finished(staging.filepath(filename)) for filename in files):
+            staging.complete(key, entry)
+        else:
+            waiting.append((key, entry, files))
+
+    return waiting
+
+
+def parse_object(blender_object, path, options, gltf, session=None):  
     # Store existing rotation mode, just in case.
     json_data = None
     # Make sure context is quaternion for the models
@@ -169,20 +495,41 @@ def parse_object(blender_object, path, options, gltf):
     scene_id = str(uuid_gen)
     
     bo_type = blender_object.type
-    
-    stored_rotation_mode = str(blender_object.rotation_mode)
-    blender_object.rotation_mode = 'QUATERNION'
-    orientation = quat_swap_nzy(blender_object.rotation_quaternion) 
-    position = swap_nzy(blender_object.location)
-    
+
+    if session is None:
+        session = ExportSession(path, use_data_api=options.use_data_api)
+
+    stored_rotation_mode = None
+    if session.use_data_api:
+        # Read through the matrix, so the rotation mode of the object does not have to be changed
+        position, orientation = session.transforms.hifi_local(blender_object)
+    else:
+        stored_rotation_mode = str(blender_object.rotation_mode)
+        blender_object.rotation_mode = 'QUATERNION'
+        orientation = quat_swap_nzy(blender_object.rotation_quaternion) 
+        position = swap_nzy(blender_object.location)
+
     if bo_type == 'MESH':  
         original_object = None
-        blender_object.select_set(state=True)      
-        uid = ""
-        reference_name = blender_object.data.name
+        if not session.use_data_api:
+            blender_object.select_set(state=True)      
+        model_name = session.model_name(blender_object)
+
+        # Instances of an already written model, or models that have not changed since the last export, are reused
+        digest = None
+        cached = session.is_written(model_name)
+        if not cached and session.cache is not None:
+            digest = session.mesh_hash(blender_object)
+            cached = session.cache.is_valid(session.model_file(model_name), digest)
+
         # TODO: If Child of armature, skip logic
         # Here comes the fun part: Apply all modifiers prior to using them in the instance
-        if len(blender_object.modifiers) > 0: 
+        if cached:
+            log.debug("Reusing model %s for %s", model_name, name)
+        elif session.use_data_api or gltf:
+            # Modifiers are evaluated when writing, and dimensions already come from the evaluated object
+            pass
+        elif len(blender_object.modifiers) > 0: 
             # Lets do a LOW-LEVEL duplicate, too much automation in duplicate         
             clone = blender_object.copy()
             original_object = blender_object
@@ -191,66 +538,49 @@ def parse_object(blender_object, path, options, gltf):
             clone.select_set(state=True)
             original_object.select_set(state=False)
             
-            uid = "-" + generate_unique_id_modifier(clone.modifiers)
             bpy.context.view_layer.objects.active = clone
-            apply_all_modifiers(clone.modifiers)
+            with session.profiler.phase("modifier_apply", name):
+                apply_all_modifiers(clone.modifiers)
             blender_object = clone
 
             clone.select_set(state=True)
 
-        #temp_dimensions = Vector(blender_object.dimensions)
-        dimensions = swap_yz(blender_object.dimensions)
-        
-        bpy.ops.object.origin_set(type='ORIGIN_GEOMETRY', center='BOUNDS')
-
-        print("Storing existing rotation")
-        temp_rotation = Quaternion(blender_object.rotation_quaternion)
-        # Temporary Rotate Model to a zero rotation so that the exported model rotation is normalized.
-        blender_object.rotation_quaternion = Quaternion((1,0,0,0))
-        
-        #blender_object.dimensions = Vector((1,1,1))
-
-        # TODO: Option to also export via gltf instead of fbx
-        # TODO: Add Option to not embedtextures / copy paths
-
-
-        #
-        if gltf:
-            file_path = path + reference_name + uid 
-            print("Writing GLTF with path_mode=", file_path)
-            #bpy.ops.metaverse_toolset.export_scene_fbx(filepath=file_path, embed_textures=True, path_mode='COPY', use_selection=True, axis_forward='-Z', axis_up='Y')
-            # TODO: Add gltf option HERE.
-            return False
+        # Models are written centered to their bounds, so the entity is placed at the center of bounds as well
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        with session.profiler.phase("bounds", name):
+            minimum, maximum = local_bounds(blender_object, depsgraph)
+        center = bounds_center(minimum, maximum)
+        dimensions = swap_yz(bounds_dimensions(blender_object, minimum, maximum))
+        center_offset = blender_object.matrix_basis.to_3x3() @ center
+        position = swap_nzy(blender_object.location + center_offset)
 
-        else:
-            file_path = path + reference_name + uid + ".fbx"
-            print("Writing FBX with path_mode=", file_path)
-            bpy.ops.metaverse_toolset.export_scene_fbx(filepath=file_path, embed_textures=True, path_mode='COPY', use_selection=True, axis_forward='-Z', axis_up='Y')
-
-        # Restore earlier rotation
-        # blender_object.dimensions = temp_dimensions
-        blender_object.rotation_quaternion = temp_rotation      
-             
-        if options.atp:
-            if options.use_folder:
-                last_folder_re = re.search(r"(?:=\/|\\)?([a-zA-Z0-9_\-]+)(?:\/|\\)?$", path)
-                start = last_folder_re.start(0)+1
-                end = last_folder_re.end(0)
-
-                last_folder = path[start:end]
-            else:
-                last_folder = ""               
-            
+        model_file = session.model_file(model_name)
+        if not cached:
             if gltf:
-                print("GLTF PLACEHOLDER")
+                log.debug("Writing GLB %s", session.write_path + model_file)
+                with session.profiler.phase("glb_write", name):
+                    model_file = session.glb.write(blender_object, depsgraph, model_name)
+            elif session.use_data_api:
+                write_model_data(blender_object, session.write_path + model_file, options, session.pool, session.profiler, center,
+                                 depsgraph)
             else:
-                model_url = "atp:/"+ last_folder + reference_name + uid + '.fbx'
-        else:
-            if gltf:
-                print("GLTF PLACEHOLDER")
-            else:
-                model_url = options.url_override + reference_name +  uid + '.fbx'
+                write_model(blender_object, session.write_path + model_file, options, session.pool, session.profiler, center)
+
+            # Models deduplicated into the file of another model are not cached under their own name
+            if digest is not None and model_file == model_name + session.extension:
+                session.cache.store(model_file, digest)
+
+        session.mark_written(model_name, model_file)
+        model_url = get_model_url(path, options, model_file)
 
+        user_data = '{"blender_export":"' + scene_id +'"}'
+        if options.generate_lods:
+            lods = write_lods(blender_object, model_name, digest, path, options, session,
+                              depsgraph if session.use_data_api else None)
+            user_data = json.dumps({
+                'blender_export': scene_id,
+                'lods': [{'url': get_model_url(path, options, lod_file), 'ratio': ratio} for lod_file, ratio in lods]
+            })
 
         json_data = {
             'name': name,
@@ -279,18 +609,18 @@ def parse_object(blender_object, path, options, gltf):
                 'cloneable': False
             },
             "shapeType": "static-mesh",
-            'userData': '{"blender_export":"' + scene_id +'"}'
+            'userData': user_data
         }         
         
-        json_data = set_relative_to_parent(blender_object, json_data)
+        json_data = set_relative_to_parent(blender_object, json_data, session.transforms, center_offset)
 
         if original_object:
             bpy.ops.object.delete()
             blender_object = original_object
             blender_object.select_set(state=True)
             
-    elif bo_type == 'LAMP':
-        print(name, 'is Light')
+    elif bo_type == LIGHT_TYPE:
+        log.debug("%s is Light", name)
         
         # Hifi 5, Blender 3.3 ????
         light = blender_object.data
@@ -335,10 +665,10 @@ def parse_object(blender_object, path, options, gltf):
         # TODO: Spot Lights require rotation by 90 degrees to get pointing in the right direction        
     elif bo_type == 'ARMATURE': # Same as Mesh actually.
         # Get all children export as a single file.
-        print(name, 'is armature. Not Supported as of the moment')
+        log.warning("%s is armature. Not Supported as of the moment", name)
 
     elif bo_type == 'EMPTY':
-        print(name, 'Adding an Empty')
+        log.debug("%s Adding an Empty", name)
 
         json_data = { 
             'id': scene_id,
@@ -366,56 +696,181 @@ def parse_object(blender_object, path, options, gltf):
             'userData': '{"blender_export":"' + scene_id +'", "grabbableKey":{"grabbable":false,"ignoreIK":false}}',
         }
 
-        json_data = set_relative_to_parent(blender_object, json_data)
+        json_data = set_relative_to_parent(blender_object, json_data, session.transforms)
 
     else:
-        print('Skipping unsupported feature', name, bo_type)
+        log.info("Skipping unsupported feature %s %s", name, bo_type)
     
     
     # Restore object's rotation mode
-    print(blender_object)
-    if blender_object:
+    if blender_object and stored_rotation_mode is not None:
         blender_object.rotation_mode = stored_rotation_mode
     
-    bpy.ops.object.select_all(action = 'DESELECT')
+    if not session.use_data_api:
+        bpy.ops.object.select_all(action = 'DESELECT')
     return json_data
 
-# Rotation is based on the rotaiton of the parent and self. 
+# Resolves the parent relative transforms of objects once per export.
+# Each object is computed from the cached values of its parent, so that deep hierarchies are resolved in linear time
+# instead of walking up the parent chain again for every object and every level.
+class TransformResolver:
+    def __init__(self):
+        self.rotations = {}
+        self.positions = {}
+        self.local_rotations = {}
+        # name -> (position, rotation) in hifi axes, of the object itself and relative to its parent
+        self.hifi_locals = {}
+        self.hifi_relatives = {}
+
+    # Single top down pass through the given objects
+    def resolve(self, blender_objects):
+        pending = [blender_object for blender_object in blender_objects if blender_object.parent is None]
+        while len(pending) > 0:
+            blender_object = pending.pop()
+            self.compute(blender_object)
+            pending.extend(blender_object.children)
+
+    # Rotation is based on the rotation of the parent and self.
+    def rotation(self, blender_object):
+        if blender_object.name not in self.rotations:
+            self.compute_chain(blender_object)
+        return self.rotations[blender_object.name]
+
+    def position(self, blender_object):
+        if blender_object.name not in self.positions:
+            self.compute_chain(blender_object)
+        return self.positions[blender_object.name]
+
+    # Computes any of the ancestors that have not been resolved yet, top down.
+    def compute_chain(self, blender_object):
+        chain = []
+        current = blender_object
+        while current is not None and current.name not in self.rotations:
+            chain.append(current)
+            current = current.parent
+
+        for current in reversed(chain):
+            self.compute(current)
+
+    def compute(self, blender_object):
+        # Read through the matrix so that the rotation is correct regardless of rotation mode,
+        # and the objects own rotation is never modified.
+        local_rotation = blender_object.matrix_basis.decompose()[1]
+        location = Vector(blender_object.location)
+        parent = blender_object.parent
+        self.local_rotations[blender_object.name] = local_rotation
+
+        if parent is None:
+            self.rotations[blender_object.name] = local_rotation
+            self.positions[blender_object.name] = location
+        else:
+            parent_rotation = self.rotations[parent.name]
+            self.rotations[blender_object.name] = parent_rotation @ local_rotation.inverted()
+            self.positions[blender_object.name] = parent_rotation @ location - self.positions[parent.name]
+
+
+    # Converts the transforms of the objects to hifi axes, for all of them in one batch
+    def convert(self, blender_objects):
+        if len(blender_objects) == 0:
+            return
+
+        for blender_object in blender_objects:
+            if blender_object.name not in self.rotations:
+                self.compute_chain(blender_object)
+
+        names = [blender_object.name for blender_object in blender_objects]
+        locations = swap_nzy_array([tuple(blender_object.location) for blender_object in blender_objects]).tolist()
+        local_rotations = quat_swap_nzy_array([tuple(self.local_rotations[name]) for name in names]).tolist()
+        positions = swap_nzy_array([tuple(self.positions[name]) for name in names]).tolist()
+        rotations = quat_swap_nzy_array([tuple(self.rotations[name]) for name in names]).tolist()
+
+        for index, name in enumerate(names):
+            self.hifi_locals[name] = (Vector(locations[index]), Quaternion(local_rotations[index]))
+            self.hifi_relatives[name] = (Vector(positions[index]), Quaternion(rotations[index]))
+
+    def hifi_local(self, blender_object):
+        if blender_object.name not in self.hifi_locals:
+            self.convert([blender_object])
+        return self.hifi_locals[blender_object.name]
+
+    # Position and rotation relative to the parent. The offset, in the space of the parent, is added to the
+    # location of the object, like models that are placed at the center of their bounds instead of their origin
+    def hifi_relative(self, blender_object, offset=None):
+        if blender_object.name not in self.hifi_relatives:
+            self.convert([blender_object])
+
+        position, rotation = self.hifi_relatives[blender_object.name]
+        if offset is not None and blender_object.parent is not None:
+            position = position + swap_nzy(self.rotations[blender_object.parent.name] @ offset)
+        return position, rotation
+
+
 def relative_rotation(parent_object):
-    if not parent_object.parent:
-        return parent_object.rotation_quaternion
-    else:
-        rotation = relative_rotation( parent_object.parent)
-        current = parent_object.rotation_quaternion
-        current.invert() 
-        print('rotation test', current)
-       
-        return rotation @ current
+    return TransformResolver().rotation(parent_object)
 
 
 def relative_position(parent_object):
-    if parent_object.parent is not None:
-        return relative_rotation(parent_object.parent) @ parent_object.location - relative_position(parent_object.parent)
-    else:
-        return parent_object.location
+    return TransformResolver().position(parent_object)
+
+
+# File of the model the object was written with by the previous export, resolved from the url of its entity.
+# The url only differs from the file by a prefix that depends on the export options, which are the same for
+# everything that is reused. Models already written by this export are resolved the way the writer does.
+def previous_model_file(previous_manifest, name, signature, path, options, session):
+    model_name = signature['model']
+    if session.is_written(model_name):
+        return session.model_file(model_name)
 
+    model_url = previous_manifest.model_url(name)
+    prefix = get_model_url(path, options, "")
+    if model_url is None or not model_url.startswith(prefix):
+        return None
+    return model_url[len(prefix):]
+
+
+# An object from the previous export can only be reused if its entity and model are still around
+def is_reusable(previous_manifest, previous_entities, name, signature, path, options, session):
+    entity_id = previous_manifest.entity_id(name)
+    if entity_id is not None and entity_id not in previous_entities:
+        return False
+
+    if signature['model'] is not None:
+        model_file = previous_model_file(previous_manifest, name, signature, path, options, session)
+        if model_file is None or not os.path.isfile(path + model_file):
+            return False
+
+    return True
+
+
+# Share of the progress for parsing the objects, the batches and the pool writes take the rest
+PARSE_PROGRESS = 0.8
+BATCH_PROGRESS = 0.1
+# Seconds to wait for the pool between yields
+POOL_WAIT = 0.05
 
 
 def write_file(context, gltf=False):
-    current_scene = bpy.context.scene
-    read_scene = current_scene
-
-    # Creating a temp copy to do the changes in.
-    if context.clone_scene:
-        bpy.ops.scene.new(type='FULL_COPY')
-        read_scene = bpy.context.scene # sets the new scene as the new scene
-        read_scene.name = 'Hifi_Export_Scene'
-    
-    # Make sure we are in Object mode    
-    bpy.ops.object.mode_set(mode = 'OBJECT')
+    return run_job(write_file_job(context, gltf))
+
+
+# Yields the progress after every object and batch, and while waiting for the pool.
+# A cancelled export leaves the staging folder and its journal behind, so the next export resumes from where it stopped.
+def write_file_job(context, gltf=False):
+    read_scene = bpy.context.scene
+
+    profiler = ExportProfiler(context.write_profile)
+
+    # Instead of duplicating the whole scene, a non destructive export evaluates modifiers through the depsgraph
+    # and reads the transforms from the objects as they are, so the scene itself is never modified.
+    use_data_api = context.use_data_api
+
+    # Make sure we are in Object mode. Without an active object (like in background mode) there is nothing to switch
+    if bpy.ops.object.mode_set.poll():
+        bpy.ops.object.mode_set(mode = 'OBJECT')
     
-    # Deselect all objects
-    bpy.ops.object.select_all(action = 'DESELECT')
+    # Deselect all objects, as the operator based export works on the selection
+    if not use_data_api:
+        bpy.ops.object.select_all(action = 'DESELECT')
 
     # Clone Scene. Then select scene. After done delete scene
     path = os.path.dirname(os.path.realpath(context.filepath)) + '/'
@@ -436,34 +891,146 @@ def write_file(context, gltf=False):
         if not url.endswith('/'):    
             url = url + "/"
     
-    entities = []
+    cache = None
+    if context.use_cache:
+        cache = MeshCache(path)
+
+    pool = None
+    if context.parallel_write and not gltf:
+        pool = FBXWriterPool(context.write_threads)
+
+    # Anything that changes how every entity is written invalidates the whole previous export
+    export_options = [EXPORT_VERSION, gltf, context.atp, context.use_folder, context.url_override, context.remove_trailing,
+                      context.batch_static, context.batch_cell_size, context.batch_triangle_budget,
+                      context.generate_lods, context.lod_levels, context.lod_reduction]
+
+    # Everything is written into a staging folder first, and only moved next to the export once all of it has succeeded.
+    # If an earlier export to the same file failed, the objects it completed are picked up from its journal.
+    scene_file = os.path.basename(context.filepath)
+    staging = ExportStaging(path, scene_file, export_options)
+
+    session = ExportSession(path, cache, pool, profiler, gltf, staging.path + os.sep, use_data_api)
 
     # Duplicate list to break reference as we may do updates to the scene
     current_scene_objects = list(read_scene.objects)
-    for blender_object in current_scene_objects:
-        print(len(current_scene_objects))
-        parsed = parse_object(blender_object, path, context, gltf)
-        
-        if parsed:
-            entities.append(parsed)        
+    session.group_instances(current_scene_objects)
+    session.transforms.resolve(current_scene_objects)
+    session.transforms.convert(current_scene_objects)
 
-    # Delete Cloned scene
-    #     
-    if context.clone_scene:
-        bpy.ops.scene.delete()
-    
-    hifi_scene = {
-        'Version': EXPORT_VERSION,
-        'Entities': entities
-    }
-    
-    data = json.dumps(hifi_scene, indent=4)
-    
-    file = open(context.filepath, "w")
-    
-    try: 
-        file.write(data)
-    except e:
-        print('Could not write to file.', e)
+    # Static meshes merged into batches do not get entities of their own
+    batches = []
+    batched = set()
+    if context.batch_static:
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        static_objects = [blender_object for blender_object in current_scene_objects if is_batchable(blender_object)]
+        batches = cluster_objects(static_objects, depsgraph, context.batch_cell_size, context.batch_triangle_budget)
+        batched = set(blender_object.name for blender_object in static_objects)
+
+    manifest = ExportManifest(context.filepath, export_options)
+
+    previous_manifest = None
+    previous_entities = {}
+    if context.incremental:
+        previous_manifest = ExportManifest.load(context.filepath)
+        # Read from the file the manifest was written with, which may have been written with other json options
+        previous_filepath = previous_manifest.scene_filepath()
+        if previous_filepath is not None:
+            previous_entities = read_scene_entities(previous_filepath, previous_manifest.entity_ids())
+
+    # Entities are streamed to the file as they are parsed
+    scene_writer = HifiJSONStreamWriter(staging.filepath(scene_file), EXPORT_VERSION, context.compact_json, context.gzip_json)
+    manifest.scene_file = os.path.basename(scene_writer.filepath)
+    # Objects whose model files are still being written by the pool, and are journaled once they are done
+    pending = []
+
+    try:
+        for index, blender_object in enumerate(current_scene_objects):
+            if blender_object.name in batched:
+                continue
+
+            log.debug("Parsing %d/%d %s", index + 1, len(current_scene_objects), blender_object.name)
+            signature = session.signature(blender_object)
+
+            resumed = resume_entry(staging, blender_object, signature, session) if staging.resumed else None
+            if resumed is not None:
+                log.debug("Completed by an earlier run %s", blender_object.name)
+                parsed = resumed['entity']
+            elif (previous_manifest is not None and 
+                    previous_manifest.is_unchanged(blender_object.name, signature, export_options) and
+                    is_reusable(previous_manifest, previous_entities, blender_object.name, signature, path,
+                                context, session)):
+                log.debug("Unchanged since last export %s", blender_object.name)
+                parsed = previous_entities.get(previous_manifest.entity_id(blender_object.name))
+                # Other instances of the model refer to the same file
+                if signature['model'] is not None:
+                    session.mark_written(signature['model'], previous_model_file(
+                        previous_manifest, blender_object.name, signature, path, context, session))
+            else:
+                parsed = parse_object(blender_object, path, context, gltf, session)
+            
+            manifest.record(blender_object.name, signature, parsed)
+
+            if parsed:
+                with profiler.phase("json_write"):
+                    scene_writer.write(parsed)
+
+            if resumed is None:
+                entry = journal_entry(blender_object, signature, parsed, session)
+                pending.append((blender_object.name, entry, journal_files(entry)))
+            pending = journal_finished(staging, pending, pool)
+            yield (index + 1) / len(current_scene_objects) * PARSE_PROGRESS
+
+        for progress in write_batches(batches, path, context, session, scene_writer, staging, pending):
+            yield PARSE_PROGRESS + progress * BATCH_PROGRESS
+
+        if pool is not None:
+            total = len(pool.pending)
+            with profiler.phase("fbx_write_pool"):
+                running = pool.wait_some(POOL_WAIT)
+                while running > 0:
+                    yield PARSE_PROGRESS + BATCH_PROGRESS + (1 - running / total) * (1 - PARSE_PROGRESS - BATCH_PROGRESS)
+                    running = pool.wait_some(POOL_WAIT)
+
+        # Only what actually made it to disk is journaled, so that a failed write is redone by the next run
+        pending = journal_finished(staging, pending, pool)
+    except GeneratorExit:
+        log.info("Export to %s cancelled, the staged files are kept for the next export", context.filepath)
+        if pool is not None:
+            pool.cancel()
+        raise
     finally:
-        file.close()
\ No newline at end of file
+        scene_writer.close()
+        # On failure the staged files and the journal are left for the next run to resume from
+        staging.close()
+
+    if pool is not None:
+        with profiler.phase("fbx_write_pool"):
+            failed = pool.wait()
+
+        for filepath, exception in failed:
+            if cache is not None:
+                cache.discard(os.path.basename(filepath))
+
+        # Nothing is published, as the scene would refer to models that were not written.
+        # The staging folder and its journal are left for the next run to resume from
+        if len(failed) > 0:
+            raise IOError("Could not write %d model files, see the log. Export again to retry them" % len(failed))
+
+    # The scene file goes last, so that it never refers to models that have not been moved into place yet
+    scene_filepath = stream_filepath(context.filepath, context.gzip_json)
+    staging.publish(last=(os.path.basename(scene_filepath),))
+    log.info("Wrote %d entities to %s", scene_writer.count, scene_filepath)
+
+    if cache is not None:
+        cache.save()
+
+    manifest.save()
+
+    if profiler.enabled:
+        for model_name in session.written:
+            profiler.record_file(path + session.model_file(model_name))
+        profiler.record_file(scene_filepath)
+        profiler.record_file(manifest.filepath)
+        profiler.write(context.filepath)
+
+    return {'FINISHED'}
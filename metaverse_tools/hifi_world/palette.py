@@ -0,0 +1,26 @@
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+
+# Color palette helpers for the scene import, kept free of bpy
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+
+# Center of the bucket each channel of the 0-255 color falls in, with the given number of buckets per channel
+def quantize_color(color, buckets):
+    size = 256 / buckets
+    return tuple(int((min(int(max(channel, 0) / size), buckets - 1) + 0.5) * size) for channel in color)
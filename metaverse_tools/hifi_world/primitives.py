@@ -19,294 +19,349 @@
 # Primitive Logic for Content from High Fidelity to match source.
 # Copyright 2019 Matti 'Menithal' Lahtinen
 
+# Each shape is built once with bmesh into a template mesh that fits a 1x1x1 box, with its uvs and sharp edges,
+# and every entity of that shape gets a copy of it, placed with the data api. No operators or edit mode are used.
+# With linked instances, entities of the same shape and material share one copy, and only differ by their transform.
+
 import bpy
-import addon_utils
+import bmesh
+
+from math import pi, sqrt
+from mathutils import Matrix, Vector
+
+# Template meshes are kept in bpy.data under these names, so they are only built once per session.
+# The leading dot hides them from most of the ui.
+TEMPLATE_PREFIX = ".hifi-template-"
+
+# Edges marked sharp, for the edge split the importer adds
+SHARP_NONE = 0
+SHARP_ALL = 1
+SHARP_CAPS = 2
+
+GOLDEN_RATIO = (1 + sqrt(5)) / 2
+
+# Vertex color layer read by the shared vertex color material
+VERTEX_COLOR_LAYER = "Col"
+
 
 # Utility Script to debug selected edges
 def debug_get_selected_edges():
     edges = bpy.context.active_object.data.edges
     selected_edges = []
-    
+
     for idx, edge in enumerate(edges):
         if edge.select == True:
             selected_edges.append(idx)
-            
+
     print('Selected Edges: ', selected_edges)
 
 # Utility Script to debug selected edges
 def debug_get_selected_face():
     faces = bpy.context.active_object.data.polygons
     selected_polys = []
-    
+
     for idx, face in enumerate(faces):
         if face.select == True:
             selected_polys.append(idx)
-            
+
     print('Selected Polygons: ', selected_polys)
-    
-# Utility to select Polygons from the uv_array
-def select_polygons(uv_array):    
-    bpy.ops.object.mode_set(mode = 'EDIT')
-    bpy.ops.mesh.select_mode(type="FACE")
-    bpy.ops.mesh.select_all(action = 'DESELECT')
-    bpy.ops.object.mode_set(mode = 'OBJECT')
-
-    polygons = bpy.context.active_object.data.polygons
-
-    for polygon in uv_array:
-        polygons[polygon].select_set(state=True)
-        
-        
-# Utility to select Edges from the uv_array
-def select_edges(uv_array):
-    bpy.ops.object.mode_set(mode = 'EDIT')
-    bpy.ops.mesh.select_mode(type="EDGE")
-    bpy.ops.mesh.select_all(action = 'DESELECT')
-    bpy.ops.object.mode_set(mode = 'OBJECT')
 
-    edges = bpy.context.active_object.data.edges
 
-    for edge in uv_array:
-        edges[edge].select_set(state=True)
-
-
-# Utility to mark selected and then unwrap
-def mark_seams_and_uv_unwrap():
-    bpy.ops.object.mode_set(mode = 'EDIT')
-    bpy.ops.mesh.mark_seam(clear=False)
-    bpy.ops.mesh.select_all(action = 'SELECT')
-    
-    bpy.ops.uv.unwrap(method='ANGLE_BASED', margin=0.001)
-    
-    bpy.context.area.type = 'IMAGE_EDITOR'
-    bpy.context.scene.cursor.location[0] = 0
-    bpy.context.scene.cursor.location[1] = 0
-    
-    
-def ___empty():
-    pass
-
-# Utility Set Generics (position, dimensions, and rotation). Then has calls a callback if there are any custom UV unwrap
-def set_generic(entity, split = False, entity_specific_uv = ___empty):
-    
-    entity.blender_object = bpy.context.active_object
-    
-    # Make sure non Mesh objects do not trip there.
-    if entity.blender_object.type == "MESH":
-        bpy.ops.object.mode_set(mode = 'EDIT') 
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.mesh.normals_make_consistent()
-        if split:  
-            bpy.ops.mesh.select_mode(type="EDGE")
-            bpy.ops.mesh.mark_sharp()    
-            bpy.ops.mesh.select_all(action = 'DESELECT')
-        
-    bpy.ops.object.mode_set(mode = 'OBJECT')
-    bpy.context.object.name = entity.name
-    
-    # Reset                
-    bpy.ops.object.transform_apply(location=True, rotation=True, scale=True)
-    # Reset "Scale" to ready up pivot point
-    bpy.context.object.dimensions = (1,1,1)
-    
-    bpy.ops.object.transform_apply(location=False, rotation=False, scale=True)
-    # Create Pivot point
-    bpy.context.object.location = entity.pivot
-    
-    bpy.ops.object.transform_apply(location=True, rotation=False, scale=False)
-    ## Execute Entity specific UV Mapping here
-    
-    context_area = bpy.context.area.type
-    entity_specific_uv()    
-    ## Back to generic
-    bpy.context.area.type = context_area
-    
-    bpy.ops.object.mode_set(mode = 'OBJECT')
-    
-    bpy.context.object.dimensions = entity.dimensions
-    bpy.ops.object.transform_apply(location=True, rotation=False, scale=True)
-    bpy.context.object.location = entity.relative_position()
-    
-    bpy.context.object.rotation_mode = 'QUATERNION'
-    bpy.context.object.rotation_quaternion = entity.relative_rotation()
-    
-    if hasattr(entity, 'material') and entity.material is not None:
-        bpy.context.object.data.materials.append(entity.material)
-    
+# The radius arguments of bmesh.ops were called diameter prior to Blender 3.0, even if they already meant the radius
+def radius_arguments(**kwargs):
+    if bpy.app.version >= (3, 0, 0):
+        return kwargs
+
+    return {key.replace('radius', 'diameter'): value for key, value in kwargs.items()}
+
+
+# Convex solid out of the points, with coplanar triangles of the hull dissolved back into single faces
+def convex_solid(bm, points):
+    verts = [bm.verts.new(point) for point in points]
+    bmesh.ops.convex_hull(bm, input=verts)
+    bmesh.ops.dissolve_limit(bm, angle_limit=0.001, verts=bm.verts[:], edges=bm.edges[:])
+
+
+# Projects each face to the plane its normal points at the most, for shapes that have no uvs of their own
+def box_project(bm, uv_layer):
+    for face in bm.faces:
+        normal = face.normal
+        axis = max(range(3), key=lambda index: abs(normal[index]))
+        u, v = [index for index in range(3) if index != axis]
+        for loop in face.loops:
+            loop[uv_layer].uv = (loop.vert.co[u] + 0.5, loop.vert.co[v] + 0.5)
+
+
+def build_box(bm, uv_layer):
+    bmesh.ops.create_cube(bm, size=1, calc_uvs=True)
+
+
+def build_sphere(bm, uv_layer):
+    # Quad sphere: a subdivided cube pushed out to a sphere
+    bmesh.ops.create_cube(bm, size=1, calc_uvs=True)
+    bmesh.ops.subdivide_edges(bm, edges=bm.edges[:], cuts=7, use_grid_fill=True)
+    for vert in bm.verts:
+        vert.co = vert.co.normalized() * 0.5
+
+
+def build_uv_sphere(bm, uv_layer):
+    bmesh.ops.create_uvsphere(bm, u_segments=32, v_segments=16, calc_uvs=True, **radius_arguments(radius=0.5))
+
+
+def build_cylinder(segments, rotation=0):
+    def build(bm, uv_layer):
+        bmesh.ops.create_cone(bm, cap_ends=True, cap_tris=False, segments=segments, depth=1, calc_uvs=True,
+                              **radius_arguments(radius1=0.5, radius2=0.5))
+        if rotation != 0:
+            bmesh.ops.rotate(bm, verts=bm.verts[:], cent=(0, 0, 0), matrix=Matrix.Rotation(rotation, 3, 'Z'))
+    return build
+
+
+def build_cone(bm, uv_layer):
+    bmesh.ops.create_cone(bm, cap_ends=True, cap_tris=False, segments=32, depth=1, calc_uvs=True,
+                          **radius_arguments(radius1=0.5, radius2=0))
+
+
+def build_tetrahedron(bm, uv_layer):
+    # Edge up, like the geodesic dome tetrahedron rotated by 45 degrees
+    convex_solid(bm, [(-1, 0, 1), (1, 0, 1), (0, -1, -1), (0, 1, -1)])
+
+
+def build_octahedron(bm, uv_layer):
+    convex_solid(bm, [(1, 0, 0), (-1, 0, 0), (0, 1, 0), (0, -1, 0), (0, 0, 1), (0, 0, -1)])
+
+
+def build_icosahedron(bm, uv_layer):
+    bmesh.ops.create_icosphere(bm, subdivisions=1, **radius_arguments(radius=0.5))
+
+
+def build_dodecahedron(bm, uv_layer):
+    inverse = 1 / GOLDEN_RATIO
+    points = [(x, y, z) for x in (-1, 1) for y in (-1, 1) for z in (-1, 1)]
+    for a in (-inverse, inverse):
+        for b in (-GOLDEN_RATIO, GOLDEN_RATIO):
+            points.extend([(0, a, b), (a, b, 0), (b, 0, a)])
+
+    convex_solid(bm, points)
+    bmesh.ops.rotate(bm, verts=bm.verts[:], cent=(0, 0, 0), matrix=Matrix.Rotation(pi / 2, 3, 'Z'))
+
+
+def build_quad(bm, uv_layer):
+    bmesh.ops.create_grid(bm, x_segments=1, y_segments=1, size=0.5, calc_uvs=True)
+
+
+def build_circle(bm, uv_layer):
+    bmesh.ops.create_circle(bm, cap_ends=True, cap_tris=False, segments=32, calc_uvs=True,
+                            **radius_arguments(radius=0.5))
+
+
+# shape -> (builder, sharp edges, smooth shading, has uvs of its own)
+TEMPLATES = {
+    'Box': (build_box, SHARP_ALL, False, True),
+    'Sphere': (build_sphere, SHARP_NONE, True, True),
+    'UVSphere': (build_uv_sphere, SHARP_NONE, True, True),
+    'Cylinder': (build_cylinder(32), SHARP_CAPS, False, True),
+    'Hexagon': (build_cylinder(6), SHARP_ALL, False, True),
+    'Octagon': (build_cylinder(8), SHARP_ALL, False, True),
+    'Triangle': (build_cylinder(3, -pi / 2), SHARP_ALL, False, True),
+    'Cone': (build_cone, SHARP_CAPS, False, True),
+    'Tetrahedron': (build_tetrahedron, SHARP_ALL, False, False),
+    'Octahedron': (build_octahedron, SHARP_ALL, False, False),
+    'Icosahedron': (build_icosahedron, SHARP_ALL, False, False),
+    'Dodecahedron': (build_dodecahedron, SHARP_ALL, False, False),
+    'Quad': (build_quad, SHARP_ALL, False, True),
+    'Circle': (build_circle, SHARP_ALL, False, True),
+}
+
+
+# Scales the mesh around the origin so that its bounds are 1 in each direction that has any size
+def normalize(bm):
+    for axis in range(3):
+        values = [vert.co[axis] for vert in bm.verts]
+        size = max(values) - min(values)
+        if size > 0:
+            for vert in bm.verts:
+                vert.co[axis] = vert.co[axis] / size
+
+
+def build_template(shape):
+    builder, sharp, smooth, has_uvs = TEMPLATES[shape]
+
+    bm = bmesh.new()
+    try:
+        uv_layer = bm.loops.layers.uv.new("UVMap")
+        builder(bm, uv_layer)
+
+        normalize(bm)
+        bmesh.ops.recalc_face_normals(bm, faces=bm.faces[:])
+
+        if not has_uvs:
+            box_project(bm, uv_layer)
+
+        for face in bm.faces:
+            face.smooth = smooth
+
+        for edge in bm.edges:
+            if sharp == SHARP_ALL:
+                edge.smooth = False
+            elif sharp == SHARP_CAPS:
+                # The caps are the only faces with more than 4 sides
+                edge.smooth = not any(len(face.verts) > 4 for face in edge.link_faces)
+
+        mesh = bpy.data.meshes.new(TEMPLATE_PREFIX + shape)
+        bm.to_mesh(mesh)
+    finally:
+        bm.free()
+
+    return mesh
+
+
+def get_template(shape):
+    mesh = bpy.data.meshes.get(TEMPLATE_PREFIX + shape)
+    if mesh is None:
+        mesh = build_template(shape)
+    return mesh
+
+
+# Utility Set Generics (position, dimensions, and rotation), and make the object the active one
+def set_generic(entity, blender_object):
+    entity.blender_object = blender_object
+
+    bpy.context.collection.objects.link(blender_object)
+
+    blender_object.location = entity.relative_position()
+    blender_object.rotation_mode = 'QUATERNION'
+    blender_object.rotation_quaternion = entity.relative_rotation()
+
+    # Booleans of the importer work on the active object
+    bpy.context.view_layer.objects.active = blender_object
+    blender_object.select_set(state=True)
+
+
+def entity_material(entity):
+    return getattr(entity, 'material', None)
+
+
+# Fills every corner of the mesh with the 0-255 color, for the shared vertex color material of the importer
+def set_vertex_color(mesh, color):
+    layer = mesh.vertex_colors.new(name=VERTEX_COLOR_LAYER)
+    rgba = [channel / 255 for channel in color] + [1.0]
+    layer.data.foreach_set("color", rgba * len(layer.data))
+
+
+# Copy of the template, moved by the pivot and scaled to the dimensions of the entity
+def add_template(entity, shape):
+    if entity.scene.link_instances:
+        return add_instance(entity, shape)
+
+    mesh = get_template(shape).copy()
+    mesh.name = entity.name
+    mesh.transform(Matrix.Diagonal(entity.dimensions).to_4x4() @ Matrix.Translation(entity.pivot))
+
+    material = entity_material(entity)
+    if material is not None:
+        mesh.materials.append(material)
+
+    if entity.vertex_color is not None:
+        set_vertex_color(mesh, entity.vertex_color)
+
+    blender_object = bpy.data.objects.new(entity.name, mesh)
+    set_generic(entity, blender_object)
+
+    return blender_object
+
+
+# Mesh shared by every entity with the same shape and material, and vertex color if the colors are in the mesh
+def get_instance_mesh(scene, shape, material, vertex_color=None):
+    key = (shape, material.name if material is not None else None, vertex_color)
+    mesh = scene.instance_meshes.get(key)
+    if mesh is None:
+        mesh = get_template(shape).copy()
+        mesh.name = shape if material is None else shape + '-' + material.name
+        if material is not None:
+            mesh.materials.append(material)
+        if vertex_color is not None:
+            set_vertex_color(mesh, vertex_color)
+        scene.instance_meshes[key] = mesh
+
+    return mesh
+
+
+# Object linking the shared mesh, with the dimensions and pivot of the entity in its transform instead of the mesh
+def add_instance(entity, shape):
+    mesh = get_instance_mesh(entity.scene, shape, entity_material(entity), entity.vertex_color)
+
+    blender_object = bpy.data.objects.new(entity.name, mesh)
+    set_generic(entity, blender_object)
+
+    pivot = Vector([entity.pivot[axis] * entity.dimensions[axis] for axis in range(3)])
+    blender_object.location = blender_object.location + blender_object.rotation_quaternion @ pivot
+    blender_object.scale = entity.dimensions
+
+    return blender_object
 
 
 def add_box(entity):
-    bpy.ops.mesh.primitive_cube_add(location=(0,0,0), enter_editmode=True, calc_uvs=True)
-    
-    set_generic(entity, True)
-    
-    return bpy.context.active_object
+    return add_template(entity, 'Box')
 
 
 def add_light(entity):
-    bpy.ops.object.lamp_add(type='POINT', radius=1, view_align=False, location=(0, 0, 0))
-    
-    set_generic(entity)
-    bpy.context.object.data.distance = entity.dimensions.length
+    light = bpy.data.lights.new(entity.name, 'POINT')
+    light.distance = entity.dimensions.length
 
-    return bpy.context.active_object
+    blender_object = bpy.data.objects.new(entity.name, light)
+    set_generic(entity, blender_object)
+
+    return blender_object
 
 
 def add_tetrahedron(entity):
-    bpy.ops.mesh.generate_geodesic_dome(base_type='Tetrahedron', orientation='EdgeUp', geodesic_class='Class 1')
-
-    bpy.context.object.rotation_euler[2] = 0.785398
-    
-    def uv():
-        select_edges([0, 1,2])
-        mark_seams_and_uv_unwrap()
-
-    set_generic(entity, True, uv)
-    
-    return bpy.context.active_object
-    
-    
-def add_octahedron(entity):
-    bpy.ops.mesh.primitive_solid_add(source='8')
+    return add_template(entity, 'Tetrahedron')
+
 
-    def uv():
-        select_edges([6,7,8,10])
-        mark_seams_and_uv_unwrap()
-        
-    set_generic(entity, True, uv)
-    
-    
-    return bpy.context.active_object
+def add_octahedron(entity):
+    return add_template(entity, 'Octahedron')
 
 
 def add_icosahedron(entity):
-    bpy.ops.mesh.generate_geodesic_dome(geodesic_types='Geodesic', orientation='EdgeUp', base_type='Icosahedron', geodesic_class='Class 1')
-    
-    def uv():
-        bpy.ops.object.mode_set(mode = 'EDIT') 
-        bpy.ops.mesh.select_all(action='SELECT')
-        bpy.ops.uv.cylinder_project(direction="VIEW_ON_POLES",scale_to_bounds=True, align='POLAR_ZY')
-
-        
-    set_generic(entity, True, uv)
-    
-    return bpy.context.active_object
-
-    
+    return add_template(entity, 'Icosahedron')
+
+
 def add_docadehedron(entity):
-    bpy.ops.mesh.primitive_solid_add(source='12')
-    bpy.ops.transform.rotate(value=1.5708, axis=(0, 0, 1), constraint_axis=(False, False, True), constraint_orientation='GLOBAL')
-    
-    def uv():
-        bpy.ops.object.mode_set(mode = 'EDIT') 
-        select_edges([0, 1, 3, 4, 6, 7, 11, 12, 13, 14, 15, 16, 17, 18, 19, 20, 21, 22, 24, 25, 26, 27, 28, 31, 32, 33, 34, 37, 39, 40])
-        
-        bpy.ops.object.mode_set(mode = 'EDIT') 
-        bpy.ops.mesh.mark_sharp()
-        
-        mark_seams_and_uv_unwrap()
-        
-        bpy.ops.object.mode_set(mode = 'OBJECT') 
-        
-    set_generic(entity, False ,uv)
-    
-    return bpy.context.active_object
+    return add_template(entity, 'Dodecahedron')
 
 
 def add_quad(entity):
-    bpy.ops.mesh.primitive_plane_add(radius=1,  location=(0, 0, 0),  calc_uvs=True)
-    set_generic(entity, True)
-    
-    return bpy.context.active_object
+    return add_template(entity, 'Quad')
 
 
 def add_circle(entity):
-    bpy.ops.mesh.primitive_circle_add(view_align=False, enter_editmode=True, location=(0, 0, 0))
-    bpy.ops.mesh.edge_face_add()
-    set_generic(entity, True)
-    
-    return bpy.context.active_object
+    return add_template(entity, 'Circle')
 
 
-def add_cone(entity):   
-    bpy.ops.mesh.primitive_cone_add(radius1=1, radius2=0, depth=2, view_align=False, enter_editmode=False, location=(0, 0, 0), calc_uvs=True)
-    
-    def sharp():
-            bpy.ops.object.mode_set(mode = 'OBJECT')
-            select_polygons([32])
-            bpy.ops.object.mode_set(mode = 'EDIT')
-            bpy.ops.mesh.mark_sharp()
-
-    set_generic(entity, False, sharp)
-    
-    return bpy.context.active_object
+def add_cone(entity):
+    return add_template(entity, 'Cone')
 
 
 def add_cylinder(entity):
-    bpy.ops.mesh.primitive_cylinder_add(vertices=32, location=(0,0,0), calc_uvs=True)
-    
-    def sharp():
-        bpy.ops.object.mode_set(mode = 'OBJECT')
-        select_polygons([30, 33])
-        bpy.ops.object.mode_set(mode = 'EDIT')
-        bpy.ops.mesh.mark_sharp()
-
-    
-    set_generic(entity, False, sharp)
-    
-    return bpy.context.active_object
+    return add_template(entity, 'Cylinder')
 
 
 def add_hexagon(entity):
-    bpy.ops.mesh.primitive_cylinder_add(vertices=6, location=(0,0,0), calc_uvs=True)
-      
-    set_generic(entity, True)
-    
-    return bpy.context.active_object
+    return add_template(entity, 'Hexagon')
 
 
 def add_triangle(entity):
-    bpy.ops.mesh.primitive_cylinder_add(vertices=3, location=(0,0,0), calc_uvs=True)
-    bpy.ops.transform.rotate(value=-1.5708, axis=(0, 0, 1), constraint_axis=(False, False, True), constraint_orientation='GLOBAL')
-
-    set_generic(entity, True)
-    
-    return bpy.context.active_object
+    return add_template(entity, 'Triangle')
 
 
 def add_octagon(entity):
-    bpy.ops.mesh.primitive_cylinder_add(vertices=8, location=(0,0,0), enter_editmode=True, calc_uvs=True)
-    
-    set_generic(entity, True)
-    
-    return bpy.context.active_object
+    return add_template(entity, 'Octagon')
+
 
 def add_uv_sphere(entity):
-    bpy.ops.mesh.primitive_uv_sphere_add(location=(0,0,0), enter_editmode=False, calc_uvs=True)
-    bpy.ops.object.mode_set(mode = 'EDIT')
-    
-    bpy.ops.mesh.faces_shade_smooth()
-    
-    set_generic(entity, False)
-    
-    return bpy.context.active_object
+    return add_template(entity, 'UVSphere')
+
 
 def add_sphere(entity):
-    bpy.ops.mesh.primitive_cube_add(location=(0,0,0), enter_editmode=False, calc_uvs=True)
-    bpy.ops.object.modifier_add(type='SUBSURF')
-    bpy.context.object.modifiers["Subsurf"].levels = 3
-    bpy.context.object.modifiers["Subsurf"].use_subsurf_uv = False
-
-    bpy.ops.object.modifier_apply(modifier="Subsurf")
-    bpy.ops.object.modifier_add(type='SMOOTH')
-    bpy.context.object.modifiers["Smooth"].factor = 3.5
-    bpy.context.object.modifiers["Smooth"].iterations = 1
-
-    bpy.ops.object.modifier_apply(modifier="Smooth")
-    bpy.ops.object.mode_set(mode = 'EDIT')
-    
-    bpy.ops.mesh.faces_shade_smooth()
-    
-    set_generic(entity, False)
-    
-    return bpy.context.active_object
+    return add_template(entity, 'Sphere')
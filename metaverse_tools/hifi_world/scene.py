@@ -21,121 +21,219 @@
 
 
 import bpy
-from hashlib import md5
+import bmesh
 from mathutils import Quaternion, Vector, Euler, Matrix
 from metaverse_tools.hifi_world import primitives as prims
-from metaverse_tools.utils.helpers.extra_math import PIVOT_VECTOR, swap_nyz, swap_nzy, parse_dict_quaternion, parse_dict_vector, swap_yz, swap_pivot, quat_swap_nyz
+from metaverse_tools.hifi_world.palette import quantize_color
+from metaverse_tools.utils.helpers.union import append_mesh, merge_by_distance, union_objects
+from metaverse_tools.utils.helpers.extra_math import PIVOT_VECTOR, parse_dict_vectors, parse_dict_quaternions, swap_nyz_array, swap_yz_array, swap_pivot_array, quat_swap_nyz_array
+
+# How entity colors become materials: a material per unique color, a material per bucket of similar colors,
+# or a single material for everything, with the color of each entity in the vertex colors of its mesh.
+MATERIAL_COLOR = 'COLOR'
+MATERIAL_PALETTE = 'PALETTE'
+MATERIAL_VERTEX_COLOR = 'VERTEX_COLOR'
+
+VERTEX_COLOR_MATERIAL = "hifi-vertex-color"
+
+
+# Position, rotation, pivot and dimensions of each entity in blender axes, converted for all of the entities at once
+def entity_transforms(json_entities):
+    positions = swap_nyz_array(parse_dict_vectors(json_entities, 'position'))
+    rotations = quat_swap_nyz_array(parse_dict_quaternions(json_entities, 'rotation'))
+    pivots = swap_pivot_array(parse_dict_vectors(json_entities, 'registrationPoint', PIVOT_VECTOR))
+    dimensions = swap_yz_array(parse_dict_vectors(json_entities, 'dimensions'))
+
+    return zip(positions.tolist(), rotations.tolist(), pivots.tolist(), dimensions.tolist())
 
 
 class HifiScene:
-    def __init__(self, json,
+    # Without json, entities are added with add_entities as they are read, and the scene is finished with build_scene
+    def __init__(self, json=None,
                  uv_sphere=False,
                  join_children=True,
                  merge_distance=0.01,
                  delete_interior_faces=True,
-                 use_boolean_operation="NONE"):
-        json_entities = json['Entities']
-
+                 use_boolean_operation="NONE",
+                 link_instances=False,
+                 material_mode=MATERIAL_COLOR,
+                 palette_buckets=16):
         self.uv_sphere = uv_sphere
         self.join_children = join_children
         self.merge_distance = merge_distance
         self.delete_interior_faces = delete_interior_faces
         self.use_boolean_operation = use_boolean_operation
+        self.link_instances = link_instances
+        self.material_mode = material_mode
+        self.palette_buckets = palette_buckets
 
         self.entities = []
         self.materials = []
-        self.entity_ids = []
-        self.material_index = []
-        self.materials = []
-        self.parent_entities = []
+        # entity id -> HifiObject
+        self.entity_index = {}
+        # color, or palette bucket -> material
+        self.material_index = {}
+        # parent id -> HifiObjects that have it as their parent, in the order of the file
+        self.children_index = {}
+        # (shape, material name, vertex color) -> mesh shared by the entities, when linking instances
+        self.instance_meshes = {}
 
         self.root = []
 
-        # Build Indices for entity ids, and build the Objects
-        print(' building indices ')
-        for idx, entity in enumerate(json_entities):
-            self.entity_ids.append(entity['id'])
-            hifi_entity = HifiObject(entity, self)
+        if json is not None:
+            self.add_entities(json['Entities'])
+            self.build_scene()
+
+    # Joins or unions children with their parents. Booleans override join children, as they are a method to join them.
+    def merges_children(self):
+        return not self.link_instances and (self.join_children or self.use_boolean_operation != "NONE")
+
+    # Entities only need their children to be built first if they are merged with them.
+    # Otherwise they can be built as soon as their parent is.
+    def builds_incrementally(self):
+        return not self.merges_children()
+
+    # Adds the next entities of the file, links them with their parents and children already read,
+    # and builds the ones that are ready to be built.
+    def add_entities(self, json_entities):
+        json_entities = list(json_entities)
+        added = []
+        for entity, transform in zip(json_entities, entity_transforms(json_entities)):
+            hifi_entity = HifiObject(entity, self, transform)
             self.entities.append(hifi_entity)
-
-        # Build Trees by checking if parents exist in parent tree
-        print(' building parents ')
-        for entity in self.entities:
-            self.append_parent(entity)
-
-        self.build_scene()
+            added.append(hifi_entity)
+
+            if hifi_entity.parent_id is not None:
+                self.children_index.setdefault(hifi_entity.parent_id, []).append(hifi_entity)
+
+                parent = self.entity_index.get(hifi_entity.parent_id)
+                if parent is not None:
+                    parent.add_child(hifi_entity)
+                    hifi_entity.set_parent(parent)
+
+            # Like before, the first entity wins if an id is in the file twice
+            if hifi_entity.id not in self.entity_index:
+                self.entity_index[hifi_entity.id] = hifi_entity
+                # Children that came before their parent in the file
+                self.append_children(hifi_entity)
+
+        if self.builds_incrementally():
+            for hifi_entity in added:
+                # Entities with a parent that has not been read yet wait for it, or for build_scene if it never comes
+                if hifi_entity.parent is None and hifi_entity.parent_id is None:
+                    hifi_entity.build_branch()
+                elif hifi_entity.parent is not None and hifi_entity.parent.built:
+                    hifi_entity.build_branch()
 
     # links Parents and children together. to build a tree
-    def append_parent(self, entity):
-        # Check if parent id for entity exists
-        result = self.search_entity(entity.parent_id)
-        if result is not None:
-            # add entity as a child of parent
-            result.add_child(entity)
-            # set parent as a parent of entity
-            entity.set_parent(result)
+    def append_children(self, entity):
+        for child in self.children_index.get(entity.id, []):
+            # add child to the entity
+            entity.add_child(child)
+            # set entity as a parent of child
+            child.set_parent(entity)
 
     def search_entity(self, id):
-        # TODO: May need to do some more advanced tricks here maybe later.
-        found_entity = None
-        try:
-            # Get index of instance of the id from existing ids
-            index = self.entity_ids.index(id)
-            # if found, return found entity
-            found_entity = self.entities[index]
-        except e:
-            pass
-        finally:
-            # Regardless of failure, always return None or the entity
-            return found_entity
+        return self.entity_index.get(id)
 
     def build_scene(self):
-        # Store context to set cursor
-        current_context = bpy.context.area.type
-        bpy.context.area.type = 'VIEW_3D'
-        # set context to 3D View and set Cursor
-        bpy.context.scene.cursor.location[0] = 0.0
-        bpy.context.scene.cursor.location[1] = 0.0
-        bpy.context.scene.cursor.location[2] = 0.0
-        # return context back to earlier, and build scene.
-        bpy.context.area.type = current_context
+        for progress in self.build_steps():
+            pass
+
+    # Builds what has not been built while reading, a root at a time, yielding the share of the roots built so far
+    def build_steps(self):
         print("Building Scene out of " + str(len(self.entities)) + ' Objects and '
               + str(len(self.material_index)) + ' materials')
 
+        roots = [entity for entity in self.entities if entity.is_root()]
+        for index, entity in enumerate(roots):
+            entity.build()
+
+            if self.merges_children():
+                entity.join_tree()
+
+            yield (index + 1) / len(roots)
+
+    # Removes the objects, meshes and materials created so far, when the import is cancelled
+    def remove_built(self):
+        blender_objects = {}
         for entity in self.entities:
-            if entity.is_root():
-                entity.build()
+            try:
+                if entity.blender_object is not None:
+                    blender_objects[entity.blender_object.as_pointer()] = entity.blender_object
+            except ReferenceError:
+                # Removed by a join or union
+                pass
+
+        for blender_object in blender_objects.values():
+            data = blender_object.data
+            object_type = blender_object.type
+            bpy.data.objects.remove(blender_object)
+            if data is not None and data.users == 0:
+                if object_type == 'MESH':
+                    bpy.data.meshes.remove(data)
+                elif object_type == 'LIGHT':
+                    bpy.data.lights.remove(data)
+
+        for mesh in self.instance_meshes.values():
+            if mesh.users == 0:
+                bpy.data.meshes.remove(mesh)
+
+        for material in self.materials:
+            if material.users == 0:
+                bpy.data.materials.remove(material)
 
     def append_material(self, color):
-        # Just Hash result
+        if self.material_mode == MATERIAL_VERTEX_COLOR:
+            return self.append_vertex_color_material()
 
-        material_hash = md5(
-            str(color[0] + color[1] << 2 + color[2] << 4).encode('utf-8')).hexdigest()
-
-        if material_hash not in self.material_index:
-            index = len(self.material_index)
-            self.material_index.append(material_hash)
+        if self.material_mode == MATERIAL_PALETTE:
+            color = quantize_color(color, self.palette_buckets)
 
+        material_key = tuple(color)
+        if material_key not in self.material_index:
             mat = bpy.data.materials.new(str(color))
             # convert from rgb to float
-            mat.diffuse_color = tuple(c/255 for c in color)
+            mat.diffuse_color = tuple(c/255 for c in color) + (1,)
 
             # Make sure material at first is not metallic
             mat.specular_color = (0, 0, 0)
 
             self.materials.append(mat)
+            self.material_index[material_key] = mat
             return mat
 
-        return self.materials[self.material_index.index(material_hash)]
+        return self.material_index[material_key]
+
+    # Single material for every colored entity, taking the color from the vertex colors of the mesh
+    def append_vertex_color_material(self):
+        if VERTEX_COLOR_MATERIAL not in self.material_index:
+            mat = bpy.data.materials.new(VERTEX_COLOR_MATERIAL)
+            mat.specular_color = (0, 0, 0)
+
+            mat.use_nodes = True
+            nodes = mat.node_tree.nodes
+            principled = next((node for node in nodes if node.type == 'BSDF_PRINCIPLED'), None)
+            if principled is not None:
+                attribute = nodes.new('ShaderNodeAttribute')
+                attribute.attribute_name = prims.VERTEX_COLOR_LAYER
+                attribute.location = (principled.location.x - 300, principled.location.y)
+                mat.node_tree.links.new(attribute.outputs['Color'], principled.inputs['Base Color'])
+
+            self.materials.append(mat)
+            self.material_index[VERTEX_COLOR_MATERIAL] = mat
+
+        return self.material_index[VERTEX_COLOR_MATERIAL]
 
 
 class HifiObject:
 
-    def __init__(self, entity, scene):
+    def __init__(self, entity, scene, transform=None):
 
         self.id = entity['id']
         self.children = []
         self.blender_object = None
+        self.built = False
         self.scene = scene
         # Make sure the Blender Object has a name: And to make it unique, append id of the entity as well.
         if 'name' in entity and len(entity['name'].strip()) > 0:
@@ -145,17 +243,18 @@ class HifiObject:
         else:
             self.name = entity['type'] + '-' + self.id
 
-        self.position_original = Vector(parse_dict_vector(entity, 'position'))
-        self.position = swap_nyz(parse_dict_vector(entity, 'position'))
-
-        self.pivot = swap_pivot(parse_dict_vector(
-            entity, 'registrationPoint', PIVOT_VECTOR))
-        self.dimensions = swap_yz(parse_dict_vector(entity, 'dimensions'))
+        # Scenes convert the transforms of all their entities at once
+        if transform is None:
+            transform = next(entity_transforms([entity]))
 
-        self.rotation_original = Quaternion(
-            parse_dict_quaternion(entity, 'rotation'))
-        self.rotation = quat_swap_nyz(
-            parse_dict_quaternion(entity, 'rotation'))
+        position, rotation, pivot, dimensions = transform
+        self.position = Vector(position)
+        self.rotation = Quaternion(rotation)
+        self.pivot = Vector(pivot)
+        self.dimensions = Vector(dimensions)
+        # World space transform, resolved once the tree is known
+        self.world_position = None
+        self.world_rotation = None
 
         self.parent = None
         self.children = []
@@ -170,13 +269,17 @@ class HifiObject:
         if 'shape' in entity:
             self.shape = entity['shape']
 
+        self.material = None
+        # Color of the entity, for the vertex colors of its mesh when they are used for the color
+        self.vertex_color = None
         if self.type != 'Light' and self.type != 'Zone' and self.type != 'Particle':
             if 'color' in entity:
                 color = entity['color']
                 self.material = scene.append_material(
                     (color['red'], color['green'], color['blue']))
-        else:
-            self.material = None
+
+                if scene.material_mode == MATERIAL_VERTEX_COLOR:
+                    self.vertex_color = (color['red'], color['green'], color['blue'])
 
     def is_root(self):
         if self.parent is None:
@@ -191,6 +294,20 @@ class HifiObject:
         for child in self.children:
             child.build()
 
+        self.build_self()
+
+    # Builds self before the children, for scenes that build incrementally
+    def build_branch(self):
+        self.build_self()
+        for child in self.children:
+            child.build_branch()
+
+    def build_self(self):
+        # Already built while the file was being read
+        if self.built:
+            return
+        self.built = True
+
         # Place self by selecting what primitive to add, depending on type and shape.
         # Boxes and Spheres are the only primitive to have a separate type vs others
         if self.type == 'Shape':
@@ -239,70 +356,117 @@ class HifiObject:
                 print(' Warning: ', self.type, self.shape, ' Not Supported ')
                 return
 
-        # Now if above is a mesh type to do join / boolean operations on
-        if self.blender_object.type == "MESH":
+        # Linked instances share their mesh, so they can not be joined: children are parented instead
+        if self.scene.link_instances:
+            if self.blender_object.type == "MESH":
+                self.blender_object.modifiers.new(name="EdgeSplit", type='EDGE_SPLIT')
+            self.attach()
+            return
+
+        # Children are joined or unioned in a single pass per tree once it has been built, see join_tree.
+        # The edge split is added after booleans, as they would work on the split mesh.
+        if self.blender_object.type == "MESH" and self.scene.use_boolean_operation == "NONE":
+            self.blender_object.modifiers.new(name="EdgeSplit", type='EDGE_SPLIT')
+
+    # Joins the meshes of the tree into the top most mesh of each branch, bottom up in a single bmesh per branch,
+    # with one merge by distance for all of it. Other objects, such as lights, stay separate and break the branch.
+    # With booleans, the branch is unioned instead, see union_objects.
+    def join_tree(self):
+        if self.blender_object is None or self.blender_object.type != "MESH":
             for child in self.children:
-                # Material Combinator to pre-combine materials prior to applying boolean operator or joining objects together
-                # This allows the materials to be maintained even if they are joined.
-                # for each material the child's blender objects have
-                for material in child.blender_object.data.materials.values():
-                    # and if the material is set, and is not yet set for the parent, add an instance of the material to the parent
-                    if material is not None and material not in bpy.context.object.data.materials.values():
-                        bpy.context.object.data.materials.append(material)
-                # If the scene wants to use boolean operators, this overrides join children (as it is a method to join children)
-                if self.scene.use_boolean_operation != "NONE":
-                    bpy.ops.object.modifier_add(type='BOOLEAN')
-                    # Set name for modifier to keep track of it.
-                    name = child.name + '-Boolean'
-                    bpy.context.object.modifiers["Boolean"].name = name
-                    bpy.context.object.modifiers[name].operation = 'UNION'
-                    bpy.context.object.modifiers[name].solver = self.scene.use_boolean_operation
-                    bpy.context.object.modifiers[name].object = child.blender_object
-                    bpy.ops.object.modifier_apply(
-                        modifier=name)
-                    # Clean up the child object from the blender scene.
-                    bpy.context.view_layer.objects.remove(child.blender_object)
-                    # TODO: Set Child.blender_object as the blender object of the parent to maintain links
-                # If not boolean operator, but join_children is still True
-                elif self.scene.join_children:
-                    # Select the child
-                    child.select()
-                    # Select self
-                    self.select()
-                    # Join
-                    bpy.ops.object.join()
-
-            # Safety select
-            self.select()
-
-            bpy.ops.object.modifier_add(type='EDGE_SPLIT')
-            bpy.ops.object.mode_set(mode='EDIT')
-
-            if len(self.children) > 0:
-                bpy.ops.mesh.remove_doubles(
-                    threshold=self.scene.merge_distance)
-        # endif
-
-        # And at the end, make sure object is selected.
-        bpy.ops.object.mode_set(mode='OBJECT')
+                child.join_tree()
+            return
+
+        parts = []
+        # Breadth first, so the parts are joined in the order of the tree
+        pending = list(self.children)
+        index = 0
+        while index < len(pending):
+            entity = pending[index]
+            index += 1
+            if entity.blender_object is not None and entity.blender_object.type == "MESH":
+                parts.append(entity)
+                pending.extend(entity.children)
+            else:
+                entity.join_tree()
+
+        if self.scene.use_boolean_operation == "NONE":
+            if len(parts) > 0:
+                self.join_parts(parts)
+        else:
+            self.union_parts(parts)
+
+    def union_parts(self, parts):
+        if len(parts) > 0:
+            union_objects(self.blender_object, [part.blender_object for part in parts], self.scene.use_boolean_operation)
+            for part in parts:
+                part.blender_object = self.blender_object
+
+            merge_by_distance(self.blender_object.data, self.scene.merge_distance)
+
+        self.blender_object.modifiers.new(name="EdgeSplit", type='EDGE_SPLIT')
+
+    def join_parts(self, parts):
+        mesh = self.blender_object.data
+        # Objects are placed in world space
+        inverse = self.blender_object.matrix_basis.inverted_safe()
+
+        bm = bmesh.new()
+        try:
+            bm.from_mesh(mesh)
+
+            for part in parts:
+                part_object = part.blender_object
+                part_mesh = part_object.data
+                append_mesh(bm, mesh, part_mesh, inverse @ part_object.matrix_basis)
+
+                bpy.data.objects.remove(part_object)
+                bpy.data.meshes.remove(part_mesh)
+                part.blender_object = self.blender_object
+
+            bmesh.ops.remove_doubles(bm, verts=bm.verts[:], dist=self.scene.merge_distance)
+            bm.to_mesh(mesh)
+        finally:
+            bm.free()
+
+        mesh.update()
+
+    # Parents self to the parent, and the children to self, whichever of them have been built already.
+    # Objects are placed in world space, so the parent inverse keeps their world transform.
+    def attach(self):
+        if self.parent is not None and self.parent.blender_object is not None:
+            self.parent_object(self.blender_object, self.parent.blender_object)
+
+        for child in self.children:
+            if child.blender_object is not None:
+                self.parent_object(child.blender_object, self.blender_object)
+
+    @staticmethod
+    def parent_object(blender_object, parent_object):
+        blender_object.parent = parent_object
+        blender_object.matrix_parent_inverse = parent_object.matrix_basis.inverted_safe()
 
     # Position and rotations of children are always relative to parent in Hifi Tree.
 
     # Get the absolute position by getting the relative position of the parent, and adding my own to it.
     # note that then position is relative to the parents rotation too, so make sure to eliminate that as well.
+    # Resolved once per entity, so that every level of the tree reuses the result of its parent.
     def relative_position(self):
-        if self.parent is not None:
-            return self.parent.relative_rotation() * self.position + self.parent.relative_position()
-        else:
-            return self.position
+        if self.world_position is None:
+            if self.parent is not None:
+                self.world_position = self.parent.relative_rotation() @ self.position + self.parent.relative_position()
+            else:
+                self.world_position = self.position
+        return self.world_position
 
     # Rotation is based on the rotaiton of the parent and self.
     def relative_rotation(self):
-        if self.parent is not None:
-            rotation = self.parent.relative_rotation()
-            return rotation * self.rotation
-        else:
-            return self.rotation
+        if self.world_rotation is None:
+            if self.parent is not None:
+                self.world_rotation = self.parent.relative_rotation() @ self.rotation
+            else:
+                self.world_rotation = self.rotation
+        return self.world_rotation
 
     def set_parent(self, parent):
         if type(parent) is HifiObject:
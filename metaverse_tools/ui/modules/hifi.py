@@ -24,6 +24,7 @@ import bpy
 from metaverse_tools.utils.bones import bones_builder, mmd, mixamo, makehuman
 from metaverse_tools.utils.helpers import materials
 from metaverse_tools.armature import SkeletonTypes
+from metaverse_tools.utils.job import JobOperator
 
 category = "MVT: HiFi Tools"
 
@@ -91,10 +92,23 @@ class AVATAR_OT_MVT_TOOLSET_Convert_Custom_To_Hifi(bpy.types.Operator):
         return {'FINISHED'}
 
 
-class AVATAR_OT_MVT_TOOLSET_Convert_MMD_To_Hifi(bpy.types.Operator):
+# The converters edit the avatar in place, so the state before the conversion is pushed as an undo step.
+# A cancelled conversion pushes its partial state as well, so a single Undo brings the avatar back.
+def undoable_job(job, label):
+    bpy.ops.ed.undo_push(message="Before " + label)
+    try:
+        return (yield from job)
+    except GeneratorExit:
+        bpy.ops.ed.undo_push(message=label + " cancelled")
+        raise
+
+
+class AVATAR_OT_MVT_TOOLSET_Convert_MMD_To_Hifi(JobOperator, bpy.types.Operator):
     """ Converter to update an untranslated MMD avatar into a HF specific one. """
     bl_idname = "metaverse_toolset.hf_convert_mmd_avatar"
     bl_label = "MMD Avatar"
+    bl_options = {'REGISTER', 'UNDO'}
+    job_label = "Converting MMD Avatar"
 
     bl_space_type = "VIEW_3D"
     bl_icon = "BONES_DATA"
@@ -102,8 +116,10 @@ class AVATAR_OT_MVT_TOOLSET_Convert_MMD_To_Hifi(bpy.types.Operator):
     bl_category = category
 
     def execute(self, context):
-        mmd.convert_mmd_avatar_hifi()
-        return {'FINISHED'}
+        return self.start_job(context)
+
+    def job(self, context):
+        return undoable_job(mmd.convert_mmd_avatar_hifi_job(), self.job_label)
 
 
 class AVATAR_OT_MVT_TOOLSET_Convert_Mixamo_To_Hifi(bpy.types.Operator):
@@ -121,10 +137,12 @@ class AVATAR_OT_MVT_TOOLSET_Convert_Mixamo_To_Hifi(bpy.types.Operator):
         return {'FINISHED'}
 
 
-class AVATAR_OT_MVT_TOOLSET_Convert_MakeHuman_To_Hifi(bpy.types.Operator):
+class AVATAR_OT_MVT_TOOLSET_Convert_MakeHuman_To_Hifi(JobOperator, bpy.types.Operator):
     """ Converter to update an Makehuman avatar into a HF specific one. """
     bl_idname = "metaverse_toolset.hf_convert_makehuman_avatar"
     bl_label = "MakeHuman Avatar"
+    bl_options = {'REGISTER', 'UNDO'}
+    job_label = "Converting MakeHuman Avatar"
 
     bl_icon = "BONES_DATA"
     bl_space_type = "VIEW_3D"
@@ -132,7 +150,13 @@ class AVATAR_OT_MVT_TOOLSET_Convert_MakeHuman_To_Hifi(bpy.types.Operator):
     bl_category = category
 
     def execute(self, context):
-        makehuman.convert_makehuman_avatar_hifi()
+        return self.start_job(context)
+
+    def job(self, context):
+        return undoable_job(self.convert(), self.job_label)
+
+    def convert(self):
+        yield from makehuman.convert_makehuman_avatar_hifi_job()
         bones_builder.retarget_armature({'apply': True}, bpy.context.view_layer.objects)
         return {'FINISHED'}
 
@@ -10,6 +10,7 @@ import copy
 from mathutils import Vector
 
 from metaverse_tools.utils.bones import bones_builder
+from metaverse_tools.utils.job import run_job
 from metaverse_tools.utils.helpers import materials, mesh
 
 # DEPRICATED... :( Custom Avatar should be able to do the same thing but better.
@@ -219,18 +220,27 @@ def create_blink_shapes(shapekey, armature1, armature2):
 # --------------------
 
 def convert_makehuman_avatar_hifi():
+    return run_job(convert_makehuman_avatar_hifi_job())
+
+
+# Yields the progress after each object of the scenes, and after each of the blink shapes
+def convert_makehuman_avatar_hifi_job():
     # Should Probably have a confirmation dialog when using this.
-    original_type = bpy.context.area.type
-    bpy.context.area.type = 'VIEW_3D'
+    area = bpy.context.area
+    original_type = area.type if area is not None else None
+    if area is not None:
+        area.type = 'VIEW_3D'
 
-    # Change mode to object mode
+    try:
+        # Change mode to object mode
 
-    marked_for_purge = []
-    marked_for_deletion = []
+        marked_for_purge = []
+        marked_for_deletion = []
 
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for scene in bpy.data.scenes:
-        for obj in scene.objects:
+        objects = [obj for scene in bpy.data.scenes for obj in scene.objects]
+
+        bpy.ops.object.mode_set(mode='OBJECT')
+        for index, obj in enumerate(objects):
             bpy.ops.object.select_all(action='DESELECT')
             if obj is not None:
                 obj.select_set(state=True)
@@ -253,13 +263,19 @@ def convert_makehuman_avatar_hifi():
                     # materials.clean_materials(obj.material_slots)                   
                     remove_modifier_by_type(obj, "SUBSURF")
 
+            yield 0.6 * (index + 1) / len(objects)
 
-    create_blink_shapes("EyeBlink_L", "orbicularis03.L", "orbicularis04.L")
-    create_blink_shapes("EyeBlink_R", "orbicularis03.R", "orbicularis04.R")
+        create_blink_shapes("EyeBlink_L", "orbicularis03.L", "orbicularis04.L")
+        yield 0.8
+        create_blink_shapes("EyeBlink_R", "orbicularis03.R", "orbicularis04.R")
+        yield 0.95
 
-    for deletion in marked_for_deletion:
-        deletion.select_set(state=True)
-        bpy.context.view_layer.objects.active = deletion
-        bpy.ops.object.delete()
+        for deletion in marked_for_deletion:
+            deletion.select_set(state=True)
+            bpy.context.view_layer.objects.active = deletion
+            bpy.ops.object.delete()
+    finally:
+        if area is not None:
+            area.type = original_type
 
-    bpy.context.area.type = original_type
+    return {'FINISHED'}
@@ -27,6 +27,7 @@ import copy
 from mathutils import Vector
 from metaverse_tools.utils.helpers import materials, mesh
 from metaverse_tools.utils.bones import bones_builder
+from metaverse_tools.utils.job import run_job
 # This part is Based on powroupi the MMD Translation script combined with a Hogarth-MMD Translation csv that has been modified to select names as close as possible
 # This instead uses a predefined list that is Hifi Compatable.
 
@@ -418,40 +419,45 @@ def translate_list(Translator, list_to_translate):
 
 
 def convert_mmd_avatar_hifi():
+    return run_job(convert_mmd_avatar_hifi_job())
+
+
+# Yields the progress after each object of the scenes, and between the other steps of the conversion
+def convert_mmd_avatar_hifi_job():
 
     if not bpy.data.is_saved:
         print("Select a Directory")
         bpy.ops.metaverse_toolset_messages.remind_save('INVOKE_DEFAULT')
-        return
-
-    try:
-        bpy.ops.wm.console_toggle()
-    except:
-        print("Console was toggled")
+        return {'CANCELLED'}
 
     print("Converting MMD Avatar to be Blender-High Fidelity compliant")
     # Should Probably have a confirmation dialog when using this.
-    original_type = bpy.context.area.type
-    bpy.context.area.type = 'VIEW_3D'
+    area = bpy.context.area
+    original_type = area.type if area is not None else None
+    if area is not None:
+        area.type = 'VIEW_3D'
+
+    try:
+        Translator = MMDTranslator()
+        # Change mode to object mode
 
-    Translator = MMDTranslator()
-    # Change mode to object mode
+        print("Translating Materials", len(bpy.data.materials))
+        translate_list(Translator, list(bpy.data.materials))
+        print("Translating Textures", len(bpy.data.textures))
+        translate_list(Translator, list(bpy.data.textures))
+        print("Translating Meshes", len(bpy.data.meshes))
+        translate_list(Translator, list(bpy.data.meshes))
+        print("Translating Meshes", len(bpy.data.meshes))
+        translate_list(Translator, list(bpy.data.meshes))
+        yield 0.1
 
-    print("Translating Materials", len(bpy.data.materials))
-    translate_list(Translator, list(bpy.data.materials))
-    print("Translating Textures", len(bpy.data.textures))
-    translate_list(Translator, list(bpy.data.textures))
-    print("Translating Meshes", len(bpy.data.meshes))
-    translate_list(Translator, list(bpy.data.meshes))
-    print("Translating Meshes", len(bpy.data.meshes))
-    translate_list(Translator, list(bpy.data.meshes))
+        marked_for_purge = []
+        marked_for_deletion = []
 
-    marked_for_purge = []
-    marked_for_deletion = []
+        objects = [obj for scene in bpy.data.scenes for obj in scene.objects]
 
-    bpy.ops.object.mode_set(mode='OBJECT')
-    for scene in bpy.data.scenes:
-        for obj in scene.objects:
+        bpy.ops.object.mode_set(mode='OBJECT')
+        for index, obj in enumerate(objects):
             bpy.ops.object.select_all(action='DESELECT')
             if obj is not None:
                 obj.select_set(state=True)
@@ -475,24 +481,25 @@ def convert_mmd_avatar_hifi():
 
                     # materials.clean_materials(obj.material_slots)
 
-    bpy.ops.object.select_all(action='DESELECT')
-    for deletion in marked_for_deletion:
-        deletion.select_set(state=True)
-        bpy.context.view_layer.objects.active = deletion
-        bpy.ops.object.delete()
+            yield 0.1 + 0.6 * (index + 1) / len(objects)
 
-    bpy.ops.object.select_all(action='DESELECT')
-    for deletion in marked_for_purge:
-        delete_self_and_children(deletion)
+        bpy.ops.object.select_all(action='DESELECT')
+        for deletion in marked_for_deletion:
+            deletion.select_set(state=True)
+            bpy.context.view_layer.objects.active = deletion
+            bpy.ops.object.delete()
 
-    materials.convert_to_png(bpy.data.images)
-    materials.convert_images_to_mask(bpy.data.images)
+        bpy.ops.object.select_all(action='DESELECT')
+        for deletion in marked_for_purge:
+            delete_self_and_children(deletion)
+        yield 0.8
 
-    bpy.context.area.type = original_type
+        materials.convert_to_png(bpy.data.images)
+        yield 0.9
+        materials.convert_images_to_mask(bpy.data.images)
+    finally:
+        if area is not None:
+            area.type = original_type
 
     bpy.ops.file.make_paths_absolute()
-
-    try:
-        bpy.ops.wm.console_toggle()
-    except:
-        print("Console was toggled")
+    return {'FINISHED'}
@@ -18,36 +18,50 @@
 # ##### END GPL LICENSE BLOCK #####
 # Copyright 2019 Matti 'Menithal' Lahtinen
 
-import bpy
 import os
-from shutil import move as movefile
 import subprocess
 
+from metaverse_tools.utils.job import run_job
+from metaverse_tools.utils.logger import get_logger
+
+# Seconds to wait for the baker between yields
+BAKE_WAIT = 0.05
+
+log = get_logger(__name__)
+
 
 def bake_fbx(baker_path, fbx, images = []):
-    try:
-        bpy.ops.wm.console_toggle()
-    except:
-        print("Console was toggled")
+    return run_job(bake_fbx_job(baker_path, fbx, images))
+
 
-    if baker_path is None:
-        print("Please set the Bake tool path")
+# Runs the oven baker on the fbx, yielding while it runs, so that a job can keep the ui responsive and be cancelled.
+# A cancelled bake stops the baker.
+def bake_fbx_job(baker_path, fbx, images = []):
+    if not baker_path:
+        log.error("Please set the Bake tool path")
         return {"CANCELLED"}
 
-    print(os.path.isfile(baker_path), baker_path)
     if not os.path.isfile(baker_path) and "oven" in baker_path:
-        print("Please set and select the baker tool exe")
+        log.error("Please set and select the baker tool exe %s", baker_path)
         return {"CANCELLED"}
 
     path = os.path.dirname(os.path.realpath(fbx))
-    print("Now Baking Files", path, fbx)
-    
-    subprocess.call([baker_path, "-i" + fbx, "-o" + path, "-tfbx"])
+    log.info("Now Baking Files %s %s", path, fbx)
 
+    process = subprocess.Popen([baker_path, "-i" + fbx, "-o" + path, "-tfbx"])
     try:
-        bpy.ops.wm.console_toggle()
-    except:
-        print("Console was toggled")
+        while True:
+            try:
+                process.wait(BAKE_WAIT)
+                break
+            except subprocess.TimeoutExpired:
+                yield None
+    except GeneratorExit:
+        log.info("Stopping the baker")
+        process.terminate()
+        process.wait()
+        raise
+
     #Delete Originals
 
     return {"FINISHED"}
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Axis aligned bounds of evaluated geometry, read with foreach_get into numpy.
+# Gives the same center and dimensions as origin_set(type='ORIGIN_GEOMETRY', center='BOUNDS') would,
+# without running operators or touching the data of the object.
+
+import numpy
+
+from mathutils import Vector
+
+EMPTY_BOUNDS = (numpy.zeros(3), numpy.zeros(3))
+
+
+def mesh_coordinates(mesh):
+    coordinates = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float64)
+    mesh.vertices.foreach_get("co", coordinates)
+    return coordinates.reshape(-1, 3)
+
+
+# Vertex coordinates of the evaluated object in its local space, modifiers included.
+# Objects without geometry return an empty array.
+def object_coordinates(blender_object, depsgraph):
+    evaluated = blender_object.evaluated_get(depsgraph)
+    try:
+        mesh = evaluated.to_mesh()
+    except RuntimeError:
+        mesh = None
+
+    if mesh is None:
+        return numpy.empty((0, 3))
+
+    try:
+        return mesh_coordinates(mesh)
+    finally:
+        evaluated.to_mesh_clear()
+
+
+def transform_coordinates(coordinates, matrix):
+    matrix = numpy.array(matrix)
+    return coordinates @ matrix[0:3, 0:3].T + matrix[0:3, 3]
+
+
+def coordinate_bounds(coordinates):
+    if len(coordinates) == 0:
+        return EMPTY_BOUNDS
+
+    return coordinates.min(axis=0), coordinates.max(axis=0)
+
+
+def local_bounds(blender_object, depsgraph):
+    return coordinate_bounds(object_coordinates(blender_object, depsgraph))
+
+
+def world_bounds(blender_object, depsgraph):
+    coordinates = object_coordinates(blender_object, depsgraph)
+    return coordinate_bounds(transform_coordinates(coordinates, blender_object.matrix_world))
+
+
+# World space bounds of the object and all of its descendants. Objects without geometry do not count.
+def hierarchy_bounds(blender_object, depsgraph):
+    coordinates = []
+    pending = [blender_object]
+    while len(pending) > 0:
+        current = pending.pop()
+        coordinates.append(transform_coordinates(object_coordinates(current, depsgraph), current.matrix_world))
+        pending.extend(current.children)
+
+    return coordinate_bounds(numpy.concatenate(coordinates))
+
+
+def bounds_center(minimum, maximum):
+    return Vector(((minimum + maximum) * 0.5).tolist())
+
+
+def bounds_size(minimum, maximum):
+    return Vector((maximum - minimum).tolist())
+
+
+# Same as Object.dimensions, from the local bounds and the world scale of the object
+def bounds_dimensions(blender_object, minimum, maximum):
+    size = bounds_size(minimum, maximum)
+    scale = blender_object.matrix_world.to_scale()
+    return Vector((abs(size.x * scale.x), abs(size.y * scale.y), abs(size.z * scale.z)))
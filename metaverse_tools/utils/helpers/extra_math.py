@@ -20,6 +20,8 @@
 # Copyright 2019 Matti 'Menithal' Lahtinen
 
 
+import numpy
+
 from mathutils import Quaternion, Vector, Euler, Matrix
 from math import sqrt, acos, pow, sin, cos
 
@@ -69,6 +71,45 @@ def swap_nyz(vector):
 def swap_nzy(vector):
     return Vector((vector[0], vector[2], -vector[1]))
 
+# Batch versions of the above, for (N, 3) arrays of x,y,z vectors and (N, 4) arrays of w,x,y,z quaternions.
+# Each converts all rows in one call, instead of building a new mathutils object per entity.
+
+# Utility to make an (N, 3) array out of the vectors of the entities, rounded like parse_dict_vector
+def parse_dict_vectors(entities, index, default = ZERO_VECTOR):
+    vectors = numpy.array([(entity[index]['x'], entity[index]['y'], entity[index]['z']) if index in entity else default
+                           for entity in entities], dtype=numpy.float64).reshape(-1, 3)
+    return numpy.round(vectors * NEAREST_DIGIT) / NEAREST_DIGIT
+
+# Utility to make an (N, 4) array out of the quaternions of the entities
+def parse_dict_quaternions(entities, index):
+    return numpy.array([(entity[index]['w'], entity[index]['x'], entity[index]['y'], entity[index]['z'])
+                        if index in entity else ZERO_QUAT for entity in entities], dtype=numpy.float64).reshape(-1, 4)
+
+def swap_pivot_array(vectors):
+    return (numpy.asarray(vectors) - PIVOT_VECTOR)[:, [0, 2, 1]] * (1, 1, -1)
+
+def swap_yz_array(vectors):
+    return numpy.asarray(vectors)[:, [0, 2, 1]]
+
+def swap_nyz_array(vectors):
+    return numpy.asarray(vectors)[:, [0, 2, 1]] * (1, -1, 1)
+
+def swap_nzy_array(vectors):
+    return numpy.asarray(vectors)[:, [0, 2, 1]] * (1, 1, -1)
+
+# Swapping the axis of a rotation swaps the vector part of the quaternion the same way, as it is the axis times sin(angle / 2).
+# Like the mathutils versions, the results are normalized.
+def normalize_quaternions(quaternions):
+    lengths = numpy.linalg.norm(quaternions, axis=1, keepdims=True)
+    lengths[lengths == 0] = 1
+    return quaternions / lengths
+
+def quat_swap_nyz_array(quaternions):
+    return normalize_quaternions(numpy.asarray(quaternions)[:, [0, 1, 3, 2]] * (1, 1, -1, 1))
+
+def quat_swap_nzy_array(quaternions):
+    return normalize_quaternions(numpy.asarray(quaternions)[:, [0, 1, 3, 2]] * (1, 1, 1, -1))
+
 def matrix4_to_dict(m):
     return [vec4_to_list(m[0]),
         vec4_to_list(m[1]),
@@ -28,6 +28,9 @@ from bpy_extras.node_shader_utils import (
 from bpy.app.handlers import persistent
 import metaverse_tools
 from mathutils import Euler
+from metaverse_tools.utils.logger import get_logger
+
+log = get_logger(__name__)
 
 
 def get_images_from(meshes):
@@ -35,12 +38,12 @@ def get_images_from(meshes):
     for mesh in meshes:
         if(mesh.type == "MESH"):
             for material_slot in mesh.material_slots:
-                print("Iterating material", material_slot)
+                log.debug("Iterating material %s", material_slot)
                 if material_slot is not None:
                     material = material_slot.material
                     if material.use_nodes:
                         for node in material.node_tree.nodes:
-                            print("Iterating material node", node, node.name)
+                            log.debug("Iterating material node %s %s", node, node.name)
                             if node is not None and node.type == 'TEX_IMAGE' and node.image is not None:
                                 images.append(node.image)
     return images
@@ -226,7 +229,7 @@ class HifiShaderWrapper(PrincipledBSDFWrapper):
 
     def update(self):
         PrincipledBSDFWrapper.update(self)
-        print("HifiShaderWrapper", self.use_nodes, self.node_principled_bsdf)
+        log.debug("HifiShaderWrapper %s %s", self.use_nodes, self.node_principled_bsdf)
 
 
     def emission_get(self):
@@ -243,7 +246,7 @@ class HifiShaderWrapper(PrincipledBSDFWrapper):
 
     # Will only be used as gray-scale one...
     def emission_texture_get(self):
-        print("Emission Texture Get", self.use_nodes, self.node_principled_bsdf)
+        log.debug("Emission Texture Get %s %s", self.use_nodes, self.node_principled_bsdf)
         if not self.use_nodes or self.node_principled_bsdf is None:
             return None
         return ShaderImageTextureWrapper(
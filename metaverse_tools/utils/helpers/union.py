@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Joins and boolean unions of mesh objects through bmesh and the data api.
+# A union only runs real booleans where the objects actually overlap: objects are tested against each other with
+# their bounds and BVH trees first. Objects that touch nothing are simply joined, objects completely inside another
+# are dropped, and the rest are unioned in a balanced tree, a whole level of the tree per depsgraph evaluation.
+
+import bpy
+import bmesh
+
+from mathutils import Vector
+from mathutils.bvhtree import BVHTree
+
+from metaverse_tools.utils.logger import get_logger
+
+# Solvers of the old import options, to the solvers of the boolean modifier
+BOOLEAN_SOLVERS = {
+    'BMESH': 'FAST',
+    'CARVE': 'EXACT'
+}
+
+log = get_logger(__name__)
+
+
+# Index of the material in the material slots of the mesh, adding it if the mesh does not have it yet
+def material_index(mesh, material):
+    for index, existing in enumerate(mesh.materials):
+        if existing == material:
+            return index
+
+    mesh.materials.append(material)
+    return len(mesh.materials) - 1
+
+
+# Appends the mesh, moved by the matrix, to the bmesh of the target mesh.
+# The mesh itself is modified: its material indices are remapped to the material slots of the target.
+def append_mesh(bm, target_mesh, mesh, matrix):
+    indices = [material_index(target_mesh, material) for material in mesh.materials]
+    if len(indices) > 0:
+        polygon_indices = [0] * len(mesh.polygons)
+        mesh.polygons.foreach_get("material_index", polygon_indices)
+        mesh.polygons.foreach_set("material_index", [indices[index] for index in polygon_indices])
+
+    mesh.transform(matrix)
+    # Further calls of from_mesh append to the bmesh
+    bm.from_mesh(mesh)
+
+
+def merge_by_distance(mesh, distance):
+    bm = bmesh.new()
+    try:
+        bm.from_mesh(mesh)
+        bmesh.ops.remove_doubles(bm, verts=bm.verts[:], dist=distance)
+        bm.to_mesh(mesh)
+    finally:
+        bm.free()
+
+    mesh.update()
+
+
+# Replaces the mesh of the object with its evaluated mesh, and clears the modifiers that are now part of it,
+# so that they are not applied a second time on top of it
+def bake_object(blender_object, depsgraph):
+    mesh = bpy.data.meshes.new_from_object(blender_object.evaluated_get(depsgraph))
+    blender_object.modifiers.clear()
+
+    previous = blender_object.data
+    blender_object.data = mesh
+    if previous.users == 0:
+        bpy.data.meshes.remove(previous)
+
+
+def remove_object(blender_object):
+    mesh = blender_object.data
+    bpy.data.objects.remove(blender_object)
+    if mesh is not None and mesh.users == 0:
+        bpy.data.meshes.remove(mesh)
+
+
+# World space geometry of an object, for the overlap tests
+class UnionPart:
+    def __init__(self, blender_object, depsgraph):
+        self.object = blender_object
+        self.minimum = None
+        self.maximum = None
+        self.point = None
+
+        bm = bmesh.new()
+        try:
+            bm.from_object(blender_object, depsgraph)
+            bm.transform(blender_object.matrix_world)
+
+            if len(bm.verts) > 0:
+                coordinates = [vert.co for vert in bm.verts]
+                self.minimum = Vector([min(co[axis] for co in coordinates) for axis in range(3)])
+                self.maximum = Vector([max(co[axis] for co in coordinates) for axis in range(3)])
+                self.point = coordinates[0].copy()
+
+            self.tree = BVHTree.FromBMesh(bm)
+        finally:
+            bm.free()
+
+    def is_empty(self):
+        return self.point is None
+
+    def bounds_overlap(self, other):
+        return all(self.minimum[axis] <= other.maximum[axis] and other.minimum[axis] <= self.maximum[axis]
+                   for axis in range(3))
+
+    def bounds_contain(self, other):
+        return all(self.minimum[axis] <= other.minimum[axis] and other.maximum[axis] <= self.maximum[axis]
+                   for axis in range(3))
+
+    def surfaces_overlap(self, other):
+        return len(self.tree.overlap(other.tree)) > 0
+
+    # Without intersecting surfaces, other is inside if any of its points is behind the nearest face of self
+    def contains(self, other):
+        if not self.bounds_contain(other):
+            return False
+
+        location, normal, index, distance = self.tree.find_nearest(other.point)
+        return location is not None and (other.point - location).dot(normal) < 0
+
+
+# Groups the parts by overlap. Returns the groups as lists of part indices, and the indices of the parts
+# that are completely inside another part, and so do not change the union. The part at keep is never dropped.
+def overlap_groups(parts, keep=0):
+    groups = list(range(len(parts)))
+
+    def find(index):
+        while groups[index] != index:
+            groups[index] = groups[groups[index]]
+            index = groups[index]
+        return index
+
+    contained = set()
+    # Sweep along x, so only parts with overlapping bounds on x are compared
+    order = sorted((index for index in range(len(parts)) if not parts[index].is_empty()),
+                   key=lambda index: parts[index].minimum.x)
+    for position, index in enumerate(order):
+        part = parts[index]
+        for other_index in order[position + 1:]:
+            other = parts[other_index]
+            if other.minimum.x > part.maximum.x:
+                break
+            if not part.bounds_overlap(other):
+                continue
+
+            if part.surfaces_overlap(other):
+                groups[find(other_index)] = find(index)
+            elif part.contains(other):
+                if other_index == keep:
+                    groups[find(other_index)] = find(index)
+                else:
+                    contained.add(other_index)
+            elif other.contains(part):
+                if index == keep:
+                    groups[find(other_index)] = find(index)
+                else:
+                    contained.add(index)
+
+    grouped = {}
+    for index in range(len(parts)):
+        if index not in contained:
+            grouped.setdefault(find(index), []).append(index)
+
+    return [sorted(group) for group in grouped.values()], contained
+
+
+# Unions each group of objects into its first object. The groups are unioned pairwise in a balanced tree,
+# with all of the pairs of a level of every group evaluated at once. The objects are baked with their whole
+# modifier stack, the boolean being the last of it.
+def union_groups(groups, solver=None):
+    groups = [list(group) for group in groups if len(group) > 1]
+    while len(groups) > 0:
+        pairs = []
+        for group in groups:
+            for index in range(0, len(group) - 1, 2):
+                pairs.append((group[index], group[index + 1]))
+
+        for blender_object, other in pairs:
+            for material in other.data.materials:
+                if material is not None and material not in blender_object.data.materials.values():
+                    blender_object.data.materials.append(material)
+
+            modifier = blender_object.modifiers.new(name=other.name + '-Boolean', type='BOOLEAN')
+            modifier.operation = 'UNION'
+            modifier.object = other
+            if solver is not None and hasattr(modifier, 'solver'):
+                modifier.solver = BOOLEAN_SOLVERS.get(solver, solver)
+
+        # Evaluates every boolean of the level
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        for blender_object, other in pairs:
+            bake_object(blender_object, depsgraph)
+
+        for blender_object, other in pairs:
+            remove_object(other)
+
+        groups = [group[0::2] for group in groups if len(group) > 2]
+
+
+# Union of the meshes into the target, with booleans only where they overlap
+def union_objects(target, blender_objects, solver=None):
+    blender_objects = [blender_object for blender_object in blender_objects
+                       if blender_object is not target and blender_object.type == 'MESH']
+    if len(blender_objects) == 0:
+        return target
+
+    depsgraph = bpy.context.evaluated_depsgraph_get()
+    # The target is always the first part, so it is also the first of its group and survives the unions
+    parts = [UnionPart(target, depsgraph)] + [UnionPart(blender_object, depsgraph) for blender_object in blender_objects]
+    groups, contained = overlap_groups(parts)
+    log.debug("Union of %d objects into %s: %d groups, %d contained", len(blender_objects), target.name,
+              len(groups), len(contained))
+
+    for index in contained:
+        remove_object(parts[index].object)
+
+    union_groups([[parts[index].object for index in group] for group in groups], solver)
+
+    # What is left does not overlap anything else, and is joined as is
+    survivors = [parts[group[0]].object for group in groups if group[0] != 0]
+    if len(survivors) > 0:
+        depsgraph = bpy.context.evaluated_depsgraph_get()
+        join_objects(target, survivors, depsgraph)
+
+    return target
+
+
+# Joins the evaluated meshes of the objects into the target, and removes the objects.
+# A target with modifiers is baked first, as its modifiers would otherwise apply to the joined meshes as well
+def join_objects(target, blender_objects, depsgraph):
+    if len(target.modifiers) > 0:
+        bake_object(target, depsgraph)
+
+    mesh = target.data
+    inverse = target.matrix_world.inverted_safe()
+
+    bm = bmesh.new()
+    try:
+        bm.from_mesh(mesh)
+
+        for blender_object in blender_objects:
+            # A copy, so meshes shared with other objects are left as they are
+            object_mesh = bpy.data.meshes.new_from_object(blender_object.evaluated_get(depsgraph))
+            append_mesh(bm, mesh, object_mesh, inverse @ blender_object.matrix_world)
+            bpy.data.meshes.remove(object_mesh)
+            remove_object(blender_object)
+
+        bm.to_mesh(mesh)
+    finally:
+        bm.free()
+
+    mesh.update()
@@ -0,0 +1,106 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Long running imports, exports and conversions as jobs.
+# A job is a generator that does its work in steps, yielding its progress from 0 to 1 after each step,
+# and returning the result of the operator at the end. Operators run the job in slices from a timer, so the
+# progress shows in the ui, and Esc closes the generator, which runs its finally blocks to clean up.
+# Scripts and background mode run the same job to the end in one go with run_job.
+
+import time
+import bpy
+
+from metaverse_tools.utils.logger import get_logger
+
+# Seconds between the slices of a job, and the seconds of work done per slice
+JOB_INTERVAL = 0.01
+JOB_SLICE = 0.1
+
+log = get_logger(__name__)
+
+
+def run_job(job):
+    try:
+        while True:
+            next(job)
+    except StopIteration as stop:
+        return stop.value
+
+
+# Mixin for operators that run a job. The operator implements job(context), and starts it from execute
+# with start_job. Input other than Esc is blocked while the job runs, so the scene is not edited under it.
+class JobOperator:
+    job_label = "Working"
+
+    def start_job(self, context):
+        job = self.job(context)
+        if bpy.app.background or context.window is None:
+            return run_job(job) or {'FINISHED'}
+
+        self.running_job = job
+        self.job_progress = 0.0
+
+        window_manager = context.window_manager
+        self.job_timer = window_manager.event_timer_add(JOB_INTERVAL, window=context.window)
+        window_manager.progress_begin(0, 100)
+        window_manager.modal_handler_add(self)
+        self.show_job_status(context)
+        return {'RUNNING_MODAL'}
+
+    def modal(self, context, event):
+        if event.type == 'ESC' and event.value == 'PRESS':
+            self.running_job.close()
+            self.end_job(context)
+            log.info("%s cancelled", self.job_label)
+            self.report({'WARNING'}, self.job_label + " cancelled")
+            return {'CANCELLED'}
+
+        if event.type != 'TIMER' or event.timer != self.job_timer:
+            return {'RUNNING_MODAL'}
+
+        deadline = time.perf_counter() + JOB_SLICE
+        try:
+            while time.perf_counter() < deadline:
+                progress = next(self.running_job)
+                if progress is not None:
+                    self.job_progress = progress
+        except StopIteration as stop:
+            self.end_job(context)
+            return stop.value or {'FINISHED'}
+        except Exception as e:
+            self.end_job(context)
+            log.exception("%s failed", self.job_label)
+            self.report({'ERROR'}, "%s failed: %s" % (self.job_label, e))
+            return {'CANCELLED'}
+
+        context.window_manager.progress_update(int(self.job_progress * 100))
+        self.show_job_status(context)
+        return {'RUNNING_MODAL'}
+
+    def show_job_status(self, context):
+        if context.workspace is not None:
+            context.workspace.status_text_set("%s: %d%%, press Esc to cancel" % (self.job_label, self.job_progress * 100))
+
+    def end_job(self, context):
+        window_manager = context.window_manager
+        window_manager.event_timer_remove(self.job_timer)
+        window_manager.progress_end()
+        if context.workspace is not None:
+            context.workspace.status_text_set(None)
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Package wide logging. Modules get a child of the metaverse_tools logger with get_logger(__name__),
+# and the level of the whole package is set from the add-on preferences.
+
+import logging
+
+LOGGER_NAME = "metaverse_tools"
+DEFAULT_LEVEL = 'INFO'
+
+LOG_LEVELS = (
+    ('DEBUG', "Debug", "Log everything, including per object progress"),
+    ('INFO', "Info", "Log export and import summaries"),
+    ('WARNING', "Warning", "Log only warnings and errors"),
+    ('ERROR', "Error", "Log only errors"),
+)
+
+
+def get_logger(name=LOGGER_NAME):
+    if name != LOGGER_NAME and not name.startswith(LOGGER_NAME + "."):
+        name = LOGGER_NAME + "." + name
+
+    return logging.getLogger(name)
+
+
+def set_log_level(level=DEFAULT_LEVEL):
+    logger = logging.getLogger(LOGGER_NAME)
+
+    # Only add the handler once, even if the add-on is re-registered.
+    if not any(getattr(handler, "_metaverse_tools", False) for handler in logger.handlers):
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(levelname)s %(name)s: %(message)s"))
+        handler._metaverse_tools = True
+        logger.addHandler(handler)
+        logger.propagate = False
+
+    logger.setLevel(getattr(logging, level, logging.INFO))
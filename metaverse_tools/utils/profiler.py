@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Opt-in timing of export phases. Records the wall time of each phase per object and the size of each written file,
+# and writes them out as <export>.profile.json and <export>.profile.csv next to the export.
+
+import os
+import csv
+import json
+import time
+
+from contextlib import contextmanager
+from metaverse_tools.utils.logger import get_logger
+
+PROFILE_EXTENSION = ".profile"
+
+log = get_logger(__name__)
+
+
+class ExportProfiler:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.started = time.perf_counter()
+        # (phase, target, seconds)
+        self.phases = []
+        # filepath -> bytes
+        self.files = {}
+
+    @contextmanager
+    def phase(self, name, target=""):
+        if not self.enabled:
+            yield
+            return
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases.append((name, target, time.perf_counter() - start))
+
+    def record_file(self, filepath):
+        if self.enabled and os.path.isfile(filepath):
+            self.files[filepath] = os.path.getsize(filepath)
+
+    def totals(self):
+        totals = {}
+        for name, target, seconds in self.phases:
+            total = totals.setdefault(name, {'seconds': 0.0, 'count': 0})
+            total['seconds'] += seconds
+            total['count'] += 1
+        return totals
+
+    def write(self, filepath):
+        if not self.enabled:
+            return
+
+        profile_path = filepath + PROFILE_EXTENSION
+        data = {
+            'total_seconds': time.perf_counter() - self.started,
+            'phases': self.totals(),
+            'objects': [{'phase': name, 'target': target, 'seconds': seconds} for name, target, seconds in self.phases],
+            'files': [{'file': path, 'bytes': size} for path, size in self.files.items()],
+            'total_bytes': sum(self.files.values())
+        }
+
+        try:
+            with open(profile_path + ".json", "w") as file:
+                json.dump(data, file, indent=4)
+
+            with open(profile_path + ".csv", "w", newline="") as file:
+                writer = csv.writer(file)
+                writer.writerow(["phase", "target", "seconds", "bytes"])
+                for name, target, seconds in self.phases:
+                    writer.writerow([name, target, "%.6f" % seconds, ""])
+                for path, size in self.files.items():
+                    writer.writerow(["file", path, "", size])
+        except OSError as e:
+            log.error("Could not write export profile. %s", e)
+            return
+
+        log.info("Wrote export profile to %s.json", profile_path)
@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+# ##### BEGIN GPL LICENSE BLOCK #####
+#
+#  This program is free software; you can redistribute it and/or
+#  modify it under the terms of the GNU General Public License
+#  as published by the Free Software Foundation; either version 2
+#  of the License, or (at your option) any later version.
+#
+#  This program is distributed in the hope that it will be useful,
+#  but WITHOUT ANY WARRANTY; without even the implied warranty of
+#  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#  GNU General Public License for more details.
+#
+#  You should have received a copy of the GNU General Public License
+#  along with this program; if not, write to the Free Software Foundation,
+#  Inc., 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301, USA.
+#
+# ##### END GPL LICENSE BLOCK #####
+# Copyright 2020 Matti 'Menithal' Lahtinen
+
+# Crash safe export output.
+# Files of an export are written into a hidden staging folder next to the output, and only moved into place with
+# atomic renames once the whole export has succeeded, so a failed export never leaves half written files behind.
+# Completed steps are appended to a journal in the staging folder, so that a rerun after a failure can skip them.
+
+import os
+import json
+import shutil
+
+from metaverse_tools.utils.logger import get_logger
+
+STAGING_SUFFIX = ".staging"
+JOURNAL_FILENAME = "journal.jsonl"
+
+log = get_logger(__name__)
+
+
+class ExportStaging:
+    def __init__(self, directory, name, options=None, resume=True):
+        self.directory = directory
+        self.path = os.path.join(directory, "." + name + STAGING_SUFFIX)
+        self.journal_path = os.path.join(self.path, JOURNAL_FILENAME)
+        self.options = options
+        # key -> journal entry of a completed step
+        self.entries = {}
+
+        self.resumed = self.load() if resume else self.clear()
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+
+        self.journal = open(self.journal_path, "a", encoding="utf-8")
+        if not self.resumed:
+            self.append({'options': self.options})
+
+    # Reads the journal of an earlier failed export. A journal written with different options is thrown away
+    # along with everything staged with it.
+    def load(self):
+        if not os.path.isfile(self.journal_path):
+            return self.clear()
+
+        with open(self.journal_path, "r", encoding="utf-8") as file:
+            lines = file.read().splitlines()
+
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            header = None
+
+        if header is None or header.get('options') != self.options:
+            log.info("Discarding the staged files of an earlier export with different options")
+            return self.clear()
+
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # The last line may have been cut off by the failure
+                continue
+            self.entries[record['key']] = record['entry']
+
+        log.info("Resuming an earlier export, %d steps already completed", len(self.entries))
+        return True
+
+    def clear(self):
+        if os.path.isdir(self.path):
+            shutil.rmtree(self.path)
+        return False
+
+    def filepath(self, filename):
+        return os.path.join(self.path, filename)
+
+    # Files count as done if they have been staged by this or the failed export, or are already published
+    def has_file(self, filename):
+        return os.path.isfile(self.filepath(filename)) or os.path.isfile(os.path.join(self.directory, filename))
+
+    def completed(self, key):
+        return self.entries.get(key)
+
+    def complete(self, key, entry):
+        self.entries[key] = entry
+        self.append({'key': key, 'entry': entry})
+
+    def append(self, record):
+        self.journal.write(json.dumps(record) + "\n")
+        self.journal.flush()
+        os.fsync(self.journal.fileno())
+
+    # Stops journaling, but keeps the staged files and the journal for the next run to resume from
+    def close(self):
+        if not self.journal.closed:
+            self.journal.close()
+
+    # Moves every staged file into the output folder, replacing existing files.
+    # Files listed in last are moved after everything else, so that they never refer to files that are not there yet.
+    def publish(self, last=()):
+        self.close()
+
+        staged = []
+        for root, folders, files in os.walk(self.path):
+            for filename in files:
+                relative = os.path.relpath(os.path.join(root, filename), self.path)
+                if relative != JOURNAL_FILENAME:
+                    staged.append(relative)
+
+        staged.sort(key=lambda relative: relative in last)
+
+        for relative in staged:
+            target = os.path.join(self.directory, relative)
+            target_folder = os.path.dirname(target)
+            if not os.path.isdir(target_folder):
+                os.makedirs(target_folder)
+            os.replace(os.path.join(self.path, relative), target)
+
+        shutil.rmtree(self.path)
+        log.debug("Published %d files to %s", len(staged), self.directory)
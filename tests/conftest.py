@@ -0,0 +1,26 @@
+# Unit tests of the parts of the add-on that do not need Blender.
+# The add-on packages import bpy when they are imported, so they are registered here as bare namespaces,
+# which lets the pure python modules within them be imported on their own.
+
+import os
+import sys
+import types
+
+ROOT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "metaverse_tools")
+
+PACKAGES = (
+    ("metaverse_tools", ""),
+    ("metaverse_tools.ext", "ext"),
+    ("metaverse_tools.ext.modified_fbx_tools", os.path.join("ext", "modified_fbx_tools")),
+    ("metaverse_tools.files", "files"),
+    ("metaverse_tools.files.hifi_json", os.path.join("files", "hifi_json")),
+    ("metaverse_tools.hifi_world", "hifi_world"),
+    ("metaverse_tools.utils", "utils"),
+    ("metaverse_tools.utils.helpers", os.path.join("utils", "helpers")),
+)
+
+for name, folder in PACKAGES:
+    if name not in sys.modules:
+        package = types.ModuleType(name)
+        package.__path__ = [os.path.join(ROOT, folder)]
+        sys.modules[name] = package
@@ -0,0 +1,150 @@
+import array
+import importlib
+import sys
+import types
+import zlib
+
+from struct import pack
+
+import pytest
+
+
+# Element and encoder of io_scene_fbx.encode_bin as of Blender 2.90, cut down to what the tests use
+class FBXElem:
+    __slots__ = ("id", "props", "props_type", "elems", "_props_length", "_end_offset")
+
+    def __init__(self, id):
+        assert(len(id) < 256)
+        self.id = id
+        self.props = []
+        self.props_type = bytearray()
+        self.elems = []
+        self._end_offset = -1
+        self._props_length = -1
+
+    def add_int32(self, data):
+        self.props_type.append(ord(b'I'))
+        self.props.append(pack('<i', data))
+
+    def add_string(self, data):
+        self.props_type.append(ord(b'S'))
+        self.props.append(pack('<I', len(data)) + data)
+
+    def _add_array_helper(self, data, array_type, prop_type):
+        assert(isinstance(data, array.array))
+        assert(data.typecode == array_type)
+
+        length = len(data)
+
+        if sys.byteorder != 'little':
+            data = data[:]
+            data.byteswap()
+        data = data.tobytes()
+
+        encoding = 0 if len(data) <= 128 else 1
+        if encoding == 1:
+            data = zlib.compress(data, 1)
+
+        data = pack('<3I', length, encoding, len(data)) + data
+
+        self.props_type.append(prop_type)
+        self.props.append(data)
+
+    def add_int32_array(self, data):
+        if not isinstance(data, array.array):
+            data = array.array('i', data)
+        self._add_array_helper(data, 'i', ord(b'i'))
+
+    def add_float64_array(self, data):
+        if not isinstance(data, array.array):
+            data = array.array('d', data)
+        self._add_array_helper(data, 'd', ord(b'd'))
+
+    def encode(self):
+        data = b"".join(self.props)
+        children = b"".join(elem.encode() for elem in self.elems)
+        return (pack('<3I', len(self.props), len(data), len(children)) +
+                bytes((len(self.id),)) + self.id + bytes(self.props_type) + data + children)
+
+
+def encode_write(filepath, root, version):
+    with open(filepath, "wb") as file:
+        file.write(pack('<I', version) + root.encode())
+
+
+# Matches io_scene_fbx.fbx_utils.elem_empty
+def elem_empty(elem, name):
+    sub_elem = encode_bin.FBXElem(name)
+    if elem is not None:
+        elem.elems.append(sub_elem)
+    return sub_elem
+
+
+encode_bin = types.ModuleType("io_scene_fbx.encode_bin")
+encode_bin.FBXElem = FBXElem
+encode_bin.write = encode_write
+
+
+@pytest.fixture(scope="module")
+def mod_encode_bin():
+    names = ("io_scene_fbx", "io_scene_fbx.encode_bin", "metaverse_tools.ext.modified_fbx_tools.mod_encode_bin")
+    saved = {name: sys.modules.pop(name, None) for name in names}
+
+    package = types.ModuleType("io_scene_fbx")
+    package.__path__ = []
+    package.encode_bin = encode_bin
+    sys.modules["io_scene_fbx"] = package
+    sys.modules["io_scene_fbx.encode_bin"] = encode_bin
+    try:
+        yield importlib.import_module("metaverse_tools.ext.modified_fbx_tools.mod_encode_bin")
+    finally:
+        for name, module in saved.items():
+            sys.modules.pop(name, None)
+            if module is not None:
+                sys.modules[name] = module
+
+
+def build_tree(root):
+    header = elem_empty(root, b"Header")
+    header.add_int32(7400)
+    header.add_string(b"Blender")
+
+    objects = elem_empty(root, b"Objects")
+    geometry = elem_empty(objects, b"Geometry")
+    elem_empty(geometry, b"Vertices").add_float64_array([i * 0.25 for i in range(3000)])
+    elem_empty(geometry, b"PolygonVertexIndex").add_int32_array(array.array('i', range(-500, 500)))
+    # Small enough to be written uncompressed
+    elem_empty(geometry, b"Edges").add_int32_array([1, 2, 3])
+    elem_empty(objects, b"Empty")
+
+
+def test_deferred_matches_serial(tmp_path, mod_encode_bin):
+    serial_root = elem_empty(None, b"")
+    build_tree(serial_root)
+    serial_path = str(tmp_path / "serial.fbx")
+    encode_bin.write(serial_path, serial_root, 7400)
+
+    deferred_root = mod_encode_bin.elem_root_deferred()
+    build_tree(deferred_root)
+    deferred_path = str(tmp_path / "deferred.fbx")
+    mod_encode_bin.write(deferred_path, deferred_root, 7400)
+
+    with open(serial_path, "rb") as serial, open(deferred_path, "rb") as deferred:
+        assert serial.read() == deferred.read()
+
+
+def test_only_deferred_trees_are_deferred(mod_encode_bin):
+    deferred_root = mod_encode_bin.elem_root_deferred()
+    build_tree(deferred_root)
+    plain_root = elem_empty(None, b"")
+    build_tree(plain_root)
+
+    vertices = deferred_root.elems[1].elems[0].elems[0]
+    edges = deferred_root.elems[1].elems[0].elems[2]
+    assert isinstance(vertices, mod_encode_bin.DeferredFBXElem)
+    assert isinstance(vertices.props[0], mod_encode_bin.DeferredArray)
+    assert isinstance(edges.props[0], bytes)
+
+    assert FBXElem._add_array_helper is not mod_encode_bin.DeferredFBXElem._add_array_helper
+    assert type(plain_root.elems[1].elems[0].elems[0]) is FBXElem
+    assert isinstance(plain_root.elems[1].elems[0].elems[0].props[0], bytes)
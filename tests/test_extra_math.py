@@ -0,0 +1,59 @@
+import pytest
+
+# The batch conversions are checked against the per entity mathutils versions, so both are needed
+numpy = pytest.importorskip("numpy")
+pytest.importorskip("mathutils")
+
+from metaverse_tools.utils.helpers import extra_math  # noqa: E402
+
+ENTITIES = [
+    {"position": {"x": 1.0000001, "y": -2.5, "z": 3}, "rotation": {"w": 0.7071, "x": 0.7071, "y": 0, "z": 0}},
+    {"position": {"x": 0, "y": 0, "z": 0}, "registrationPoint": {"x": 0, "y": 1, "z": 0.25}},
+    {"rotation": {"w": 0.5, "x": 0.5, "y": -0.5, "z": 0.5}, "dimensions": {"x": 4, "y": 5, "z": 6}},
+]
+
+
+def test_parse_dict_vectors():
+    for index, default in (("position", extra_math.ZERO_VECTOR), ("registrationPoint", extra_math.PIVOT_VECTOR)):
+        vectors = extra_math.parse_dict_vectors(ENTITIES, index, default)
+        expected = [extra_math.parse_dict_vector(entity, index, default) for entity in ENTITIES]
+        assert vectors.shape == (len(ENTITIES), 3)
+        assert numpy.allclose(vectors, expected)
+
+
+def test_parse_dict_quaternions():
+    quaternions = extra_math.parse_dict_quaternions(ENTITIES, "rotation")
+    expected = [extra_math.parse_dict_quaternion(entity, "rotation") for entity in ENTITIES]
+    assert quaternions.shape == (len(ENTITIES), 4)
+    assert numpy.allclose(quaternions, expected)
+
+
+def test_empty_entities():
+    assert extra_math.parse_dict_vectors([], "position").shape == (0, 3)
+    assert extra_math.parse_dict_quaternions([], "rotation").shape == (0, 4)
+
+
+@pytest.mark.parametrize("batch, single", [
+    ("swap_pivot_array", "swap_pivot"),
+    ("swap_yz_array", "swap_yz"),
+    ("swap_nyz_array", "swap_nyz"),
+    ("swap_nzy_array", "swap_nzy"),
+])
+def test_vector_swaps(batch, single):
+    vectors = extra_math.parse_dict_vectors(ENTITIES, "registrationPoint", extra_math.PIVOT_VECTOR)
+    swapped = getattr(extra_math, batch)(vectors)
+    expected = [tuple(getattr(extra_math, single)(vector)) for vector in vectors.tolist()]
+    assert numpy.allclose(swapped, expected)
+
+
+@pytest.mark.parametrize("batch, single", [
+    ("quat_swap_nyz_array", "quat_swap_nyz"),
+    ("quat_swap_nzy_array", "quat_swap_nzy"),
+])
+def test_quaternion_swaps(batch, single):
+    quaternions = extra_math.parse_dict_quaternions(ENTITIES, "rotation")
+    swapped = getattr(extra_math, batch)(quaternions)
+    for row, quaternion in zip(swapped.tolist(), quaternions.tolist()):
+        expected = getattr(extra_math, single)(quaternion)
+        # q and -q are the same rotation
+        assert numpy.allclose(row, tuple(expected)) or numpy.allclose(row, tuple(-expected))
@@ -0,0 +1,68 @@
+from metaverse_tools.files.hifi_json.manifest import ExportManifest, read_scene_entities
+from metaverse_tools.files.hifi_json.stream import HifiJSONStreamWriter
+
+OPTIONS = {"compact": True}
+SIGNATURE = {"type": "MESH", "transform": [1, 0, 0, 0], "parent": None, "model": "a", "mesh": "abc"}
+
+
+def test_save_and_load(tmp_path):
+    filepath = str(tmp_path / "scene.hifi.json")
+    manifest = ExportManifest(filepath, OPTIONS)
+    manifest.record("a", SIGNATURE, {"id": "{a}", "modelURL": "file:///a.fbx"})
+    manifest.record("empty", SIGNATURE, None)
+    manifest.scene_file = "scene.hifi.json.gz"
+    manifest.save()
+
+    loaded = ExportManifest.load(filepath)
+
+    assert loaded.is_unchanged("a", SIGNATURE, OPTIONS)
+    assert not loaded.is_unchanged("a", dict(SIGNATURE, mesh="def"), OPTIONS)
+    assert not loaded.is_unchanged("a", SIGNATURE, {"compact": False})
+    assert not loaded.is_unchanged("b", SIGNATURE, OPTIONS)
+    assert loaded.entity_id("a") == "{a}"
+    assert loaded.model_url("a") == "file:///a.fbx"
+    assert loaded.entity_ids() == {"{a}"}
+    assert loaded.scene_filepath() == filepath + ".gz"
+
+
+def test_scene_file_of_earlier_version(tmp_path):
+    filepath = str(tmp_path / "scene.hifi.json")
+    with open(filepath + ".manifest.json", "w") as file:
+        file.write('{"Version": 1, "Options": null, "Objects": {"a": {"signature": {}, "id": "{a}", "modelURL": null}}}')
+
+    loaded = ExportManifest.load(filepath)
+
+    assert loaded.objects == {}
+    assert loaded.scene_filepath() is None
+
+
+def test_load_missing_or_broken(tmp_path):
+    filepath = str(tmp_path / "scene.hifi.json")
+
+    assert ExportManifest.load(filepath).objects == {}
+
+    with open(filepath + ".manifest.json", "w") as file:
+        file.write('{"Version": 1, "Objects": {"a"')
+
+    assert ExportManifest.load(filepath).objects == {}
+
+
+def test_read_scene_entities(tmp_path):
+    filepath = str(tmp_path / "scene.hifi.json")
+    writer = HifiJSONStreamWriter(filepath, 84, use_gzip=True)
+    for name in ("a", "b", "c"):
+        writer.write({"id": "{" + name + "}", "name": name})
+    writer.write({"name": "no id"})
+    writer.close()
+
+    assert set(read_scene_entities(writer.filepath)) == {"{a}", "{b}", "{c}"}
+    assert read_scene_entities(writer.filepath, {"{b}"}) == {"{b}": {"id": "{b}", "name": "b"}}
+    assert read_scene_entities(filepath) == {}
+
+
+def test_read_broken_scene_entities(tmp_path):
+    filepath = str(tmp_path / "scene.hifi.json")
+    with open(filepath, "w") as file:
+        file.write('{"Version": 84, "Entities": [{"id": "{a}"}, {"id": ')
+
+    assert read_scene_entities(filepath) == {}
@@ -0,0 +1,34 @@
+import pytest
+
+from metaverse_tools.hifi_world.palette import quantize_color
+
+
+@pytest.mark.parametrize("buckets", [1, 2, 3, 16, 255, 256])
+def test_bucket_centers(buckets):
+    size = 256 / buckets
+    centers = {quantize_color((channel,), buckets)[0] for channel in range(256)}
+
+    assert len(centers) == buckets
+    assert all(0 <= center <= 255 for center in centers)
+    for channel in range(256):
+        center = quantize_color((channel,), buckets)[0]
+        assert abs(center - channel) <= size / 2 + 1
+
+
+def test_similar_colors_share_a_bucket():
+    assert quantize_color((0, 128, 255), 16) == (8, 136, 248)
+    assert quantize_color((15, 143, 240), 16) == (8, 136, 248)
+    assert quantize_color((16, 127, 239), 16) != (8, 136, 248)
+
+
+def test_out_of_range_channels_are_clamped():
+    assert quantize_color((-20, 300, 256), 16) == (8, 248, 248)
+
+
+def test_single_bucket():
+    assert quantize_color((0, 100, 255), 1) == (128, 128, 128)
+
+
+def test_full_resolution_keeps_colors():
+    for channel in range(256):
+        assert quantize_color((channel, channel, channel), 256) == (channel, channel, channel)
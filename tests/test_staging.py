@@ -0,0 +1,109 @@
+import os
+
+from metaverse_tools.utils.staging import ExportStaging, JOURNAL_FILENAME
+
+OPTIONS = {"compact": False, "gzip": True}
+
+
+def stage_file(staging, filename, content):
+    with open(staging.filepath(filename), "w") as file:
+        file.write(content)
+
+
+def test_publish(tmp_path):
+    directory = str(tmp_path)
+    staging = ExportStaging(directory, "scene", OPTIONS)
+    assert not staging.resumed
+
+    os.makedirs(staging.filepath("models"))
+    stage_file(staging, os.path.join("models", "a.fbx"), "a")
+    stage_file(staging, "scene.json", "scene")
+    staging.complete("a", {"file": "models/a.fbx"})
+
+    assert not os.path.exists(os.path.join(directory, "scene.json"))
+
+    staging.publish(last=("scene.json",))
+
+    assert not os.path.exists(staging.path)
+    assert sorted(os.listdir(directory)) == ["models", "scene.json"]
+    with open(os.path.join(directory, "models", "a.fbx")) as file:
+        assert file.read() == "a"
+
+
+def test_resume_after_partial_run(tmp_path):
+    directory = str(tmp_path)
+    staging = ExportStaging(directory, "scene", OPTIONS)
+    stage_file(staging, "a.fbx", "a")
+    staging.complete("a", {"file": "a.fbx"})
+    # The export fails before b is journaled, leaving a half written file behind
+    stage_file(staging, "b.fbx", "partial")
+    staging.close()
+
+    resumed = ExportStaging(directory, "scene", OPTIONS)
+
+    assert resumed.resumed
+    assert resumed.completed("a") == {"file": "a.fbx"}
+    assert resumed.completed("b") is None
+    assert resumed.has_file("a.fbx")
+
+    stage_file(resumed, "b.fbx", "b")
+    resumed.complete("b", {"file": "b.fbx"})
+    resumed.publish()
+
+    for name in ("a", "b"):
+        with open(os.path.join(directory, name + ".fbx")) as file:
+            assert file.read() == name
+    assert not os.path.exists(os.path.join(directory, JOURNAL_FILENAME))
+
+
+def test_resume_skips_cut_off_journal_line(tmp_path):
+    directory = str(tmp_path)
+    staging = ExportStaging(directory, "scene", OPTIONS)
+    staging.complete("a", {"file": "a.fbx"})
+    staging.journal.write('{"key": "b", "entr')
+    staging.close()
+
+    resumed = ExportStaging(directory, "scene", OPTIONS)
+
+    assert resumed.resumed
+    assert resumed.completed("a") == {"file": "a.fbx"}
+    assert resumed.completed("b") is None
+
+
+def test_different_options_discard_staging(tmp_path):
+    directory = str(tmp_path)
+    staging = ExportStaging(directory, "scene", OPTIONS)
+    stage_file(staging, "a.fbx", "a")
+    staging.complete("a", {"file": "a.fbx"})
+    staging.close()
+
+    restarted = ExportStaging(directory, "scene", dict(OPTIONS, gzip=False))
+
+    assert not restarted.resumed
+    assert restarted.completed("a") is None
+    assert not restarted.has_file("a.fbx")
+
+
+def test_resume_disabled(tmp_path):
+    directory = str(tmp_path)
+    staging = ExportStaging(directory, "scene", OPTIONS)
+    staging.complete("a", {"file": "a.fbx"})
+    staging.close()
+
+    restarted = ExportStaging(directory, "scene", OPTIONS, resume=False)
+
+    assert not restarted.resumed
+    assert restarted.completed("a") is None
+
+
+def test_published_files_count_as_done(tmp_path):
+    directory = str(tmp_path)
+    with open(os.path.join(directory, "a.fbx"), "w") as file:
+        file.write("a")
+
+    staging = ExportStaging(directory, "scene", OPTIONS)
+
+    assert staging.has_file("a.fbx")
+    assert not staging.has_file("b.fbx")
+    staging.close()
+    staging.clear()
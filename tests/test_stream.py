@@ -0,0 +1,98 @@
+import gzip
+
+import pytest
+
+from metaverse_tools.files.hifi_json.stream import HifiJSONStreamReader, HifiJSONStreamWriter, stream_filepath
+
+ENTITIES = [
+    {"id": "{a}", "type": "Box", "position": {"x": 1.5, "y": -2, "z": 3e-05}, "name": "Bõx \"quoted\""},
+    {"id": "{b}", "type": "Model", "modelURL": "file:///models/b.fbx", "userData": "{\"nested\": [1, 2]}"},
+    {"id": "{c}", "type": "Sphere", "parentID": "{a}", "dimensions": {"x": 0.1, "y": 0.1, "z": 123456789}},
+]
+
+
+def write_scene(filepath, entities, **options):
+    writer = HifiJSONStreamWriter(filepath, 84, **options)
+    for entity in entities:
+        writer.write(entity)
+    writer.close()
+    return writer.filepath
+
+
+def read_scene(filepath, chunk_size=7):
+    reader = HifiJSONStreamReader(filepath, chunk_size)
+    entities = list(reader.entities())
+    progress = reader.progress
+    reader.close()
+    return reader, entities, progress
+
+
+@pytest.mark.parametrize("compact", [False, True])
+@pytest.mark.parametrize("use_gzip", [False, True])
+def test_round_trip(tmp_path, compact, use_gzip):
+    filepath = write_scene(str(tmp_path / "scene.json"), ENTITIES, compact=compact, use_gzip=use_gzip)
+
+    reader, entities, progress = read_scene(filepath)
+
+    assert entities == ENTITIES
+    assert reader.header == {"Version": 84}
+    assert reader.count == len(ENTITIES)
+    assert progress == 1.0
+
+
+@pytest.mark.parametrize("compact", [False, True])
+def test_round_trip_without_entities(tmp_path, compact):
+    filepath = write_scene(str(tmp_path / "scene.json"), [], compact=compact)
+
+    reader, entities, progress = read_scene(filepath)
+
+    assert entities == []
+    assert reader.header == {"Version": 84}
+
+
+def test_gzip_extension(tmp_path):
+    filepath = str(tmp_path / "scene.json")
+
+    assert stream_filepath(filepath) == filepath
+    assert stream_filepath(filepath, use_gzip=True) == filepath + ".gz"
+    assert stream_filepath(filepath + ".gz", use_gzip=True) == filepath + ".gz"
+
+    written = write_scene(filepath, ENTITIES, use_gzip=True)
+    assert written == filepath + ".gz"
+    with open(written, "rb") as file:
+        assert file.read(2) == b'\x1f\x8b'
+
+
+def test_gzip_detected_by_header(tmp_path):
+    filepath = str(tmp_path / "scene.json")
+    with gzip.open(filepath, "wt", encoding="utf-8") as file:
+        file.write('{"Entities": [{"id": "{a}"}], "Version": 84, "Paths": {"/": "/0,0,0"}}')
+
+    reader, entities, progress = read_scene(filepath)
+
+    assert entities == [{"id": "{a}"}]
+    assert reader.header == {"Version": 84, "Paths": {"/": "/0,0,0"}}
+
+
+def test_numbers_split_between_chunks(tmp_path):
+    filepath = str(tmp_path / "scene.json")
+    with open(filepath, "w", encoding="utf-8") as file:
+        file.write('{"Version": 84, "Entities": [1234567890, 0.000123456789, 42]}')
+
+    for chunk_size in range(1, 12):
+        reader, entities, progress = read_scene(filepath, chunk_size)
+        assert entities == [1234567890, 0.000123456789, 42]
+
+
+def test_truncated_file(tmp_path):
+    filepath = str(tmp_path / "scene.json")
+    with open(filepath, "w", encoding="utf-8") as file:
+        file.write('{"Version": 84, "Entities": [{"id": "{a}"}, {"id": "{b')
+
+    reader = HifiJSONStreamReader(filepath, 7)
+    entities = reader.entities()
+
+    assert next(entities) == {"id": "{a}"}
+    with pytest.raises(ValueError):
+        next(entities)
+    reader.close()